@@ -119,6 +119,12 @@ class CodeAnalyzer(object):
         for expr in self._translator.translate(reil_instruction):
             self._solver.add(expr)
 
+    def add_instructions(self, reil_instructions):
+        """Add a list of instructions for analysis.
+        """
+        for expr in self._translator.translate_instructions(reil_instructions):
+            self._solver.add(expr)
+
     def add_constraint(self, constraint):
         """Add constraint to the current set of formulas.
         """
@@ -44,6 +44,9 @@ from barf.analysis.gadgets import TypedGadget
 from barf.core.reil import ReilEmptyOperand
 from barf.core.reil import ReilImmediateOperand
 from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.container import ReilSequence
+from barf.core.reil.emulator.vector import ReilVectorEmulator
+from barf.core.reil.emulator.vector import vector_emulator_available
 from barf.utils.utils import extract_value
 
 
@@ -52,11 +55,21 @@ class GadgetClassifier(object):
     """Gadget Classifier.
     """
 
-    def __init__(self, ir_emulator, architecture_info):
+    def __init__(self, ir_emulator, architecture_info, optimizer=None, vectorize=True):
 
         # An instance of a REIL emulator
         self._ir_emulator = ir_emulator
 
+        # A multi-lane REIL emulator (if NumPy is available). All random
+        # contexts of a gadget are emulated at once.
+        if vectorize and vector_emulator_available():
+            self._vector_emulator = ReilVectorEmulator(architecture_info)
+        else:
+            self._vector_emulator = None
+
+        # An (optional) REIL optimizer.
+        self._optimizer = optimizer
+
         # Classifiers ordered by gadgets type.
         self._classifiers = {
             GadgetType.NoOperation:     self._classify_no_operation,
@@ -106,9 +119,29 @@ class GadgetClassifier(object):
         """
         typed_gadgets = []
 
+        # Collect REIL instructions of the gadgets (they are compiled
+        # once and reused by every classifier).
+        # NOTE: Do not process chaining instruction.
+        ir_instrs = [ir_instr for asm_instr in gadget.instrs[:-1] for ir_instr in asm_instr.ir_instrs]
+
+        if self._optimizer:
+            ir_instrs = self._optimizer.optimize(ir_instrs)
+
+        instrs = ReilSequence()
+
+        for ir_instr in ir_instrs:
+            instrs.append(ir_instr)
+
+        # Emulate the gadget once for all classifiers.
+        if self._vector_emulator:
+            executions = self._emulate_vector(instrs, self._emu_iters)
+
         for g_type, g_classifier in self._classifiers.items():
             try:
-                typed_gadgets += self._classify(gadget, g_classifier, g_type, self._emu_iters)
+                if self._vector_emulator:
+                    typed_gadgets += self._classify_vector(gadget, executions, g_classifier, g_type)
+                else:
+                    typed_gadgets += self._classify(gadget, instrs, g_classifier, g_type, self._emu_iters)
             except:
                 import traceback
 
@@ -537,13 +570,9 @@ class GadgetClassifier(object):
 
     # Auxiliary functions
     # ======================================================================== #
-    def _classify(self, gadget, classifier, gadget_type, iters):
+    def _classify(self, gadget, instrs, classifier, gadget_type, iters):
         """Classify gadgets.
         """
-        # Collect REIL instructions of the gadgets.
-	# NOTE: Do not process chaining instruction.
-        instrs = [ir_instr for asm_instr in gadget.instrs[:-1] for ir_instr in asm_instr.ir_instrs]
-
         # Repeat classification.
         results = []
 
@@ -551,6 +580,9 @@ class GadgetClassifier(object):
             # Reset emulator.
             self._ir_emulator.reset()
 
+            # Journal memory writes (see ReilMemoryEx.try_read_prev).
+            self._ir_emulator.memory.checkpoint()
+
             # Generate random values for registers.
             regs_initial = self._init_regs_random()
 
@@ -575,24 +607,87 @@ class GadgetClassifier(object):
             regs_written = self._ir_emulator.written_registers
             regs_read = self._ir_emulator.read_registers
 
-            # Compute modified registers.
-            mod_regs = self._compute_mod_regs(
-                regs_initial_full,
-                regs_final_full
-            )
+            # Save results.
+            results += [self._match(classifier, regs_initial_full, regs_final_full, mem_final,
+                                    regs_written, regs_read)]
+
+        return self._classify_results(gadget, results, gadget_type)
+
+    def _classify_vector(self, gadget, executions, classifier, gadget_type):
+        """Classify gadgets using the executions computed by the vector
+        emulator.
+        """
+        results = []
+
+        for execution in executions:
+            if execution is None:
+                results += [([], [])]
+
+                continue
 
-            # Classified gadgets based on initial and final context.
-            matches = classifier(
-                regs_initial_full,
-                regs_final_full,
+            results += [self._match(classifier, *execution)]
+
+        return self._classify_results(gadget, results, gadget_type)
+
+    def _emulate_vector(self, instrs, iters):
+        """Emulate gadgets for iters random contexts at once. Return, for
+        each context, a tuple (initial context, final context, memory,
+        written registers, read registers), or None if the emulation
+        failed.
+        """
+        regs_initial = [self._init_regs_random() for _ in range(iters)]
+
+        try:
+            results = self._vector_emulator.execute_lite(instrs, regs_initial)
+        except:
+            # Catch emulator exceptions like invalid instructions, etc.
+            return [None] * iters
+
+        regs_written = self._vector_emulator.written_registers
+        regs_read = self._vector_emulator.read_registers
+
+        executions = []
+
+        for regs, result in zip(regs_initial, results):
+            if result is None:
+                executions += [None]
+
+                continue
+
+            regs_final, mem_final = result
+
+            executions += [(
+                self._compute_full_context(regs),
+                self._compute_full_context(regs_final),
                 mem_final,
                 regs_written,
                 regs_read
-            )
+            )]
 
-            # Save results.
-            results += [(matches, mod_regs)]
+        return executions
+
+    def _match(self, classifier, regs_initial_full, regs_final_full, mem_final, regs_written, regs_read):
+        """Run a classifier over the result of an emulation. Return the
+        matches and the modified registers.
+        """
+        # Compute modified registers.
+        mod_regs = self._compute_mod_regs(
+            regs_initial_full,
+            regs_final_full
+        )
+
+        # Classified gadgets based on initial and final context.
+        matches = classifier(
+            regs_initial_full,
+            regs_final_full,
+            mem_final,
+            regs_written,
+            regs_read
+        )
+
+        return matches, mod_regs
 
+    def _classify_results(self, gadget, results, gadget_type):
         # Analyze results and compute candidate gadgets.
         candidates, mod_regs = self._analyze_execution_results(results)
 
@@ -102,8 +102,7 @@ class GadgetVerifier(object):
 
 	# NOTE: Do not process chaining instruction.
         for asm_instr in gadget.instrs[:-1]:
-            for reil_instr in asm_instr.ir_instrs:
-                self.analyzer.add_instruction(reil_instr)
+            self.analyzer.add_instructions(asm_instr.ir_instrs)
 
         # Generate constraints for the gadgets type.
         constrs = self._constraints_generators[gadget.type](gadget)
@@ -28,3 +28,4 @@ from .basicblock import BasicBlock
 from .controlflowgraph import CFGRecoverer
 from .controlflowgraph import ControlFlowGraph
 from .controlflowgraph import RecursiveDescent
+from .flagliveness import FlagLivenessAnalysis
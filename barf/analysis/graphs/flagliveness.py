@@ -0,0 +1,333 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+This module contains a flag liveness analysis.
+
+Most native instructions update several flags, but only a few of those
+values are ever read (typically by a conditional jump). The analysis
+computes, for each native instruction of a basic block or control-flow
+graph, which of the flags it writes are live (read afterwards) and which
+are dead (overwritten before being read). The REIL code that computes
+dead flags can then be removed.
+
+The analysis is conservative: all flags are considered live at the exit
+of a basic block whose successors are unknown (returns, indirect jumps,
+jumps to other functions) and call instructions are considered to read
+all flags.
+
+"""
+from __future__ import absolute_import
+
+from barf.core.reil import ReilImmediateOperand
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.builder import ReilBuilder
+from barf.core.reil.optimizer import ReilDeadTemporaryElimination
+from barf.core.reil.optimizer import ReilOptimizer
+
+
+class FlagLivenessAnalysis(object):
+
+    """Flag liveness analysis over basic blocks and control-flow graphs.
+    """
+
+    def __init__(self, arch_info):
+        # Architecture information.
+        self.__arch = arch_info
+
+        # Flags (aliases of the flags register).
+        self.__flags = frozenset(arch_info.registers_flags)
+
+        # Flags register.
+        self.__flags_reg = arch_info.flags_register()
+
+        # Optimizer used to remove the computation of dead flags.
+        self.__optimizer = ReilOptimizer(arch_info, passes=[ReilDeadTemporaryElimination()])
+
+    @property
+    def flags(self):
+        return self.__flags
+
+    def analyze_instructions(self, reil_instrs_list, live_out=None):
+        """Analyze a straight-line list of native instructions, given as
+        a list of REIL translations. Return a list with, for each
+        instruction, a dictionary that maps each flag it writes to True
+        (live) or False (dead). If live_out is None, all flags are
+        considered live at the end of the list.
+        """
+        live = set(self.__flags if live_out is None else live_out)
+
+        result = []
+
+        for reil_instrs in reversed(reil_instrs_list):
+            reads, may_writes, must_writes = self.__flags_accessed(reil_instrs)
+
+            result.append(dict((flag, flag in live) for flag in may_writes))
+
+            live = reads | (live - must_writes)
+
+        result.reverse()
+
+        return result
+
+    def analyze_basic_block(self, bb, live_out=None):
+        """Analyze a basic block. Return a dictionary that maps the
+        address of each instruction to the liveness of the flags it
+        writes (see analyze_instructions).
+        """
+        return dict(zip([asm_instr.address for asm_instr in bb.instrs],
+                        self.analyze_instructions(self.__reil_instrs_list(bb), live_out)))
+
+    def analyze_cfg(self, cfg):
+        """Analyze a control-flow graph. Return a dictionary that maps the
+        address of each instruction to the liveness of the flags it
+        writes (see analyze_instructions).
+        """
+        live_out = self.__cfg_live_out(cfg)
+
+        result = {}
+
+        for bb in cfg.basic_blocks:
+            result.update(self.analyze_basic_block(bb, live_out[bb.address]))
+
+        return result
+
+    def live_in(self, reil_instrs_list, live_out=None):
+        """Return the set of flags that are live at the beginning of a
+        straight-line list of native instructions.
+        """
+        live = set(self.__flags if live_out is None else live_out)
+
+        for reil_instrs in reversed(reil_instrs_list):
+            reads, _, must_writes = self.__flags_accessed(reil_instrs)
+
+            live = reads | (live - must_writes)
+
+        return live
+
+    def remove_dead_flags(self, reil_instrs, dead):
+        """Remove from the translation of a native instruction the update
+        of the given flags and the code that computes them. Return a new
+        list of REIL instructions.
+        """
+        # Flags read after each instruction. If the code has internal
+        # jumps, any read counts.
+        read_after = []
+        reads = set()
+
+        for instr in reversed(reil_instrs):
+            read_after.append(set(reads))
+            reads |= self.__flags_read(instr)
+
+        read_after.reverse()
+
+        if self.__has_internal_jumps(reil_instrs):
+            read_after = [reads] * len(reil_instrs)
+
+        instrs = []
+        removed = False
+
+        for index, instr in enumerate(reil_instrs):
+            dst = self.__destination(instr)
+
+            if dst in dead and dst not in read_after[index]:
+                nop = ReilBuilder.gen_nop()
+                nop.address = instr.address
+
+                instrs.append(nop)
+
+                removed = True
+
+                continue
+
+            instrs.append(instr)
+
+        if not removed:
+            return list(reil_instrs)
+
+        return self.__optimizer.optimize(instrs)
+
+    def optimize_instructions(self, reil_instrs_list, live_out=None):
+        """Remove dead flag updates from a straight-line list of native
+        instructions, given as a list of REIL translations. Return a new
+        list.
+        """
+        liveness = self.analyze_instructions(reil_instrs_list, live_out)
+
+        return [self.remove_dead_flags(reil_instrs, self.__dead(flags))
+                for reil_instrs, flags in zip(reil_instrs_list, liveness)]
+
+    def optimize_basic_block(self, bb, live_out=None):
+        """Remove dead flag updates from the translation of the
+        instructions of a basic block (in place).
+        """
+        liveness = self.analyze_basic_block(bb, live_out)
+
+        for asm_instr in bb.instrs:
+            dead = self.__dead(liveness[asm_instr.address])
+
+            if dead:
+                asm_instr.ir_instrs = self.remove_dead_flags(asm_instr.ir_instrs, dead)
+
+    def optimize_cfg(self, cfg):
+        """Remove dead flag updates from the translation of the
+        instructions of a control-flow graph (in place).
+        """
+        live_out = self.__cfg_live_out(cfg)
+
+        for bb in cfg.basic_blocks:
+            self.optimize_basic_block(bb, live_out[bb.address])
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __cfg_live_out(self, cfg):
+        """Compute the flags that are live at the end of each basic block
+        of a control-flow graph.
+        """
+        bbs = dict((bb.address, bb) for bb in cfg.basic_blocks)
+        reil = dict((bb.address, self.__reil_instrs_list(bb)) for bb in cfg.basic_blocks)
+
+        live_in = dict((address, set()) for address in bbs)
+        live_out = dict((address, set()) for address in bbs)
+
+        changed = True
+
+        while changed:
+            changed = False
+
+            for address in sorted(bbs, reverse=True):
+                bb = bbs[address]
+                succs = [target for target, _ in bb.branches]
+
+                if bb.is_exit or not succs or any(target not in bbs for target in succs):
+                    out = set(self.__flags)
+                else:
+                    out = set()
+
+                    for target in succs:
+                        out |= live_in[target]
+
+                inp = self.live_in(reil[address], out)
+
+                if out != live_out[address] or inp != live_in[address]:
+                    live_out[address], live_in[address] = out, inp
+                    changed = True
+
+        return live_out
+
+    def __reil_instrs_list(self, bb):
+        reil_instrs_list = []
+
+        for asm_instr in bb.instrs:
+            reil_instrs = list(asm_instr.ir_instrs)
+
+            # Callees may read the flags.
+            if self.__arch.instr_is_call(asm_instr):
+                reil_instrs = [self.__read_all_flags()] + reil_instrs
+
+            reil_instrs_list.append(reil_instrs)
+
+        return reil_instrs_list
+
+    def __read_all_flags(self):
+        size = self.__arch.registers_size[self.__flags_reg]
+
+        return ReilBuilder.gen_str(ReilRegisterOperand(self.__flags_reg, size),
+                                   ReilRegisterOperand("t_flags", size))
+
+    def __flags_accessed(self, reil_instrs):
+        """Return the flags a native instruction reads, may write and
+        must write.
+        """
+        reads, writes = set(), set()
+
+        for instr in reil_instrs:
+            reads |= self.__flags_read(instr)
+
+            dst = self.__destination(instr)
+
+            if dst in self.__flags:
+                writes.add(dst)
+            elif dst is not None and self.__is_flags_register(dst):
+                writes |= self.__flags
+
+        # Code with internal jumps might skip the updates.
+        must_writes = set() if self.__has_internal_jumps(reil_instrs) else set(writes)
+
+        return reads, writes, must_writes
+
+    def __flags_read(self, instr):
+        if instr.mnemonic in (ReilMnemonic.STM, ReilMnemonic.JCC):
+            operands = instr.operands
+        else:
+            operands = instr.operands[:2]
+
+        reads = set()
+
+        for oprnd in operands:
+            if not isinstance(oprnd, ReilRegisterOperand):
+                continue
+
+            if oprnd.name in self.__flags:
+                reads.add(oprnd.name)
+            elif self.__is_flags_register(oprnd.name):
+                reads |= self.__flags
+
+        return reads
+
+    def __destination(self, instr):
+        if instr.mnemonic in (ReilMnemonic.STM, ReilMnemonic.JCC, ReilMnemonic.NOP, ReilMnemonic.UNKN):
+            return None
+
+        oprnd = instr.operands[2]
+
+        return oprnd.name if isinstance(oprnd, ReilRegisterOperand) else None
+
+    def __is_flags_register(self, name):
+        if name == self.__flags_reg:
+            return True
+
+        alias = self.__arch.alias_mapper.get(name)
+
+        return alias is not None and alias[0] == self.__flags_reg and name not in self.__flags
+
+    def __has_internal_jumps(self, reil_instrs):
+        addresses = set(instr.address for instr in reil_instrs)
+
+        for index, instr in enumerate(reil_instrs):
+            if instr.mnemonic != ReilMnemonic.JCC:
+                continue
+
+            target = instr.operands[2]
+
+            if index != len(reil_instrs) - 1 or \
+               (isinstance(target, ReilImmediateOperand) and target.immediate in addresses):
+                return True
+
+        return False
+
+    @staticmethod
+    def __dead(flags):
+        return set(flag for flag, live in flags.items() if not live)
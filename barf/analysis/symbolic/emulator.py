@@ -24,7 +24,6 @@
 
 from __future__ import absolute_import
 
-import copy
 import logging
 import sys
 
@@ -342,7 +341,7 @@ class ReilSymbolicEmulator(object):
             if is_sat == 'sat':
                 logger.debug("[+] Enqueueing target address ({:s}) : {:#08x}:{:02x}".format(taken_str, target_addr >> 8, target_addr & 0xff))
 
-                execution_state.put((target_addr, trace_current, copy.deepcopy(self.__cpu.registers), copy.deepcopy(self.__cpu.memory)))
+                execution_state.put((target_addr, trace_current, self.__cpu.snapshot(), self.__memory.snapshot()))
 
     def __process_branch_cond(self, instr, avoid, initial_state, execution_state, trace_current, not_taken_addr):
         # Direct branch (for example: JCC cond, empty, 0x12345678:00)
@@ -497,8 +496,8 @@ class ReilSymbolicEmulator(object):
                         logger.debug("[+] Popping execution state @ {:#x} (INTRA)".format(ip))
 
                     # Setup cpu and memory.
-                    self.__cpu.registers = registers
-                    self.__cpu.memory = memory
+                    self.__cpu.restore(registers)
+                    self.__memory.restore(memory)
 
                     logger.debug("[+] Next address: {:#08x}:{:02x}".format(ip >> 8, ip & 0xff))
                 else:
@@ -661,8 +660,8 @@ class ReilSymbolicEmulator(object):
                         logger.debug("[+] Popping execution state @ {:#x} (INTRA)".format(ip))
 
                     # Setup cpu and memory.
-                    self.__cpu.registers = registers
-                    self.__cpu.memory = memory
+                    self.__cpu.restore(registers)
+                    self.__memory.restore(memory)
 
                     logger.debug("[+] Next address: {:#08x}:{:02x}".format(ip >> 8, ip & 0xff))
                 else:
@@ -179,6 +179,9 @@ class ArmArchitectureInformation(ArchitectureInformation):
         ("vf", 1),
     ]
 
+    # Register tables by architecture mode.
+    _tables = {}
+
     def __init__(self, architecture_mode):
         super(ArmArchitectureInformation, self).__init__()
 
@@ -193,9 +196,21 @@ class ArmArchitectureInformation(ArchitectureInformation):
 
         self._alias_mapper = {}
 
-        self._load_registers()
+        # The register tables are built once per mode and shared.
+        tables = self._tables.get(architecture_mode)
+
+        if tables is None:
+            self._load_registers()
+
+            self._load_alias_mapper()
+
+            tables = (self._registers_all, self._registers_gp_all, self._registers_gp_base,
+                      self._registers_flags, self._registers_size, self._alias_mapper)
+
+            ArmArchitectureInformation._tables[architecture_mode] = tables
 
-        self._load_alias_mapper()
+        self._registers_all, self._registers_gp_all, self._registers_gp_base, \
+            self._registers_flags, self._registers_size, self._alias_mapper = tables
 
     @property
     def architecture_mode(self):
@@ -27,29 +27,80 @@ from __future__ import print_function
 
 import codecs
 import logging
-import pefile
+import traceback
 
+from collections import Counter
+
+from barf.analysis.graphs.flagliveness import FlagLivenessAnalysis
 from barf.arch import ARCH_ARM_MODE_ARM
 from barf.arch import ARCH_ARM_MODE_THUMB
 from barf.arch import ARCH_X86_MODE_32
 from barf.arch import ARCH_X86_MODE_64
 from barf.arch.arm import ArmArchitectureInformation
+from barf.arch.disassembler import DisassemblerError
 from barf.arch.x86 import X86ArchitectureInformation
-from barf.arch.x86.translator import X86Translator
+from barf.core.binary import load_image
+from barf.core.reil import ReilImmediateOperand
 from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.builder import ReilBuilder
 from barf.core.reil.container import ReilContainer
 from barf.core.reil.container import ReilContainerInvalidAddressError
 from barf.core.reil.container import ReilSequence
+from barf.core.reil.emulator.jit import ReilBlockCompiler
+from barf.core.reil.emulator.jit import SEQUENCE_BRANCH
+from barf.core.reil.emulator.jit import SEQUENCE_INVALID
 from barf.core.reil.helpers import split_address
 from barf.core.reil.helpers import to_asm_address
 from barf.core.reil.helpers import to_reil_address
 from barf.utils.utils import ExecutionCache
 from barf.utils.utils import InvalidAddressError
+from barf.utils.utils import shared_translation_cache
 
-from elftools.elf.elffile import ELFFile
 
 logger = logging.getLogger(__name__)
 
+# Number of times a block has to be reached before it is compiled.
+JIT_THRESHOLD = 8
+
+# Maximum number of native instructions in a compiled block.
+JIT_MAX_BLOCK_SIZE = 64
+
+# Size of the edge coverage map (in entries, a power of two).
+COVERAGE_MAP_SIZE = 0x10000
+
+
+# Outcomes of a fuzzing run.
+FUZZ_STATUS_END = "end"
+FUZZ_STATUS_CRASH = "crash"
+FUZZ_STATUS_TIMEOUT = "timeout"
+
+# Default maximum number of native instructions of a fuzzing run.
+FUZZ_MAX_INSTRS = 100000
+
+
+def _hit_count_buckets():
+    # Bit of the AFL hit count bucket of each count (up to 255): 1, 2, 3,
+    # 4-7, 8-15, 16-31, 32-127 and 128+.
+    limits = [(1, 0x01), (2, 0x02), (3, 0x04), (7, 0x08), (15, 0x10), (31, 0x20), (127, 0x40), (255, 0x80)]
+
+    buckets = bytearray(256)
+
+    for count in range(1, 256):
+        buckets[count] = next(bit for limit, bit in limits if count <= limit)
+
+    return buckets
+
+
+# Hit count bucket of each count, indexed by count.
+_HIT_COUNT_BUCKETS = _hit_count_buckets()
+
+
+def coverage_location(address):
+    """Map the address of a branch target to a coverage map location.
+    """
+    return ((address * 0x9e3779b1) & 0xffffffff) >> 16 & (COVERAGE_MAP_SIZE - 1)
+
 
 class Syscall(Exception):
     pass
@@ -67,12 +118,16 @@ class InstructionNotImplemented(Exception):
 
 class Emulator(object):
 
-    def __init__(self, arch_info, ir_emulator, ir_translator, disassembler):
+    def __init__(self, arch_info, ir_emulator, ir_translator, disassembler, optimizer=None,
+                 skip_dead_flags=False, translation_cache=None):
         self.arch_info = arch_info
         self._arch_mode = self.arch_info.architecture_mode
         self.ir_emulator = ir_emulator
         self.ir_translator = ir_translator
         self.disassembler = disassembler
+        self.optimizer = optimizer
+        self.skip_dead_flags = skip_dead_flags
+        self.translation_cache = translation_cache if translation_cache is not None else shared_translation_cache
         self.ip = None
         self.sp = None
         self.ws = None
@@ -105,6 +160,29 @@ class Emulator(object):
 
         self.__instr_handler_post = None, None
 
+        # Whether an asm instruction handler was set (it disables the JIT).
+        self.__hooked = False
+
+        self.__block_compiler = ReilBlockCompiler(self.arch_info)
+
+        self.__flag_liveness = FlagLivenessAnalysis(self.arch_info)
+
+        # Execution statistics of the current emulation (None when disabled).
+        self.__stats = None
+
+        # Images mapped into memory (see load_binary).
+        self.__images = []
+
+        # Execution caches, by architecture mode and translation settings.
+        # They live as long as the emulator: entries are dropped when the
+        # memory pages they were built from are written.
+        self.__execution_caches = {}
+
+        # End address and hooked addresses the cached blocks were built for.
+        self.__blocks_context = None
+
+        self.ir_emulator.memory.watcher = self.__invalidate_code
+
         self.__set_default_handlers()
 
     def set_registers(self, registers):
@@ -117,17 +195,35 @@ class Emulator(object):
             for i, b in enumerate(bytearray(codecs.decode(value, 'hex'))):
                 self.ir_emulator.write_memory(addr + i, 1, b)
 
-    def add_reil_hook(self, func, param):
-        self.ir_emulator.set_instruction_post_handler(func, param)
+    def add_reil_hook(self, func, param, mnemonics=None, addresses=None):
+        return self.ir_emulator.add_hook(func, param, mnemonics=mnemonics, addresses=addresses)
 
     def add_asm_hook(self, func, param):
         self.__instr_handler_post = (func, param)
 
+        self.__hooked = True
+
     def __set_default_handlers(self):
         empty_fn, empty_param = lambda emu, instr, param: None, None
 
         self.__instr_handler_post = (empty_fn, empty_param)
 
+    def enable_stats(self):
+        """Start collecting execution statistics (see ReilEmulatorStats).
+        """
+        return self.ir_emulator.enable_stats()
+
+    def disable_stats(self):
+        """Stop collecting execution statistics.
+        """
+        self.ir_emulator.disable_stats()
+
+    @property
+    def stats(self):
+        """Return execution statistics (None if they are disabled).
+        """
+        return self.ir_emulator.stats
+
     def execute(self, asm_instr):
         """Execute an assembler instruction.
 
@@ -144,6 +240,9 @@ class Emulator(object):
         if self.arch_info.instr_is_syscall(asm_instr):
             raise Syscall()
 
+        if self.ir_emulator.stats:
+            self.ir_emulator.stats.asm_instrs[asm_instr.address] += 1
+
         # Process instruction and return next address instruction to execute.
         return self.__execute(asm_instr)
 
@@ -178,27 +277,77 @@ class Emulator(object):
         handler_fn_post(self, asm_instr, handler_param_post)
 
         # delete temporal registers
-        regs = self.ir_emulator.registers.keys()
-
-        for r in regs:
-            if r.startswith("t"):
-                del self.ir_emulator.registers[r]
+        self.ir_emulator.registers.reset_temporaries()
 
         return next_addr if next_addr else asm_instr.address + asm_instr.size
 
     def __translate(self, asm_instr):
-        reil_translator = X86Translator(self.arch_info.architecture_mode)
+        reil_instrs = None
+
+        if asm_instr.bytes:
+            entry = self.translation_cache.lookup(type(self.arch_info).__name__, self._arch_mode,
+                                                  asm_instr.address, asm_instr.bytes)
+
+            if entry:
+                _, reil_instrs = entry
+
+        if reil_instrs is None:
+            reil_instrs = self.ir_translator.translate(asm_instr)
+
+            if asm_instr.bytes:
+                self.translation_cache.add(type(self.arch_info).__name__, self._arch_mode,
+                                           asm_instr, reil_instrs)
 
         # Create ReilContainer
         instr_container = ReilContainer()
         instr_seq = ReilSequence()
-        for reil_instr in reil_translator.translate(asm_instr):
+        for reil_instr in reil_instrs:
             instr_seq.append(reil_instr)
         instr_container.add(instr_seq)
 
         return instr_container
 
-    def emulate(self, start_addr, end_addr, hooks, max_instrs, print_asm):
+    def emulate(self, start_addr, end_addr, hooks, max_instrs, print_asm, jit=False, coverage=None):
+        """Emulate native code from start_addr up to end_addr.
+
+        When *jit* is set, basic blocks that are executed often are compiled
+        into Python functions (see ReilBlockCompiler) and run as a whole.
+        Compiled blocks do not propagate taint nor call REIL instruction
+        hooks, therefore, the JIT is disabled when asm or REIL hooks were
+        added, when taint propagation is enabled or when print_asm is set.
+        If the emulator was created with skip_dead_flags, flag updates that
+        are overwritten within a compiled block are not computed.
+
+        Decoded and translated instructions (and compiled blocks) are kept
+        between calls. The memory pages they come from are watched and
+        writes to them drop the affected entries, so self-modifying code
+        is emulated correctly.
+
+        If statistics are enabled (see enable_stats), executed instructions
+        and translation cache lookups are recorded. Instructions of compiled
+        blocks are counted once per block execution.
+
+        If *coverage* is a dictionary, the hit counts of the edges between
+        branch destinations (targets and fallthroughs) are added to it,
+        indexed as in AFL by the coverage map location of both
+        destinations (see coverage_location).
+
+        Return the address where the emulation stopped.
+        """
+        self.__stats = self.ir_emulator.stats
+
+        if self.__stats:
+            self.__stats.start()
+
+            try:
+                return self.__emulate(start_addr, end_addr, hooks, max_instrs, print_asm, jit, coverage)
+            finally:
+                self.__stats.stop()
+                self.__stats = None
+        else:
+            return self.__emulate(start_addr, end_addr, hooks, max_instrs, print_asm, jit, coverage)
+
+    def __emulate(self, start_addr, end_addr, hooks, max_instrs, print_asm, jit, coverage):
         # Switch arch mode accordingly for ARM base on the start address.
         if isinstance(self.arch_info, ArmArchitectureInformation):
             if start_addr & 0x1 == 0x1:
@@ -209,11 +358,27 @@ class Emulator(object):
             else:
                 self._arch_mode = ARCH_ARM_MODE_ARM
 
-        execution_cache = ExecutionCache()
+        execution_cache = self.__get_execution_cache(end_addr, hooks)
+
+        registers = self.ir_emulator.registers
+        execute_sequence = self.ir_emulator.execute_sequence
+        ip = self.ip
+        stats = self.__stats
 
         next_addr = start_addr
         instr_count = 0
-        asm_instr = None
+
+        jit = jit and not print_asm and not self.__hooked and not self.ir_emulator.hooked
+        block_hits = {}
+        prev_location = 0
+
+        # Instructions (and blocks) are linked to the ones that follow them
+        # once these are known not to be hooked nor the end address. While
+        # links are followed, dispatching an instruction takes a dictionary
+        # lookup. Instructions are not followed when the JIT is enabled, as
+        # they have to reach blocks.
+        prev_entry = None
+        prev_block = None
 
         while next_addr != end_addr:
             if max_instrs and instr_count > max_instrs:
@@ -227,88 +392,285 @@ class Emulator(object):
 
                 fn(self.ir_emulator, param)
 
+                # Nothing is linked to a hooked address.
+                prev_entry = prev_block = None
+
                 # Compute next address after hook.
                 if skip:
                     if isinstance(self.arch_info, X86ArchitectureInformation):
                         # Pop return address from the stack.
-                        next_addr = self.ir_emulator.read_memory(self.ir_emulator.registers[self.sp], self.ws)
-                        self.ir_emulator.registers[self.sp] += self.ws
+                        next_addr = self.ir_emulator.read_memory(registers[self.sp], self.ws)
+                        registers[self.sp] += self.ws
 
                     if isinstance(self.arch_info, ArmArchitectureInformation):
                         # Load return address from the link register.
-                        next_addr = self.ir_emulator.registers["r14"]
+                        next_addr = registers["r14"]
 
-                logger.debug("Continuing @ {:#x}".format(next_addr))
+                    logger.debug("Continuing @ {:#x}".format(next_addr))
 
-            try:
-                # Retrieve next instruction from the execution cache.
-                asm_instr, reil_container = execution_cache.retrieve(next_addr)
-            except InvalidAddressError:
-                # Fetch the instruction.
-                encoding = self.__fetch_instr(next_addr)
+                    # The hook may return straight to the end address (or
+                    # to another hook).
+                    continue
 
-                # Decode it.
-                asm_instr = self.disassembler.disassemble(encoding, next_addr,
-                                                          architecture_mode=self._arch_mode)
+            # Execute compiled blocks, if there is one available.
+            if jit:
+                block = self.__get_block(execution_cache, block_hits, next_addr, end_addr, hooks)
 
-                # Translate it.
-                reil_container = self.__build_reil_container(asm_instr)
+                if block and prev_block:
+                    execution_cache.link_block(prev_block, next_addr, block)
 
-                # Add it to the execution cache.
-                execution_cache.add(next_addr, asm_instr, reil_container)
+                prev_block = None
 
-            # Update the instruction pointer.
-            self.__update_ip(asm_instr)
+                while block and (not max_instrs or instr_count + block[1] - 1 <= max_instrs):
+                    block_fn, block_size, fallthrough_addr, block_profile, _ = block
 
-            # Execute instruction.
-            if print_asm:
-                print("{:#x} {}".format(asm_instr.address, asm_instr))
+                    target_addr = block_fn(registers, self.ir_emulator.memory)
 
-            target_addr = self.__process_reil_container(reil_container, to_reil_address(next_addr))
+                    if stats:
+                        stats.asm_instrs.update(block_profile[0])
+                        stats.reil_instrs.update(block_profile[1])
 
-            # Execute post instruction handlers
-            handler_fn_post, handler_param_post = self.__instr_handler_post
-            handler_fn_post(self, asm_instr, handler_param_post)
+                    next_addr = to_asm_address(target_addr) if target_addr else fallthrough_addr
 
-            # Get next address to execute.
-            next_addr = to_asm_address(target_addr) if target_addr else asm_instr.address + asm_instr.size
+                    if coverage is not None and (target_addr or self.__is_branch(execution_cache.get(block_profile[0][-1]))):
+                        location = coverage_location(next_addr)
+                        edge = location ^ prev_location
+                        coverage[edge] = coverage.get(edge, 0) + 1
+                        prev_location = location >> 1
 
-            # Count instruction.
-            instr_count += 1
+                    instr_count += block_size
 
-    def __process_reil_container(self, container, ip):
-        next_addr = None
+                    prev_block = block
+                    block = block[-1].get(next_addr)
 
-        while ip:
-            # Fetch instruction.
+                if prev_block:
+                    prev_entry = None
+
+                    continue
+
+            entry = execution_cache.get(next_addr)
+
+            if entry is None:
+                entry = self.__fetch_and_translate(execution_cache, next_addr)
+            elif stats:
+                stats.cache_hits += 1
+
+            if prev_entry:
+                execution_cache.link(prev_entry, next_addr, entry)
+
+            while entry:
+                asm_instr = entry.instruction
+
+                if stats:
+                    stats.asm_instrs[next_addr] += 1
+
+                # Update the instruction pointer.
+                if entry.ip is not None:
+                    registers[ip] = entry.ip
+
+                # Execute instruction.
+                if print_asm:
+                    print("{:#x} {}".format(asm_instr.address, asm_instr))
+
+                target_addr = execute_sequence(entry.sequence)
+
+                # Delete temporal registers.
+                registers.reset_temporaries()
+
+                # Execute post instruction handlers
+                if self.__hooked:
+                    handler_fn_post, handler_param_post = self.__instr_handler_post
+                    handler_fn_post(self, asm_instr, handler_param_post)
+
+                # Get next address to execute.
+                next_addr = to_asm_address(target_addr) if target_addr else entry.fallthrough
+
+                # Record the edge to the branch target (or fallthrough).
+                if coverage is not None and (target_addr or self.__is_branch(entry)):
+                    location = coverage_location(next_addr)
+                    edge = location ^ prev_location
+                    coverage[edge] = coverage.get(edge, 0) + 1
+                    prev_location = location >> 1
+
+                # Count instruction.
+                instr_count += 1
+
+                prev_entry = entry
+
+                if jit or (max_instrs and instr_count > max_instrs):
+                    break
+
+                entry = entry.successors.get(next_addr)
+
+                if entry and stats:
+                    stats.cache_hits += 1
+
+        return next_addr
+
+    def __fetch_and_translate(self, execution_cache, address):
+        """Return the execution cache entry of the instruction at address,
+        decoding and translating it if it is not there.
+        """
+        entry = execution_cache.get(address)
+
+        if entry:
+            if self.__stats:
+                self.__stats.cache_hits += 1
+
+            return entry
+
+        if self.__stats:
+            self.__stats.cache_misses += 1
+
+        # Fetch the instruction.
+        encoding = self.__fetch_instr(address)
+
+        # Look it up in the translation cache, decode and translate it
+        # if it is not there.
+        arch = type(self.arch_info).__name__
+
+        translation = self.translation_cache.lookup(arch, self._arch_mode, address, encoding)
+
+        if translation:
+            asm_instr, reil_instrs = translation
+        else:
+            asm_instr = self.disassembler.disassemble(encoding, address,
+                                                      architecture_mode=self._arch_mode)
+
+            reil_instrs = self.ir_translator.translate(asm_instr)
+
+            self.translation_cache.add(arch, self._arch_mode, asm_instr, reil_instrs)
+
+        sequence = self.__build_reil_container(reil_instrs).fetch_sequence(to_reil_address(address))
+
+        # Add it to the execution cache and watch its code.
+        entry = execution_cache.add(address, asm_instr, sequence, self.__compute_ip(asm_instr))
+
+        self.ir_emulator.memory.watch(address, asm_instr.size)
+
+        return entry
+
+    def __is_branch(self, entry):
+        """Return whether the instruction of an execution cache entry is a
+        branch.
+        """
+        if entry is None:
+            return False
+
+        if entry.branch is None:
+            entry.branch = self.__block_compiler.check_sequence(entry.sequence) == SEQUENCE_BRANCH
+
+        return entry.branch
+
+    def __get_execution_cache(self, end_addr, hooks):
+        key = (self._arch_mode, self.optimizer, self.skip_dead_flags)
+
+        if key not in self.__execution_caches:
+            self.__execution_caches[key] = ExecutionCache()
+
+        # Blocks end at hooked addresses and at the end address.
+        blocks_context = (end_addr, frozenset(hooks))
+
+        if blocks_context != self.__blocks_context:
+            for execution_cache in self.__execution_caches.values():
+                execution_cache.clear_blocks()
+
+            self.__blocks_context = blocks_context
+
+        return self.__execution_caches[key]
+
+    def __invalidate_code(self, start, end):
+        # Called when a memory page that holds cached code is written.
+        for execution_cache in self.__execution_caches.values():
+            execution_cache.invalidate(start, end)
+
+    def __get_block(self, execution_cache, block_hits, address, end_addr, hooks):
+        """Return the compiled block that starts at address, or None if
+        it is not hot yet or it cannot be compiled.
+        """
+        try:
+            return execution_cache.retrieve_block(address)
+        except InvalidAddressError:
+            pass
+
+        block_hits[address] = block_hits.get(address, 0) + 1
+
+        if block_hits[address] < JIT_THRESHOLD:
+            return None
+
+        block = self.__build_block(execution_cache, address, end_addr, hooks)
+
+        execution_cache.add_block(address, block, block[2] if block else None)
+
+        return block
+
+    def __build_block(self, execution_cache, address, end_addr, hooks):
+        """Build a block of native instructions starting at address and
+        compile it. Return a tuple (function, number of instructions,
+        fallthrough address, profile, links) or None. The profile holds the
+        addresses of the native instructions and the number of REIL
+        instructions per mnemonic of the block. Links are the blocks that
+        follow it, by address.
+        """
+        sequences = []
+        addresses = []
+        next_addr = address
+
+        while len(sequences) < JIT_MAX_BLOCK_SIZE:
             try:
-                reil_instr = container.fetch(ip)
-            except ReilContainerInvalidAddressError:
-                next_addr = ip
+                entry = self.__fetch_and_translate(execution_cache, next_addr)
+            except DisassemblerError:
                 break
 
-            next_ip = self.ir_emulator.single_step(reil_instr)
+            asm_instr, sequence = entry.instruction, entry.sequence
 
-            # Update instruction pointer.
-            ip = next_ip if next_ip else container.get_next_address(ip)
+            kind = self.__block_compiler.check_sequence(sequence)
 
-        # Delete temporal registers.
-        regs = list(self.ir_emulator.registers.keys())
+            if kind == SEQUENCE_INVALID:
+                break
 
-        for r in regs:
-            # TODO Remove None test.
-            if r and r.startswith("t"):
-                del self.ir_emulator.registers[r]
+            sequences.append([self.__build_ip_update(asm_instr)] + list(sequence))
+            addresses.append(asm_instr.address)
 
-        return next_addr
+            next_addr = asm_instr.address + asm_instr.size
+
+            # Blocks end at branches, hooks and at the end address.
+            if kind == SEQUENCE_BRANCH or next_addr in hooks or next_addr == end_addr:
+                break
+
+        if not sequences:
+            return None
 
-    def __build_reil_container(self, asm_instr):
-        reil_translator = self.ir_translator
+        # Flags are live at the end of the block, only the updates that are
+        # overwritten within the block are removed.
+        if self.skip_dead_flags:
+            sequences = self.__flag_liveness.optimize_instructions(sequences)
 
+        block_fn = self.__block_compiler.compile(sequences, name="block_{:x}".format(address))
+
+        block_profile = (
+            addresses,
+            Counter(instr.mnemonic for sequence in sequences for instr in sequence[1:]),
+        )
+
+        return block_fn, len(sequences), next_addr, block_profile, {}
+
+    def __build_ip_update(self, asm_instr):
+        ip_size = self.arch_info.registers_size[self.ip]
+
+        ip_value = self.__compute_ip(asm_instr)
+
+        return ReilBuilder.gen_str(ReilImmediateOperand(ip_value, ip_size),
+                                   ReilRegisterOperand(self.ip, ip_size))
+
+    def __build_reil_container(self, reil_instrs):
         container = ReilContainer()
         instr_seq = ReilSequence()
 
-        for reil_instr in reil_translator.translate(asm_instr):
+        if self.optimizer:
+            reil_instrs = self.optimizer.optimize(reil_instrs)
+
+        for reil_instr in reil_instrs:
             instr_seq.append(reil_instr)
 
         container.add(instr_seq)
@@ -324,62 +686,49 @@ class Emulator(object):
 
         return encoding
 
-    def __update_ip(self, asm_instr):
+    def __compute_ip(self, asm_instr):
         if isinstance(self.arch_info, X86ArchitectureInformation):
-            self.ir_emulator.registers[self.ip] = asm_instr.address + asm_instr.size
+            return asm_instr.address + asm_instr.size
 
         if isinstance(self.arch_info, ArmArchitectureInformation):
             if self._arch_mode == ARCH_ARM_MODE_ARM:
-                self.ir_emulator.registers[self.ip] = asm_instr.address + 8
+                return asm_instr.address + 8
             elif self._arch_mode == ARCH_ARM_MODE_THUMB:
-                self.ir_emulator.registers[self.ip] = asm_instr.address + 2
+                return asm_instr.address + 2
+
+        return None
 
     # Binary loader auxiliary methods.
     # ======================================================================= #
-    def _load_binary_elf(self, filename):
-        logger.info("Loading ELF image into memory")
-
-        f = open(filename, 'rb')
-
-        elffile = ELFFile(f)
-
-        for index, segment in enumerate(elffile.iter_segments()):
-            logger.info("Loading segment #{} ({:#x}-{:#x})".format(index, segment.header.p_vaddr,
-                                                                   segment.header.p_vaddr + segment.header.p_filesz))
+    def close(self, keep=False):
+        """Release the images mapped by load_binary. The pages that were
+        not accessed yet are dropped from the emulator memory, or loaded
+        first if *keep* is set. The files are unmapped once no other
+        component uses them.
+        """
+        if not self.__images:
+            return
 
-            for i, b in enumerate(bytearray(segment.data())):
-                self.ir_emulator.write_memory(segment.header.p_vaddr + i, 1, b)
+        self.ir_emulator.memory.unmap(keep)
 
-        f.close()
+        self.__images = []
 
-    def _load_binary_pe(self, filename):
-        logger.info("Loading PE image into memory")
+    def load_binary(self, binary):
+        # Release the previously loaded image, if any.
+        self.close()
 
-        pe = pefile.PE(filename)
+        image = binary.image if binary.image is not None else load_image(binary.filename)
 
-        pe.parse_data_directories()
+        logger.info("Loading {} image into memory".format(image.file_format.upper()))
 
-        for index, section in enumerate(pe.sections):
-            logger.info("Loading section #{} ({:#x}-{:#x})".format(index, pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress,
-                                                                   pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress + len(section.get_data())))
+        # The emulator memory loads the pages of the segments on demand.
+        for index, segment in enumerate(image.segments):
+            logger.info("Loading segment #{} ({:#x}-{:#x})".format(index, segment.address,
+                                                                   segment.address + len(segment.data)))
 
-            for i, b in enumerate(bytearray(section.get_data())):
-                self.ir_emulator.write_memory(pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress + i, 1, b)
+            self.ir_emulator.memory.map(segment.address, segment.data)
 
-    def load_binary(self, binary):
-        try:
-            fd = open(binary.filename, 'rb')
-            signature = fd.read(4)
-            fd.close()
-        except:
-            raise Exception("Error loading file.")
-
-        if signature[:4] == b"\x7f\x45\x4c\x46":
-            self._load_binary_elf(binary.filename)
-        elif signature[:2] == b"\x4d\x5a":
-            self._load_binary_pe(binary.filename)
-        else:
-            raise Exception("Unknown file format.")
+        self.__images.append(image)
 
     def write_memory(self, address, size, value):
         self.ir_emulator.write_memory(address, size, value)
@@ -390,6 +739,172 @@ class Emulator(object):
     def set_memory_taint(self, address, size, value):
         self.ir_emulator.set_memory_taint(address, size, value)
 
+    def snapshot(self):
+        """Return a snapshot of the emulator state (see ReilEmulator.snapshot).
+        """
+        return self.ir_emulator.snapshot()
+
+    def restore(self, snapshot):
+        """Restore the emulator state to a snapshot.
+        """
+        self.ir_emulator.restore(snapshot)
+
+    def fuzz_harness(self, start_addr, snapshot_addr, end_addr, hooks=None, max_instrs=FUZZ_MAX_INSTRS, jit=False):
+        """Emulate from start_addr up to snapshot_addr and return a
+        FuzzHarness that runs each test case from there to end_addr.
+
+        Runs that execute *max_instrs* native instructions end with
+        FUZZ_STATUS_TIMEOUT (default FUZZ_MAX_INSTRS). With None, a test
+        case that never reaches the end address nor crashes does not end.
+        """
+        hooks = hooks if hooks else {}
+
+        if start_addr != snapshot_addr:
+            self.emulate(start_addr, snapshot_addr, hooks, None, False, jit=jit)
+
+        return FuzzHarness(self, snapshot_addr, end_addr, hooks, max_instrs, jit)
+
     @property
     def registers(self):
         return self.ir_emulator.registers
+
+
+class FuzzResult(object):
+
+    """Outcome of a fuzzing run."""
+
+    __slots__ = [
+        'status',
+        'address',
+        'error',
+        'coverage',
+        'new_coverage',
+    ]
+
+    def __init__(self, status, address, error, coverage, new_coverage):
+        # Either FUZZ_STATUS_END, FUZZ_STATUS_CRASH or FUZZ_STATUS_TIMEOUT.
+        self.status = status
+
+        # Address where the emulation stopped (for a crash, the value of
+        # the instruction pointer).
+        self.address = address
+
+        # Formatted exception of a crash.
+        self.error = error
+
+        # Hit counts of the edges executed, by coverage map location.
+        self.coverage = coverage
+
+        # Whether the run reached new edges (or new hit count buckets).
+        self.new_coverage = new_coverage
+
+    @property
+    def crashed(self):
+        return self.status == FUZZ_STATUS_CRASH
+
+
+class FuzzHarness(object):
+
+    """Snapshot based fuzzing harness for an Emulator.
+
+    Each test case runs from the same snapshot: its data is written to the
+    input buffers and the code is emulated up to the end address, an
+    exception (a crash) or the maximum number of instructions. Restoring
+    the snapshot only replaces the registers and the memory page table;
+    pages are copied on write, so the cost of a run depends on the pages
+    it dirties and not on the size of the image.
+
+    Coverage is accumulated in a bitmap with an entry per edge location.
+    Each entry holds a bit per hit count bucket, as in AFL (1, 2, 3, 4-7,
+    8-15, 16-31, 32-127 and 128+).
+    """
+
+    def __init__(self, emulator, start_addr, end_addr, hooks, max_instrs=FUZZ_MAX_INSTRS, jit=False):
+        self.__emulator = emulator
+        self.__start_addr = start_addr
+        self.__end_addr = end_addr
+        self.__hooks = hooks
+        self.__max_instrs = max_instrs
+        self.__jit = jit
+
+        self.__snapshot = emulator.snapshot()
+
+        # Input buffers, a list of (address, size) pairs.
+        self.__inputs = []
+
+        self.__bitmap = bytearray(COVERAGE_MAP_SIZE)
+
+        self.__executions = 0
+        self.__crashes = []
+
+    @property
+    def inputs(self):
+        return list(self.__inputs)
+
+    @property
+    def bitmap(self):
+        """Accumulated coverage bitmap."""
+        return self.__bitmap
+
+    @property
+    def executions(self):
+        return self.__executions
+
+    @property
+    def crashes(self):
+        """List of (data, result) pairs of the runs that crashed."""
+        return self.__crashes
+
+    def add_input(self, address, size):
+        """Mark a buffer of the snapshot as input.
+        """
+        self.__inputs.append((address, size))
+
+    def run(self, data):
+        """Run a test case and return a FuzzResult. *data* is the content
+        of the input buffer, or a list with the content of each buffer.
+        Data longer than its buffer is truncated.
+        """
+        emulator = self.__emulator
+
+        emulator.restore(self.__snapshot)
+
+        buffers = [data] if isinstance(data, (bytes, bytearray)) else data
+
+        for (address, size), content in zip(self.__inputs, buffers):
+            emulator.ir_emulator.memory.write_bytes(address, bytes(bytearray(content[:size])))
+
+        coverage = {}
+        error = None
+
+        try:
+            address = emulator.emulate(self.__start_addr, self.__end_addr, self.__hooks, self.__max_instrs, False,
+                                       jit=self.__jit, coverage=coverage)
+
+            status = FUZZ_STATUS_END if address == self.__end_addr else FUZZ_STATUS_TIMEOUT
+        except Exception:
+            status = FUZZ_STATUS_CRASH
+            address = emulator.registers[emulator.ip] if emulator.ip in emulator.registers else None
+            error = traceback.format_exc()
+
+        result = FuzzResult(status, address, error, coverage, self.__update_bitmap(coverage))
+
+        self.__executions += 1
+
+        if status == FUZZ_STATUS_CRASH:
+            self.__crashes.append((data, result))
+
+        return result
+
+    def __update_bitmap(self, coverage):
+        bitmap = self.__bitmap
+        new_coverage = False
+
+        for edge, count in coverage.items():
+            bucket = _HIT_COUNT_BUCKETS[min(count, 255)]
+
+            if not bitmap[edge] & bucket:
+                bitmap[edge] |= bucket
+                new_coverage = True
+
+        return new_coverage
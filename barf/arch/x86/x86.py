@@ -228,6 +228,9 @@ class X86ArchitectureInformation(ArchitectureInformation):
         ("cr4", 32),
     ]
 
+    # Register tables by architecture mode.
+    _tables = {}
+
     def __init__(self, architecture_mode):
         super(X86ArchitectureInformation, self).__init__()
 
@@ -242,9 +245,21 @@ class X86ArchitectureInformation(ArchitectureInformation):
 
         self._alias_mapper = {}
 
-        self._load_registers()
+        # The register tables are built once per mode and shared.
+        tables = self._tables.get(architecture_mode)
+
+        if tables is None:
+            self._load_registers()
+
+            self._load_alias_mapper()
+
+            tables = (self._registers_all, self._registers_gp_all, self._registers_gp_base,
+                      self._registers_flags, self._registers_size, self._alias_mapper)
+
+            X86ArchitectureInformation._tables[architecture_mode] = tables
 
-        self._load_alias_mapper()
+        self._registers_all, self._registers_gp_all, self._registers_gp_base, \
+            self._registers_flags, self._registers_size, self._alias_mapper = tables
 
     @property
     def architecture_mode(self):
@@ -28,7 +28,14 @@ BARF : Binary Analysis Framework.
 """
 from __future__ import absolute_import
 
+import itertools
 import logging
+import multiprocessing
+import sys
+import traceback
+import weakref
+
+from collections import deque
 
 from .analysis.codeanalyzer import CodeAnalyzer
 from .analysis.graphs.controlflowgraph import CFGRecoverer
@@ -53,8 +60,19 @@ from .core.smt.smtsolver import SmtSolverNotFound
 from .core.smt.smtsolver import Z3Solver
 from .core.smt.smttranslator import SmtTranslator
 
+try:
+    from concurrent.futures import Future
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    ProcessPoolExecutor = None
+
 logger = logging.getLogger(__name__)
 
+# BARF instance, snapshot and arguments of an emulate_many worker process
+# (set by its initializer).
+_worker_state = None
+
 # Choose between SMT Solvers...
 SMT_SOLVER = "Z3"
 # SMT_SOLVER = "CVC4"
@@ -68,27 +86,131 @@ class BARF(object):
         logger.info("Initializing BARF")
 
         self.name = None
-        self.code_analyzer = None
         self.ir_translator = None
         self.binary = None
-        self.smt_solver = None
-        self.gadget_classifier = None
-        self.gadget_verifier = None
         self.arch_info = None
-        self.gadget_finder = None
         self.text_section = None
         self.disassembler = None
-        self.smt_translator = None
-        self.ir_emulator = None
-        self.bb_builder = None
         self._load_bin = load_bin
 
-        self.emulator = None
-
         self._arch_mode = None
 
+        # Core and analysis modules, by name. They are created on first
+        # access (see the properties below).
+        self.__components = {}
+
         self.open(filename)
 
+    def __component(self, name, factory):
+        if name not in self.__components:
+            self.__components[name] = factory()
+
+        return self.__components[name]
+
+    # Core modules.
+    # ======================================================================== #
+
+    @property
+    def ir_emulator(self):
+        """Get REIL emulator. The binary is loaded into its memory (see
+        emulator).
+        """
+        if "ir_emulator" not in self.__components:
+            self.emulator
+
+        return self.__components["ir_emulator"]
+
+    @ir_emulator.setter
+    def ir_emulator(self, value):
+        self.__components["ir_emulator"] = value
+
+    @property
+    def smt_solver(self):
+        """Get SMT solver (None if it is not installed). The solver
+        process is started on first access.
+        """
+        return self.__component("smt_solver", self._create_smt_solver)
+
+    @smt_solver.setter
+    def smt_solver(self, value):
+        self.__components["smt_solver"] = value
+
+    @property
+    def smt_translator(self):
+        """Get SMT translator (None if there is no SMT solver).
+        """
+        return self.__component("smt_translator", self._create_smt_translator)
+
+    @smt_translator.setter
+    def smt_translator(self, value):
+        self.__components["smt_translator"] = value
+
+    # Analysis modules.
+    # ======================================================================== #
+
+    @property
+    def emulator(self):
+        """Get native code emulator. The binary is loaded into memory on
+        first access.
+        """
+        return self.__component("emulator", self._create_emulator)
+
+    @emulator.setter
+    def emulator(self, value):
+        self.__components["emulator"] = value
+
+    @property
+    def bb_builder(self):
+        """Get basic block (CFG) recoverer.
+        """
+        return self.__component("bb_builder", self._create_bb_builder)
+
+    @bb_builder.setter
+    def bb_builder(self, value):
+        self.__components["bb_builder"] = value
+
+    @property
+    def code_analyzer(self):
+        """Get code analyzer (None if there is no SMT solver).
+        """
+        return self.__component("code_analyzer", self._create_code_analyzer)
+
+    @code_analyzer.setter
+    def code_analyzer(self, value):
+        self.__components["code_analyzer"] = value
+
+    @property
+    def gadget_classifier(self):
+        """Get gadget classifier.
+        """
+        return self.__component("gadget_classifier", self._create_gadget_classifier)
+
+    @gadget_classifier.setter
+    def gadget_classifier(self, value):
+        self.__components["gadget_classifier"] = value
+
+    @property
+    def gadget_finder(self):
+        """Get gadget finder.
+        """
+        return self.__component("gadget_finder", self._create_gadget_finder)
+
+    @gadget_finder.setter
+    def gadget_finder(self, value):
+        self.__components["gadget_finder"] = value
+
+    @property
+    def gadget_verifier(self):
+        """Get gadget verifier (None if there is no SMT solver).
+        """
+        return self.__component("gadget_verifier", self._create_gadget_verifier)
+
+    @gadget_verifier.setter
+    def gadget_verifier(self, value):
+        self.__components["gadget_verifier"] = value
+
+    # ======================================================================== #
+
     def _load(self, arch_mode=None):
         # setup architecture
         self._setup_arch(arch_mode=arch_mode)
@@ -99,9 +221,6 @@ class BARF(object):
         # setup analysis modules
         self._setup_analysis_modules()
 
-        if self._load_bin:
-            self.emulator.load_binary(self.binary)
-
     def _setup_arch(self, arch_mode=None):
         """Set up architecture.
         """
@@ -138,66 +257,77 @@ class BARF(object):
         self.ir_translator = X86Translator(arch_mode)
 
     def _setup_core_modules(self):
-        """Set up core modules.
+        """Set up core modules. They are created on first access.
         """
-        self.ir_emulator = None
-        self.smt_solver = None
-        self.smt_translator = None
+        for name in ("ir_emulator", "smt_solver", "smt_translator"):
+            self.__components.pop(name, None)
 
-        if self.arch_info:
-            # Set REIL emulator.
-            self.ir_emulator = ReilEmulator(self.arch_info)
+    def _setup_analysis_modules(self):
+        """Set up analysis modules. They are created on first access.
+        """
+        for name in ("emulator", "bb_builder", "code_analyzer", "gadget_classifier", "gadget_finder",
+                     "gadget_verifier"):
+            self.__components.pop(name, None)
 
-            # Set SMT Solver.
-            self.smt_solver = None
+    def _create_smt_solver(self):
+        if SMT_SOLVER not in ("Z3", "CVC4"):
+            raise Exception("{} SMT solver not supported.".format(SMT_SOLVER))
 
-            if SMT_SOLVER not in ("Z3", "CVC4"):
-                raise Exception("{} SMT solver not supported.".format(SMT_SOLVER))
+        try:
+            if SMT_SOLVER == "Z3":
+                return Z3Solver()
+            elif SMT_SOLVER == "CVC4":
+                return CVC4Solver()
+        except SmtSolverNotFound:
+            logger.warn("{} Solver is not installed. Run 'barf-install-solvers.sh' to install it.".format(SMT_SOLVER))
 
-            try:
-                if SMT_SOLVER == "Z3":
-                    self.smt_solver = Z3Solver()
-                elif SMT_SOLVER == "CVC4":
-                    self.smt_solver = CVC4Solver()
-            except SmtSolverNotFound:
-                logger.warn("{} Solver is not installed. Run 'barf-install-solvers.sh' to install it.".format(SMT_SOLVER))
+        return None
 
-            # Set SMT translator.
-            self.smt_translator = None
+    def _create_smt_translator(self):
+        if not self.smt_solver:
+            return None
 
-            if self.smt_solver:
-                self.smt_translator = SmtTranslator(self.smt_solver, self.arch_info.address_size)
+        smt_translator = SmtTranslator(self.smt_solver, self.arch_info.address_size)
 
-                self.smt_translator.set_arch_alias_mapper(self.arch_info.alias_mapper)
-                self.smt_translator.set_arch_registers_size(self.arch_info.registers_size)
+        smt_translator.set_arch_alias_mapper(self.arch_info.alias_mapper)
+        smt_translator.set_arch_registers_size(self.arch_info.registers_size)
 
-    def _setup_analysis_modules(self):
-        """Set up analysis modules.
-        """
-        # Basic block.
-        self.bb_builder = CFGRecoverer(RecursiveDescent(self.disassembler, self.text_section, self.ir_translator,
-                                                        self.arch_info))
+        return smt_translator
+
+    def _create_emulator(self):
+        if "ir_emulator" not in self.__components:
+            self.__components["ir_emulator"] = ReilEmulator(self.arch_info)
+
+        emulator = Emulator(self.arch_info, self.__components["ir_emulator"], self.ir_translator,
+                            self.disassembler)
+
+        if self._load_bin and self.binary:
+            emulator.load_binary(self.binary)
 
-        # Code analyzer.
-        self.code_analyzer = None
+        return emulator
 
-        if self.smt_translator:
-            self.code_analyzer = CodeAnalyzer(self.smt_solver, self.smt_translator, self.arch_info)
+    def _create_bb_builder(self):
+        return CFGRecoverer(RecursiveDescent(self.disassembler, self.text_section, self.ir_translator,
+                                             self.arch_info))
 
-        # Gadgets classifier.
-        self.gadget_classifier = GadgetClassifier(self.ir_emulator, self.arch_info)
+    def _create_code_analyzer(self):
+        if not self.smt_translator:
+            return None
 
-        # Gadgets finder.
-        self.gadget_finder = GadgetFinder(self.disassembler, self.text_section, self.ir_translator,
-                                          self.binary.architecture, self.binary.architecture_mode)
+        return CodeAnalyzer(self.smt_solver, self.smt_translator, self.arch_info)
 
-        # Gadget verifier.
-        self.gadget_verifier = None
+    def _create_gadget_classifier(self):
+        return GadgetClassifier(self.ir_emulator, self.arch_info)
 
-        if self.code_analyzer:
-            self.gadget_verifier = GadgetVerifier(self.code_analyzer, self.arch_info)
+    def _create_gadget_finder(self):
+        return GadgetFinder(self.disassembler, self.text_section, self.ir_translator,
+                            self.binary.architecture, self.binary.architecture_mode)
 
-        self.emulator = Emulator(self.arch_info, self.ir_emulator, self.ir_translator, self.disassembler)
+    def _create_gadget_verifier(self):
+        if not self.code_analyzer:
+            return None
+
+        return GadgetVerifier(self.code_analyzer, self.arch_info)
 
     # ======================================================================== #
 
@@ -379,7 +509,7 @@ class BARF(object):
 
         return cfg, calls
 
-    def emulate(self, context=None, start=None, end=None, arch_mode=None, hooks=None, max_instrs=None, print_asm=False):
+    def emulate(self, context=None, start=None, end=None, arch_mode=None, hooks=None, max_instrs=None, print_asm=False, jit=False):
         """Emulate native code.
 
         Args:
@@ -390,6 +520,7 @@ class BARF(object):
             hooks (dict): Hooks by address.
             max_instrs (int): Maximum number of instructions to execute.
             print_asm (bool): Print asm.
+            jit (bool): Compile hot basic blocks.
 
         Returns:
             dict: Processor context.
@@ -416,7 +547,7 @@ class BARF(object):
             self.ir_emulator.memory.write(addr, 4, val)
 
         # Execute the code.
-        self.emulator.emulate(start_addr, end_addr, hooks, max_instrs, print_asm)
+        self.emulator.emulate(start_addr, end_addr, hooks, max_instrs, print_asm, jit=jit)
 
         context_out = {
             'registers': {},
@@ -429,11 +560,218 @@ class BARF(object):
 
         return context_out
 
+    def emulate_many(self, contexts, start=None, end=None, arch_mode=None, hooks=None, max_instrs=None, jit=False,
+                     processes=None, chunksize=1):
+        """Emulate native code once per context, spreading the contexts
+        over a pool of worker processes.
+
+        Workers are forked when emulate_many is called, after the binary
+        is loaded, so they share it (and the translation caches) with the
+        current process. The pool is shut down when the returned iterator
+        is exhausted, closed or garbage collected. Each
+        context runs from the current emulator state, as a single call
+        to emulate would. If processes cannot be forked (or the Python
+        version has no process pool initializers) or `processes` is 1,
+        contexts are emulated in the current process.
+
+        Args:
+            contexts (iterable): Processor contexts (see emulate).
+            start (int): Start address.
+            end (int): End address.
+            arch_mode (int): Architecture mode.
+            hooks (dict): Hooks by address.
+            max_instrs (int): Maximum number of instructions to execute.
+            jit (bool): Compile hot basic blocks.
+            processes (int): Number of worker processes (default: number
+                of CPUs).
+            chunksize (int): Number of contexts sent to a worker at a time.
+
+        Returns:
+            iterator: A (context, error) pair per context, in order. On
+                success, error is None; otherwise, context is None and error
+                is the formatted exception raised by the emulation (or by
+                the pool, if the worker process died).
+        """
+        if arch_mode is not None:
+            # Reload modules.
+            self._load(arch_mode=arch_mode)
+
+        args = (start, end, hooks, max_instrs, jit)
+
+        snapshot = self.emulator.snapshot()
+
+        mp_context = _get_fork_context()
+
+        if processes == 1 or mp_context is None:
+            return self.__emulate_many_serial(snapshot, args, contexts)
+
+        state = self, snapshot, args
+        processes = processes or multiprocessing.cpu_count()
+
+        # The workers are forked now, so they get the current state.
+        executor = _start_executor(state, mp_context, processes)
+
+        results = _emulate_many_pool(executor, state, contexts, mp_context, processes, chunksize)
+
+        # Shut the pool down even if the results are never iterated.
+        weakref.finalize(results, executor.shutdown, False)
+
+        return results
+
+    def __emulate_many_serial(self, snapshot, args, contexts):
+        try:
+            for context in contexts:
+                yield _emulate_one(self, snapshot, args, context)
+        finally:
+            self.emulator.restore(snapshot)
+
     def __fetch_instr(self, next_addr):
         start, end = next_addr, next_addr + self.arch_info.max_instruction_size
 
-        encoding = bytearray()
-        for i in range(end - start):
-            encoding.append(self.ir_emulator.read_memory(start + i, 1))
+        # Read from the .text section until the emulator is created (its
+        # memory reflects the writes done by the emulated code).
+        if "emulator" not in self.__components and self.binary and \
+                self.binary.ea_start <= start <= self.binary.ea_end:
+            return bytearray(self.text_section[start:min(end, self.binary.ea_end + 1)])
+
+        return bytearray(self.ir_emulator.memory.read_bytes(start, end - start))
+
+
+def _get_fork_context():
+    """Return a multiprocessing context that forks processes, if the
+    platform supports it and process pools accept it (Python 3.7+).
+    """
+    if ProcessPoolExecutor is None or sys.version_info < (3, 7):
+        return None
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+
+    return multiprocessing.get_context("fork")
+
+
+def _emulate_one(barf, snapshot, args, context):
+    start, end, hooks, max_instrs, jit = args
+
+    barf.emulator.restore(snapshot)
+
+    try:
+        context_out = barf.emulate(context, start, end, None, hooks, max_instrs, False, jit)
+    except Exception:
+        return None, traceback.format_exc()
+
+    return context_out, None
+
+
+def _emulate_many_init(state):
+    global _worker_state
+
+    _worker_state = state
+
+
+def _emulate_many_worker(contexts):
+    barf, snapshot, args = _worker_state
+
+    return [_emulate_one(barf, snapshot, args, context) for context in contexts]
+
+
+def _new_executor(state, mp_context, processes):
+    # Processes are forked, so the state is inherited instead of pickled.
+    return ProcessPoolExecutor(processes, mp_context=mp_context, initializer=_emulate_many_init,
+                               initargs=(state,))
+
+
+def _start_executor(state, mp_context, processes):
+    executor = _new_executor(state, mp_context, processes)
+
+    # With the fork start method, the first task starts all the worker
+    # processes (and reports initialization errors).
+    try:
+        executor.submit(_emulate_many_worker, []).result()
+    except Exception:
+        executor.shutdown()
+
+        raise
+
+    return executor
+
+
+def _emulate_isolated(state, context, mp_context):
+    """Emulate a context in a process of its own. The error is the pool's
+    if the process dies.
+    """
+    executor = _new_executor(state, mp_context, 1)
+
+    try:
+        return executor.submit(_emulate_many_worker, [context]).result()[0]
+    except BrokenProcessPool:
+        return None, traceback.format_exc()
+    finally:
+        executor.shutdown()
+
+
+def _emulate_many_pool(executor, state, contexts, mp_context, processes, chunksize):
+    contexts = iter(contexts)
+
+    # Chunks of contexts sent to the pool and their futures, in order.
+    pending = deque()
+
+    try:
+        while True:
+            # Keep a bounded number of chunks in flight, so contexts are
+            # consumed as results are yielded.
+            while len(pending) < 2 * processes:
+                chunk = list(itertools.islice(contexts, chunksize))
+
+                if not chunk:
+                    break
+
+                try:
+                    pending.append((chunk, executor.submit(_emulate_many_worker, chunk)))
+                except BrokenProcessPool as error:
+                    # A worker died while the previous chunks ran. This
+                    # chunk is run again along with them (see below).
+                    future = Future()
+                    future.set_exception(error)
+
+                    pending.append((chunk, future))
+
+                    break
+
+            if not pending:
+                return
+
+            chunk, future = pending[0]
+
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                # A worker died (crash, out of memory, exit). The chunks
+                # that did not finish are run again, one context per
+                # process, to report only the contexts that kill it.
+                executor.shutdown()
+
+                for chunk, future in pending:
+                    if future.exception() is None:
+                        results = future.result()
+                    else:
+                        results = [_emulate_isolated(state, context, mp_context) for context in chunk]
+
+                    for result in results:
+                        yield result
+
+                pending.clear()
+
+                executor = _new_executor(state, mp_context, processes)
+
+                continue
+
+            pending.popleft()
+
+            for result in results:
+                yield result
+    finally:
+        for _, future in pending:
+            future.cancel()
 
-        return encoding
+        executor.shutdown()
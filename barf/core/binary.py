@@ -29,9 +29,16 @@ from __future__ import absolute_import
 
 from past.builtins import long
 
+import bisect
 import logging
+import mmap
+import os
+import weakref
 
+from elftools.elf.descriptions import describe_symbol_shndx
+from elftools.elf.descriptions import describe_symbol_type
 from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
 
 import barf.arch as arch
 import pefile
@@ -39,139 +46,207 @@ import pefile
 logger = logging.getLogger(__name__)
 
 
-class SectionRequest(object):
-
-    def __init__(self, name):
-        self._name = name
-        self._found = False
-        self.memory = Memory()
-        self._sect_start_addr = -1
-        self._sect_size = -1
-
-    @property
-    def found(self):
-        return self._found
-
-    def set_found(self, found):
-        self._found = found
-
-    def get_sect_properties(self):
-        return self._sect_start_addr, self._sect_size
-
-    def set_sect_properties(self, start, size):
-        self._sect_start_addr = start
-        self._sect_size = size
-
-    def __str__(self):
-        return "{}  {:#x} - {:#x}".format(self._name,
-                                          self._sect_start_addr,
-                                          self._sect_start_addr + self._sect_size)
-
-
 class InvalidAddressError(Exception):
     pass
 
 
 class Memory(object):
 
+    """Read-only memory made of virtual memory areas (VMA).
+
+    VMAs are kept sorted by address and looked up by bisection. Slices
+    are returned as bytes, taken at once from each VMA they span.
+    """
+
     def __init__(self):
-        # List of virtual memory areas, tuple of (address, data)
+        # List of virtual memory areas, tuple of (address, data), sorted
+        # by address.
         self.__vma = []
 
+        # Start address of each VMA.
+        self.__vma_starts = []
+
     def add_vma(self, address, data):
-        self.__vma.append((address, data))
+        data = data if isinstance(data, bytes) else bytes(data)
+
+        index = bisect.bisect_right(self.__vma_starts, address)
+
+        self.__vma.insert(index, (address, data))
+        self.__vma_starts.insert(index, address)
 
     def __iter__(self):
         for address, data in self.__vma:
-            for i in range(len(data)):
-                yield address + i
+            for addr in range(address, address + len(data)):
+                yield addr
 
     def __getitem__(self, key):
-        # TODO: Return bytearray or byte instead of str.
         if isinstance(key, slice):
-            chunk = bytearray()
-
-            step = 1 if key.step is None else key.step
-
-            try:
-                # Read memory one byte at a time.
-                for addr in range(key.start, key.stop, step):
-                    chunk.append(self._read_byte(addr))
-            except IndexError:
-                logger.warn("Address out of range: {:#x}".format(addr))
-                raise InvalidAddressError()
+            if key.step is not None and key.step != 1:
+                return self._read_bytes_step(key.start, key.stop, key.step)
 
-            return chunk
+            return self._read_bytes(key.start, key.stop)
         elif isinstance(key, int) or isinstance(key, long):
             return self._read_byte(key)
         else:
             raise TypeError("Invalid argument type: {}".format(type(key)))
 
     def _read_byte(self, index):
-        for address, data in self.__vma:
-            if 0 <= index - address < len(data):
-                return data[index - address]
+        vma = self.__find_vma(index)
+
+        if vma is None:
+            # If not in range raise an exception.
+            raise IndexError
+
+        address, data = vma
+
+        return data[index - address]
+
+    def _read_bytes(self, start, stop):
+        if stop <= start:
+            return b""
+
+        vma = self.__find_vma(start)
+
+        if vma is None:
+            logger.warn("Address out of range: {:#x}".format(start))
+            raise InvalidAddressError()
+
+        address, data = vma
+
+        # Fast path, the range is within one VMA.
+        if stop - address <= len(data):
+            return data[start - address:stop - address]
+
+        # The range spans consecutive VMAs.
+        chunks = [data[start - address:]]
+        addr = address + len(data)
+        index = bisect.bisect_right(self.__vma_starts, start)
+
+        while addr < stop:
+            if index == len(self.__vma) or self.__vma[index][0] > addr:
+                logger.warn("Address out of range: {:#x}".format(addr))
+                raise InvalidAddressError()
+
+            address, data = self.__vma[index]
+
+            chunks.append(data[addr - address:stop - address])
 
-        # If not in range raise an exception.
-        raise IndexError
+            addr = address + len(data)
+            index += 1
+
+        return b"".join(chunks)
+
+    def _read_bytes_step(self, start, stop, step):
+        chunk = bytearray()
+
+        for addr in range(start, stop, step):
+            chunk += self._read_bytes(addr, addr + 1)
+
+        return bytes(chunk)
+
+    def __find_vma(self, address):
+        index = bisect.bisect_right(self.__vma_starts, address) - 1
+
+        if index >= 0:
+            vma_address, data = self.__vma[index]
+
+            if address - vma_address < len(data):
+                return self.__vma[index]
+
+        return None
 
     @property
     def start(self):
-        return min([address for address, _ in self.__vma])
+        return self.__vma[0][0]
 
     @property
     def end(self):
         return max([address + len(data) for address, data in self.__vma])
 
 
-class BinaryFile(object):
+class BinarySection(object):
 
-    """Binary file representation.
+    """Section of a binary image. *data* is the content of the section
+    in the file (it can be shorter than *size*).
     """
 
-    def __init__(self, filename):
+    __slots__ = ["name", "address", "size", "data"]
 
-        # File name of the binary file.
-        self._filename = filename
+    def __init__(self, name, address, size, data):
+        self.name = name
+        self.address = address
+        self.size = size
+        self.data = data
 
-        # Section .text.
-        self._section_text = None
 
-        # Start address of the section .text.
-        self._section_text_start = None
+class BinarySegment(object):
 
-        self._section_data_memory = None
+    """Loadable segment of a binary image. *data* is the content of the
+    segment in the file (it can be shorter than *size*).
+    """
 
-        # End address of the section .text (last addressable byte
-        # address).
-        self._section_text_end = None
+    __slots__ = ["address", "size", "data"]
 
-        # Underlying architecture.
-        self._arch = None
+    def __init__(self, address, size, data):
+        self.address = address
+        self.size = size
+        self.data = data
 
-        # Architecture mode.
-        self._arch_mode = None
 
-        # Entry Point.
-        self._entry_point = None
+class BinaryImage(object):
 
-        # Open file
-        if filename:
-            self._open(filename)
+    """Parsed ELF or PE file. The file is memory mapped once and the
+    content of its sections and segments are views of that mapping.
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+
+        try:
+            with open(filename, 'rb') as f:
+                signature = f.read(4)
+
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            logger.error("Error loading file: %s", format(filename), exc_info=True)
+
+            raise Exception("Error loading file: {}".format(filename))
+
+        try:
+            self._data = memoryview(self._mmap)
+        except TypeError:
+            # Python 2 mmap objects do not support memoryview, use a copy of
+            # the file instead.
+            self._data = memoryview(self._mmap[:])
+
+        self._elffile = None
+        self._pe = None
+        self._symbols = None
+
+        if signature[:4] == b'\x7f\x45\x4c\x46':
+            self._open_elf()
+        elif signature[:2] == b'\x4d\x5a':
+            self._open_pe()
+        else:
+            raise Exception("Unknown file format: {}".format(filename))
 
     @property
-    def ea_start(self):
-        """Get start address of section .text.
+    def filename(self):
+        """Get file name.
         """
-        return self._section_text_start
+        return self._filename
 
     @property
-    def ea_end(self):
-        """Get end address of section .text (last addressable byte
-        address).
+    def file_format(self):
+        """Get file format ("elf" or "pe").
+        """
+        return self._file_format
 
+    @property
+    def data(self):
+        """Get content of the file.
         """
-        return self._section_text_end
+        return self._data
 
     @property
     def architecture(self):
@@ -186,166 +261,125 @@ class BinaryFile(object):
         return self._arch_mode
 
     @property
-    def filename(self):
-        """Get file name.
-        """
-        return self._filename
-
-    @property
-    def file_format(self):
-        """Get file format.
+    def entry_point(self):
+        """Get entry point.
         """
-        raise NotImplementedError()
+        return self._entry_point
 
     @property
-    def text_section(self):
-        """Get section .text.
+    def sections(self):
+        """Get sections (list of BinarySection).
         """
-        return self._section_text_memory
+        return self._sections
 
     @property
-    def data_section(self):
-        """Get section .data.
+    def segments(self):
+        """Get loadable segments (list of BinarySegment), the PT_LOAD
+        segments of ELF files and the sections of PE files.
         """
-        return self._section_data_memory
+        return self._segments
 
     @property
-    def entry_point(self):
-        """Get entry point.
+    def symbols(self):
+        """Get function symbols, as a dictionary of address to (name,
+        size, True). They are loaded on first access.
         """
-        return self._entry_point
+        if self._symbols is None:
+            if self._file_format == "elf":
+                self._symbols = self._load_symbols_elf()
+            else:
+                self._symbols = self._load_symbols_pe()
 
-    def _open(self, filename):
-        try:
-            fd = open(filename, 'rb')
-            signature = fd.read(4)
-            fd.close()
-        except:
-            logger.error("Error loading file: %s", format(filename), exc_info=True)
-
-            raise Exception("Error loading file: {}".format(filename))
-
-        if signature[:4] == b'\x7f\x45\x4c\x46':
-            self._open_elf(filename)
-        elif signature[:2] == b'\x4d\x5a':
-            self._open_pe(filename)
-        else:
-            raise Exception("Unknown file format: {}".format(filename))
+        return self._symbols
 
-    @staticmethod
-    def _extract_section(sect_req, elffile, mem=None):
+    def section(self, name):
+        """Get section by name, None if there is none.
         """
-            :sect_req dictionary of section names as strings and SectionRequest objects
-            :mem if mem is not null, it serves as an accumulator rather than using the memory
-                 in SectionRequests
+        for section in self._sections:
+            if section.name == name:
+                return section
 
-            :returns nothing
-        """
-        for nseg, section in enumerate(elffile.iter_sections()):
-            request = sect_req.get(section.name, None)
-            if request:
-                request.set_found(True)
-                request.set_sect_properties(section.header.sh_addr,
-                                            section.header.sh_size)
-                if mem:
-                    mem.add_vma(section.header.sh_addr, section.data())
-                else:
-                    request.memory.add_vma(section.header.sh_addr, section.data())
-
-    def _open_elf(self, filename):
-        f = open(filename, 'rb')
-
-        elffile = ELFFile(f)
+        return None
 
+    def _open_elf(self):
+        self._elffile = elffile = ELFFile(self._mmap)
+
+        self._file_format = "elf"
         self._entry_point = elffile.header['e_entry']
         self._arch = self._get_arch_elf(elffile)
         self._arch_mode = self._get_arch_mode_elf(elffile)
 
-        # TODO: Load all segments instead of just one section.
-        # for nseg, segment in enumerate(elffile.iter_segments()):
-        #     print("loading segment #{} - {} [{} bytes]".format(nseg, segment.header.p_vaddr, len(segment.data())))
-
-        #     if len(segment.data()) > 0:
-        #         m.add_vma(segment.header.p_vaddr, bytearray(segment.data()))
-
-        sections = {
-            ".text": SectionRequest(".text")
-        }
-
-        BinaryFile._extract_section(sections, elffile)
-        text = sections[".text"]
-
-        if not text.found:
-            raise Exception("Error loading ELF file.")
+        self._sections = []
 
-        sections = {
-            ".data": SectionRequest(".data"),
-            ".rodata": SectionRequest(".rodata"),
-            ".got": SectionRequest(".got"),
-            ".got.plt": SectionRequest(".got.plt")
-        }
+        for section in elffile.iter_sections():
+            start, size = section.header.sh_offset, section.header.sh_size
 
-        m = Memory()
-        BinaryFile._extract_section(sections, elffile, mem=m)
+            if section.header.sh_type == 'SHT_NOBITS':
+                data = self._data[start:start]
+            else:
+                data = self._data[start:start + size]
 
-        data_addrs_start = []
-        data_addrs_ends = []
-        for k, v in sections.items():
-            if v.found:
-                start, size = v.get_sect_properties()
-                data_addrs_start.append(start)
-                data_addrs_ends.append(start + size)
+            self._sections.append(BinarySection(section.name, section.header.sh_addr, size, data))
 
-        text_section_start, text_section_size = text.get_sect_properties()
-        text_section_end = text_section_start + text_section_size
+        self._segments = []
 
-        self._section_text_start = text_section_start
-        self._section_text_end = text_section_end - 1
-        self._section_text_memory = text.memory
+        for segment in elffile.iter_segments():
+            if segment.header.p_type != 'PT_LOAD':
+                continue
 
-        self._section_data_start = min(data_addrs_start)
-        self._section_data_end = max(data_addrs_ends) - 1
-        self._section_data_memory = m
+            start, size = segment.header.p_offset, segment.header.p_filesz
 
-        f.close()
+            self._segments.append(BinarySegment(segment.header.p_vaddr, segment.header.p_memsz,
+                                                self._data[start:start + size]))
 
-    def _open_pe(self, filename):
-        pe = pefile.PE(filename)
-
-        pe.parse_data_directories()
+    def _open_pe(self):
+        self._pe = pe = pefile.PE(data=self._mmap, fast_load=True)
 
+        self._file_format = "pe"
         self._entry_point = pe.OPTIONAL_HEADER.ImageBase + pe.OPTIONAL_HEADER.AddressOfEntryPoint
         self._arch = self._get_arch_pe(pe)
         self._arch_mode = self._get_arch_mode_pe(pe)
 
-        # TODO: Load all sections instead of just one.
-        # Map binary to memory (only text section)
-        m = Memory()
+        self._sections = []
+
+        for section in pe.sections:
+            # Same range as returned by section.get_data().
+            start = section.get_PointerToRawData_adj()
+            end = min(start + section.SizeOfRawData, section.PointerToRawData + section.SizeOfRawData)
+
+            name = section.Name.replace(b'\x00', b' ').strip().decode('latin-1')
+            address = pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress
+            data = self._data[start:max(start, end)]
 
-        found = False
+            self._sections.append(BinarySection(name, address, section.Misc_VirtualSize, data))
 
-        for idx, section in enumerate(pe.sections):
-            if section.Name.replace(b'\x00', b' ').strip() == b'.text':
-                found = True
+        self._segments = [BinarySegment(section.address, section.size, section.data)
+                          for section in self._sections]
 
-                text_section_start = pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress
-                text_section_end = text_section_start + len(section.get_data())
+    def _load_symbols_elf(self):
+        symbols = []
 
-                m.add_vma(pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress, bytearray(section.get_data()))
+        for section in self._elffile.iter_sections():
+            if not isinstance(section, SymbolTableSection):
+                continue
 
-        if not found:
-            raise Exception("Error loading PE file.")
+            if section['sh_entsize'] == 0:
+                logger.warn("Symbol table {} has a sh_entsize of zero.".format(section.name))
 
-        # for idx, section in enumerate(pe.sections):
-        #     print(section.Name)
+                continue
 
-        #     m.add_vma(pe.OPTIONAL_HEADER.ImageBase + section.VirtualAddress, bytearray(section.get_data()))
+            logger.info("Symbol table {} contains {} entries.".format(section.name, section.num_symbols()))
 
-        pe.close()
+            for symbol in section.iter_symbols():
+                if describe_symbol_shndx(symbol['st_shndx']) != "UND" and \
+                    describe_symbol_type(symbol['st_info']['type']) == "FUNC":
+                    symbols.append((symbol['st_value'], symbol['st_size'], symbol.name))
 
-        self._section_text_start = text_section_start
-        self._section_text_end = text_section_end - 1
-        self._section_text_memory = m
+        return {addr: (name, size, True) for addr, size, name in symbols}
+
+    def _load_symbols_pe(self):
+        # TODO: Implement this
+        return {}
 
     def _get_arch_elf(self, elf_file):
         if elf_file.header['e_machine'] == 'EM_X86_64':
@@ -393,6 +427,180 @@ class BinaryFile(object):
         else:
             raise Exception("Machine not supported.")
 
+
+# Parsed images by path, modification time and size. Images are kept while
+# some component references them.
+_images = weakref.WeakValueDictionary()
+
+
+def load_image(filename):
+    """Get the parsed image of a file. Images are parsed once and shared
+    until the file is modified.
+    """
+    try:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+    except OSError:
+        logger.error("Error loading file: %s", format(filename), exc_info=True)
+
+        raise Exception("Error loading file: {}".format(filename))
+
+    key = (path, stat.st_mtime, stat.st_size)
+
+    image = _images.get(key)
+
+    if image is None:
+        image = BinaryImage(filename)
+
+        _images[key] = image
+
+    return image
+
+
+class BinaryFile(object):
+
+    """Binary file representation.
+    """
+
+    def __init__(self, filename):
+
+        # File name of the binary file.
+        self._filename = filename
+
+        # Section .text.
+        self._section_text = None
+
+        # Start address of the section .text.
+        self._section_text_start = None
+
+        self._section_data_memory = None
+
+        # End address of the section .text (last addressable byte
+        # address).
+        self._section_text_end = None
+
+        # Underlying architecture.
+        self._arch = None
+
+        # Architecture mode.
+        self._arch_mode = None
+
+        # Entry Point.
+        self._entry_point = None
+
+        # Parsed image of the file, shared with the other components that
+        # load it.
+        self._image = None
+
+        # Open file
+        if filename:
+            self._open(filename)
+
+    @property
+    def ea_start(self):
+        """Get start address of section .text.
+        """
+        return self._section_text_start
+
+    @property
+    def ea_end(self):
+        """Get end address of section .text (last addressable byte
+        address).
+
+        """
+        return self._section_text_end
+
+    @property
+    def architecture(self):
+        """Get architecture name.
+        """
+        return self._arch
+
+    @property
+    def architecture_mode(self):
+        """Get architecture mode name.
+        """
+        return self._arch_mode
+
+    @property
+    def filename(self):
+        """Get file name.
+        """
+        return self._filename
+
+    @property
+    def file_format(self):
+        """Get file format ("elf" or "pe").
+        """
+        return self._image.file_format
+
+    @property
+    def text_section(self):
+        """Get section .text.
+        """
+        return self._section_text_memory
+
+    @property
+    def data_section(self):
+        """Get section .data.
+        """
+        return self._section_data_memory
+
+    @property
+    def entry_point(self):
+        """Get entry point.
+        """
+        return self._entry_point
+
+    @property
+    def image(self):
+        """Get parsed image of the file (see load_image).
+        """
+        return self._image
+
+    def _open(self, filename):
+        self._image = load_image(filename)
+
+        self._entry_point = self._image.entry_point
+        self._arch = self._image.architecture
+        self._arch_mode = self._image.architecture_mode
+
+        text = self._image.section(".text")
+
+        if text is None:
+            raise Exception("Error loading {} file.".format(self._image.file_format.upper()))
+
+        self._section_text_start = text.address
+        self._section_text_end = text.address + len(text.data) - 1
+        self._section_text_memory = Memory()
+        self._section_text_memory.add_vma(text.address, text.data)
+
+        if self._image.file_format == "elf":
+            self._open_elf_data()
+
+    def _open_elf_data(self):
+        m = Memory()
+
+        data_addrs_start = []
+        data_addrs_ends = []
+
+        for name in (".data", ".rodata", ".got", ".got.plt"):
+            section = self._image.section(name)
+
+            if section is None:
+                continue
+
+            m.add_vma(section.address, section.data)
+
+            data_addrs_start.append(section.address)
+            data_addrs_ends.append(section.address + section.size)
+
+        if data_addrs_start:
+            self._section_data_start = min(data_addrs_start)
+            self._section_data_end = max(data_addrs_ends) - 1
+
+        self._section_data_memory = m
+
     def _map_architecture(self, bfd_arch_name):
         arch_map = {
             "Intel 386": arch.ARCH_X86,
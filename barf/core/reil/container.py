@@ -42,6 +42,8 @@ class ReilSequence(object):
         self.__assembly = assembly
         self.__sequence = []
         self.__next_seq_address = None
+        self.__compiled = None
+        self.__taint_summary = None
 
     @property
     def assembly(self):
@@ -50,6 +52,10 @@ class ReilSequence(object):
     def append(self, instruction):
         self.__sequence.append(instruction)
 
+        # Invalidate compiled instructions and taint summary.
+        self.__compiled = None
+        self.__taint_summary = None
+
     def fetch(self, address):
         base_addr, index = split_address(address)
 
@@ -94,6 +100,26 @@ class ReilSequence(object):
     def next_sequence_address(self, address):
         self.__next_seq_address = address
 
+    @property
+    def compiled(self):
+        """Get compiled instructions (see ReilCpu.compile_sequence).
+        """
+        return self.__compiled
+
+    @compiled.setter
+    def compiled(self, value):
+        self.__compiled = value
+
+    @property
+    def taint_summary(self):
+        """Get taint summary (see ReilEmulatorTainter.summarize).
+        """
+        return self.__taint_summary
+
+    @taint_summary.setter
+    def taint_summary(self, value):
+        self.__taint_summary = value
+
     def __len__(self):
         return len(self.__sequence)
 
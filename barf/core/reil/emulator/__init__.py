@@ -27,4 +27,10 @@ from __future__ import absolute_import
 from .cpu import *
 from .tainter import *
 from .memory import *
+from .stats import *
+from .hooks import *
+from .intervals import *
 from .emulator import *
+from .jit import *
+from .registers import *
+from .vector import *
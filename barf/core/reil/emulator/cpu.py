@@ -30,15 +30,91 @@ import random
 from barf.core.reil import ReilImmediateOperand
 from barf.core.reil import ReilMnemonic
 from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.emulator.registers import ReilRegisterFile
 from barf.utils.utils import extract_sign_bit
-from barf.utils.utils import extract_value
-from barf.utils.utils import insert_value
 from barf.utils.utils import twos_complement
 
 
 DEBUG = False
 
 
+def _signed_div(op0_val, op0_size, op1_val, op1_size, result_size):
+    op0_sign = op0_val >> op0_size-1
+    op1_sign = op1_val >> op1_size-1
+    result_sign = op0_sign ^ op1_sign
+
+    if op0_sign == 0x1:
+        op0_tmp = twos_complement(op0_val, op0_size)
+    else:
+        op0_tmp = op0_val
+
+    if op1_sign == 0x1:
+        op1_tmp = twos_complement(op1_val, op1_size)
+    else:
+        op1_tmp = op1_val
+
+    result_tmp = op0_tmp // op1_tmp
+
+    if result_sign == 0x1:
+        result = twos_complement(result_tmp, result_size)
+    else:
+        result = result_tmp
+
+    return result & (2**result_size-1)
+
+
+def _signed_mod(op0_val, op0_size, op1_val, op1_size, result_size):
+    quotient = _signed_div(op0_val, op0_size, op1_val, op1_size, result_size)
+
+    remainder = op0_val - (op1_val * quotient)
+
+    return remainder & (2**result_size-1)
+
+
+def _signed_mul(op0_val, op0_size, op1_val, op1_size, result_size):
+    op0_sign = op0_val >> op0_size-1
+    op1_sign = op1_val >> op1_size-1
+    result_sign = op0_sign ^ op1_sign
+
+    if op0_sign == 0x1:
+        op0_tmp = twos_complement(op0_val, op0_size)
+    else:
+        op0_tmp = op0_val
+
+    if op1_sign == 0x1:
+        op1_tmp = twos_complement(op1_val, op1_size)
+    else:
+        op1_tmp = op1_val
+
+    result_tmp = op0_tmp * op1_tmp
+
+    if result_sign == 0x1:
+        result = twos_complement(result_tmp, result_size)
+    else:
+        result = result_tmp
+
+    return result & (2**result_size-1)
+
+
+_binary_ops = {
+    ReilMnemonic.ADD: lambda a, b: a + b,
+    ReilMnemonic.SUB: lambda a, b: a - b,
+    ReilMnemonic.MUL: lambda a, b: a * b,   # unsigned multiplication
+    ReilMnemonic.DIV: lambda a, b: a // b,  # unsigned division
+    ReilMnemonic.MOD: lambda a, b: a % b,   # unsigned modulo
+
+    ReilMnemonic.AND: lambda a, b: a & b,
+    ReilMnemonic.OR:  lambda a, b: a | b,
+    ReilMnemonic.XOR: lambda a, b: a ^ b,
+}
+
+_signed_binary_ops = {
+    ReilMnemonic.SDIV: _signed_div,
+    ReilMnemonic.SMOD: _signed_mod,
+    ReilMnemonic.SMUL: _signed_mul,
+}
+
+
 class ReilCpuZeroDivisionError(Exception):
     pass
 
@@ -61,7 +137,7 @@ class ReilCpu(object):
         self.__arch = arch
 
         # Registers.
-        self.__regs = dict()
+        self.__regs = ReilRegisterFile(arch)
         self.__regs_written = set()
         self.__regs_read = set()
 
@@ -101,6 +177,42 @@ class ReilCpu(object):
             ReilMnemonic.SMUL: self.__execute_binary_op,
         }
 
+        # Instruction compilers.
+        self.__compilers = {
+            # Arithmetic Instructions
+            ReilMnemonic.ADD: self.__compile_binary_op,
+            ReilMnemonic.SUB: self.__compile_binary_op,
+            ReilMnemonic.MUL: self.__compile_binary_op,
+            ReilMnemonic.DIV: self.__compile_binary_op,
+            ReilMnemonic.MOD: self.__compile_binary_op,
+            ReilMnemonic.BSH: self.__compile_bsh,
+
+            # Bitwise Instructions
+            ReilMnemonic.AND: self.__compile_binary_op,
+            ReilMnemonic.OR:  self.__compile_binary_op,
+            ReilMnemonic.XOR: self.__compile_binary_op,
+
+            # Data Transfer Instructions
+            ReilMnemonic.LDM: self.__compile_ldm,
+            ReilMnemonic.STM: self.__compile_stm,
+            ReilMnemonic.STR: self.__compile_str,
+
+            # Conditional Instructions
+            ReilMnemonic.BISZ: self.__compile_bisz,
+            ReilMnemonic.JCC:  self.__compile_jcc,
+
+            # Other Instructions
+            ReilMnemonic.UNDEF: self.__compile_undef,
+            ReilMnemonic.UNKN:  self.__compile_unkn,
+            ReilMnemonic.NOP:   self.__compile_skip,
+
+            # Extensions
+            ReilMnemonic.SEXT: self.__compile_sext,
+            ReilMnemonic.SDIV: self.__compile_binary_op,
+            ReilMnemonic.SMOD: self.__compile_binary_op,
+            ReilMnemonic.SMUL: self.__compile_binary_op,
+        }
+
     def execute(self, instr):
         if DEBUG:
             print("0x%08x:%02x : %s" % (instr.address >> 8,
@@ -111,11 +223,52 @@ class ReilCpu(object):
 
         return next_addr
 
+    def compile(self, instr):
+        """Lower an instruction into a callable.
+
+        Operand kinds, base registers, offsets and masks are resolved
+        once, so the returned callable only performs the actual
+        computation. It takes no arguments and returns the same value
+        as *execute*.
+
+        """
+        if DEBUG:
+            return lambda: self.execute(instr)
+
+        return self.__compilers[instr.mnemonic](instr)
+
+    def compile_sequence(self, sequence):
+        """Return the compiled instructions of a REIL sequence. They
+        are built on first use and cached on the sequence.
+        """
+        cache = sequence.compiled
+
+        if cache is None or cache[0] is not self:
+            cache = (self, [self.compile(instr) for instr in sequence])
+
+            sequence.compiled = cache
+
+        return cache[1]
+
     def reset(self):
-        self.__regs = dict()
+        self.__regs.reset()
         self.__regs_written = set()
         self.__regs_read = set()
 
+    def snapshot(self):
+        """Return a snapshot of the registers (memory is not included).
+        """
+        return self.__regs.snapshot(), frozenset(self.__regs_read), frozenset(self.__regs_written)
+
+    def restore(self, snapshot):
+        """Restore the registers to a snapshot.
+        """
+        regs, regs_read, regs_written = snapshot
+
+        self.__regs.restore(regs)
+        self.__regs_read = set(regs_read)
+        self.__regs_written = set(regs_written)
+
     # Properties
     # ======================================================================== #
     @property
@@ -124,7 +277,13 @@ class ReilCpu(object):
 
     @registers.setter
     def registers(self, value):
-        self.__regs = value
+        # The register file is updated in place, compiled instructions
+        # hold references to it.
+        if value is self.__regs:
+            return
+
+        self.__regs.reset()
+        self.__regs.update(value)
 
     @property
     def memory(self):
@@ -176,32 +335,14 @@ class ReilCpu(object):
 
     # Read/Write auxiliary methods
     # ======================================================================== #
-    def __get_register_info(self, register):
-        if self.__arch and register.name in self.__arch.alias_mapper:
-            base_register, offset = self.__arch.alias_mapper[register.name]
-            base_size = self.__arch.registers_size[base_register]
-        else:
-            base_register, offset = register.name, 0
-            base_size = register.size
-
-        return base_register, base_size, offset
-
-    def __get_register_value(self, register):
-        base_register, base_size, offset = self.__get_register_info(register)
-
-        if base_register not in self.__regs:
-            self.__regs[base_register] = random.randint(0, 2**base_size - 1)
-
-        base_value = self.__regs[base_register]
-
-        return base_register, base_value, offset
-
     def __read_register(self, register):
-        base_register, base_value, offset = self.__get_register_value(register)
-        value = extract_value(base_value, offset, register.size)
+        info = self.__regs.resolve(register.name, register.size)
+        _, base_register, offset, _, mask, _, tracked, _ = info
+
+        value = (self.__regs.read_base(info) >> offset) & mask
 
         # Keep track of native register reads.
-        if self.__arch and register.name in self.__arch.registers_gp_all:
+        if tracked:
             self.__regs_read.add(register.name)
 
         if DEBUG:
@@ -210,13 +351,15 @@ class ReilCpu(object):
         return value
 
     def __write_register(self, register, value):
-        base_register, base_value, offset = self.__get_register_value(register)
-        base_value_new = insert_value(base_value, value, offset, register.size)
+        info = self.__regs.resolve(register.name, register.size)
+        _, base_register, offset, _, mask, clear_mask, tracked, _ = info
+
+        base_value = self.__regs.read_base(info)
 
-        self.__regs[base_register] = base_value_new
+        self.__regs.write_base(info, (base_value & clear_mask) | ((value & mask) << offset))
 
         # Keep track of native register writes.
-        if self.__arch and register.name in self.__arch.registers_gp_all:
+        if tracked:
             self.__regs_written.add(register.name)
 
         if DEBUG:
@@ -318,96 +461,19 @@ class ReilCpu(object):
 
     # Bitwise instructions
     # ======================================================================== #
-    def __signed_div(self, oprnd0, oprnd1, result_size):
-        op0_val = self.read_operand(oprnd0)
-        op1_val = self.read_operand(oprnd1)
-
-        op0_sign = op0_val >> oprnd0.size-1
-        op1_sign = op1_val >> oprnd1.size-1
-        result_sign = op0_sign ^ op1_sign
-
-        if op0_sign == 0x1:
-            op0_tmp = twos_complement(op0_val, oprnd0.size)
-        else:
-            op0_tmp = op0_val
-
-        if op1_sign == 0x1:
-            op1_tmp = twos_complement(op1_val, oprnd1.size)
-        else:
-            op1_tmp = op1_val
-
-        result_tmp = op0_tmp // op1_tmp
-
-        if result_sign == 0x1:
-            result = twos_complement(result_tmp, result_size)
-        else:
-            result = result_tmp
-
-        return result & (2**result_size-1)
-
-    def __signed_mod(self, oprnd0, oprnd1, result_size):
-        op0_val = self.read_operand(oprnd0)
-        op1_val = self.read_operand(oprnd1)
-        quotient = self.__signed_div(oprnd0, oprnd1, result_size)
-
-        remainder = op0_val - (op1_val * quotient)
-
-        return remainder & (2**result_size-1)
-
-    def __signed_mul(self, oprnd0, oprnd1, result_size):
-        op0_val = self.read_operand(oprnd0)
-        op1_val = self.read_operand(oprnd1)
-
-        op0_sign = op0_val >> oprnd0.size-1
-        op1_sign = op1_val >> oprnd1.size-1
-        result_sign = op0_sign ^ op1_sign
-
-        if op0_sign == 0x1:
-            op0_tmp = twos_complement(op0_val, oprnd0.size)
-        else:
-            op0_tmp = op0_val
-
-        if op1_sign == 0x1:
-            op1_tmp = twos_complement(op1_val, oprnd1.size)
-        else:
-            op1_tmp = op1_val
-
-        result_tmp = op0_tmp * op1_tmp
-
-        if result_sign == 0x1:
-            result = twos_complement(result_tmp, result_size)
-        else:
-            result = result_tmp
-
-        return result & (2**result_size-1)
-
     def __execute_binary_op(self, instr):
-        op_map = {
-            ReilMnemonic.ADD: lambda a, b: a + b,
-            ReilMnemonic.SUB: lambda a, b: a - b,
-            ReilMnemonic.MUL: lambda a, b: a * b,   # unsigned multiplication
-            ReilMnemonic.DIV: lambda a, b: a // b,  # unsigned division
-            ReilMnemonic.MOD: lambda a, b: a % b,   # unsigned modulo
-
-            ReilMnemonic.AND: lambda a, b: a & b,
-            ReilMnemonic.OR:  lambda a, b: a | b,
-            ReilMnemonic.XOR: lambda a, b: a ^ b,
-        }
-
         op0_val = self.read_operand(instr.operands[0])
         op1_val = self.read_operand(instr.operands[1])
 
         if instr.mnemonic in [ReilMnemonic.DIV, ReilMnemonic.MOD] and op1_val == 0:
             raise ReilCpuZeroDivisionError()
 
-        if instr.mnemonic in [ReilMnemonic.SDIV]:
-            op2_val = self.__signed_div(instr.operands[0], instr.operands[1], instr.operands[2].size)
-        elif instr.mnemonic in [ReilMnemonic.SMOD]:
-            op2_val = self.__signed_mod(instr.operands[0], instr.operands[1], instr.operands[2].size)
-        elif instr.mnemonic in [ReilMnemonic.SMUL]:
-            op2_val = self.__signed_mul(instr.operands[0], instr.operands[1], instr.operands[2].size)
+        if instr.mnemonic in _signed_binary_ops:
+            op2_val = _signed_binary_ops[instr.mnemonic](op0_val, instr.operands[0].size,
+                                                         op1_val, instr.operands[1].size,
+                                                         instr.operands[2].size)
         else:
-            op2_val = op_map[instr.mnemonic](op0_val, op1_val)
+            op2_val = _binary_ops[instr.mnemonic](op0_val, op1_val)
 
         self.write_operand(instr.operands[2], op2_val)
 
@@ -480,7 +546,7 @@ class ReilCpu(object):
     def __execute_undef(self, instr):
         """Execute UNDEF instruction.
         """
-        op2_val = random.randint(0, instr.operands[2].size)
+        op2_val = random.randint(0, 2**instr.operands[2].size - 1)
 
         self.write_operand(instr.operands[2], op2_val)
 
@@ -514,3 +580,305 @@ class ReilCpu(object):
         self.write_operand(instr.operands[2], op2_val)
 
         return None
+
+    # ======================================================================== #
+    # REIL instructions compilation
+    # ======================================================================== #
+
+    # Operand compilation methods
+    # ======================================================================== #
+    def __compile_read(self, operand):
+        if isinstance(operand, ReilImmediateOperand):
+            value = operand.immediate
+
+            return lambda: value
+
+        if not isinstance(operand, ReilRegisterOperand):
+            raise Exception("Invalid operand type : %s" % str(operand))
+
+        name = operand.name
+        regs = self.__regs
+        info = regs.resolve(name, operand.size)
+        slot, _, offset, base_max, mask, _, track, _ = info
+
+        if slot is not None:
+            values = regs.values
+
+            def read():
+                base_value = values[slot]
+
+                if base_value is None:
+                    base_value = values[slot] = random.randint(0, base_max)
+
+                # Keep track of native register reads.
+                if track:
+                    self.__regs_read.add(name)
+
+                return (base_value >> offset) & mask
+        elif info[7]:
+            temps = regs.temporaries
+
+            def read():
+                if name in temps:
+                    return temps[name] & mask
+
+                temps[name] = base_value = random.randint(0, base_max)
+
+                return base_value & mask
+        else:
+            read_base = regs.read_base
+
+            def read():
+                # Keep track of native register reads.
+                if track:
+                    self.__regs_read.add(name)
+
+                return (read_base(info) >> offset) & mask
+
+        return read
+
+    def __compile_write(self, operand):
+        if not isinstance(operand, ReilRegisterOperand):
+            raise Exception("Invalid operand type : %s" % str(operand))
+
+        name = operand.name
+        regs = self.__regs
+        info = regs.resolve(name, operand.size)
+        slot, _, offset, base_max, mask, clear_mask, track, _ = info
+
+        if slot is not None:
+            values = regs.values
+
+            if offset == 0 and mask == base_max:
+                # The register covers its base register completely, there
+                # is no previous value to preserve.
+                def write(value):
+                    values[slot] = value & mask
+
+                    # Keep track of native register writes.
+                    if track:
+                        self.__regs_written.add(name)
+            else:
+                def write(value):
+                    base_value = values[slot]
+
+                    if base_value is None:
+                        base_value = random.randint(0, base_max)
+
+                    values[slot] = (base_value & clear_mask) | ((value & mask) << offset)
+
+                    # Keep track of native register writes.
+                    if track:
+                        self.__regs_written.add(name)
+        elif info[7]:
+            temps = regs.temporaries
+
+            if offset == 0 and mask == base_max:
+                def write(value):
+                    temps[name] = value & mask
+            else:
+                def write(value):
+                    base_value = temps[name] if name in temps else random.randint(0, base_max)
+
+                    temps[name] = (base_value & clear_mask) | ((value & mask) << offset)
+        elif offset == 0 and mask == base_max:
+            write_base = regs.write_base
+
+            def write(value):
+                write_base(info, value & mask)
+
+                # Keep track of native register writes.
+                if track:
+                    self.__regs_written.add(name)
+        else:
+            read_base, write_base = regs.read_base, regs.write_base
+
+            def write(value):
+                base_value = read_base(info)
+
+                write_base(info, (base_value & clear_mask) | ((value & mask) << offset))
+
+                # Keep track of native register writes.
+                if track:
+                    self.__regs_written.add(name)
+
+        return write
+
+    # Arithmetic instructions
+    # ======================================================================== #
+    def __compile_bsh(self, instr):
+        read_op0 = self.__compile_read(instr.operands[0])
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        op1 = instr.operands[1]
+
+        if isinstance(op1, ReilImmediateOperand):
+            # The shift direction and amount are known beforehand.
+            op1_val = op1.immediate
+
+            if extract_sign_bit(op1_val, op1.size) == 0:
+                def execute():
+                    write_op2(read_op0() << op1_val)
+            else:
+                shift = twos_complement(op1_val, op1.size)
+
+                def execute():
+                    write_op2(read_op0() >> shift)
+
+            return execute
+
+        read_op1 = self.__compile_read(op1)
+        op1_size = op1.size
+
+        def execute():
+            op0_val = read_op0()
+            op1_val = read_op1()
+
+            # Check sign bit.
+            if extract_sign_bit(op1_val, op1_size) == 0:
+                write_op2(op0_val << op1_val)
+            else:
+                write_op2(op0_val >> twos_complement(op1_val, op1_size))
+
+        return execute
+
+    def __compile_binary_op(self, instr):
+        read_op0 = self.__compile_read(instr.operands[0])
+        read_op1 = self.__compile_read(instr.operands[1])
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        if instr.mnemonic in _signed_binary_ops:
+            signed_op = _signed_binary_ops[instr.mnemonic]
+
+            op0_size = instr.operands[0].size
+            op1_size = instr.operands[1].size
+            op2_size = instr.operands[2].size
+
+            def execute():
+                op0_val = read_op0()
+                op1_val = read_op1()
+
+                write_op2(signed_op(op0_val, op0_size, op1_val, op1_size, op2_size))
+        elif instr.mnemonic in [ReilMnemonic.DIV, ReilMnemonic.MOD]:
+            op = _binary_ops[instr.mnemonic]
+
+            def execute():
+                op0_val = read_op0()
+                op1_val = read_op1()
+
+                if op1_val == 0:
+                    raise ReilCpuZeroDivisionError()
+
+                write_op2(op(op0_val, op1_val))
+        else:
+            op = _binary_ops[instr.mnemonic]
+
+            def execute():
+                write_op2(op(read_op0(), read_op1()))
+
+        return execute
+
+    # Data transfer instructions
+    # ======================================================================== #
+    def __compile_ldm(self, instr):
+        assert instr.operands[0].size == self.__mem.address_size
+        assert instr.operands[2].size in [8, 16, 32, 64, 128, 256]
+
+        read_op0 = self.__compile_read(instr.operands[0])
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        size = instr.operands[2].size // 8
+
+        def execute():
+            write_op2(self.__mem.read(read_op0(), size))
+
+        return execute
+
+    def __compile_stm(self, instr):
+        assert instr.operands[0].size in [8, 16, 32, 64, 128, 256]
+        assert instr.operands[2].size == self.__mem.address_size
+
+        read_op0 = self.__compile_read(instr.operands[0])
+        read_op2 = self.__compile_read(instr.operands[2])
+
+        size = instr.operands[0].size // 8
+
+        def execute():
+            op0_val = read_op0()    # Data.
+            op2_val = read_op2()    # Memory address.
+
+            self.__mem.write(op2_val, size, op0_val)
+
+        return execute
+
+    def __compile_str(self, instr):
+        read_op0 = self.__compile_read(instr.operands[0])
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        def execute():
+            write_op2(read_op0())
+
+        return execute
+
+    # Conditional instructions
+    # ======================================================================== #
+    def __compile_bisz(self, instr):
+        read_op0 = self.__compile_read(instr.operands[0])
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        def execute():
+            write_op2(1 if read_op0() == 0 else 0)
+
+        return execute
+
+    def __compile_jcc(self, instr):
+        read_op0 = self.__compile_read(instr.operands[0])  # Branch condition.
+        read_op2 = self.__compile_read(instr.operands[2])  # Target address.
+
+        def execute():
+            op0_val = read_op0()
+            op2_val = read_op2()
+
+            return op2_val if op0_val != 0 else None
+
+        return execute
+
+    # Other instructions
+    # ======================================================================== #
+    def __compile_undef(self, instr):
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        max_value = 2**instr.operands[2].size - 1
+
+        def execute():
+            write_op2(random.randint(0, max_value))
+
+        return execute
+
+    def __compile_unkn(self, instr):
+        def execute():
+            raise ReilCpuInvalidInstruction()
+
+        return execute
+
+    def __compile_skip(self, instr):
+        return lambda: None
+
+    # REIL extension instructions
+    # ======================================================================== #
+    def __compile_sext(self, instr):
+        read_op0 = self.__compile_read(instr.operands[0])
+        write_op2 = self.__compile_write(instr.operands[2])
+
+        op0_size = instr.operands[0].size
+        op2_mask = (2**instr.operands[2].size-1) & ~(2**op0_size-1)
+
+        def execute():
+            op0_val = read_op0()
+
+            if extract_sign_bit(op0_val, op0_size) == 1:
+                op0_val |= op2_mask
+
+            write_op2(op0_val)
+
+        return execute
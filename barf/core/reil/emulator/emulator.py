@@ -38,21 +38,46 @@ list of instruction and a start address (REIL address). The second, is a
 more performing emulation where the list of instruction is execute from
 beginning to end not considering branches.
 
+Instructions that belong to a **ReilSequence** are compiled by the CPU
+into specialized callables the first time they are executed. These are
+cached on the sequence and reused from then on.
+
 ReilMemory
 ----------
 
 Byte addressable memory based on a dictionary.
 
+Snapshots
+---------
+
+The state of the emulator can be saved with **snapshot** and brought back
+with **restore**. **fork** creates an independent copy of the emulator.
+Memory is shared between snapshots page by page and a page is only copied
+the first time it is written.
+
+Taint
+-----
+
+Taint propagation is opt-in: it is an instruction hook that is enabled by
+**enable_taint**, by the **set_*_taint** methods (when they taint
+something) and by restoring a snapshot that holds taint. Until then,
+instructions are executed without propagating taint, so taint queries
+return nothing tainted.
+
 """
 from __future__ import absolute_import
 
 import logging
 
 from barf.core.reil.container import ReilContainerInvalidAddressError
+from barf.core.reil.container import ReilSequence
 from barf.core.reil.emulator import ReilCpu
 from barf.core.reil.emulator import ReilCpuInvalidAddressError
+from barf.core.reil.emulator import ReilEmulatorStats
+from barf.core.reil.emulator import ReilHookTable
 from barf.core.reil.emulator import ReilEmulatorTainter
 from barf.core.reil.emulator import ReilMemoryEx
+from barf.core.reil.helpers import split_address
 
 
 logger = logging.getLogger("reilemulator")
@@ -75,17 +100,43 @@ class ReilEmulator(object):
         # An instance of a ReilTainter.
         self.__tainter = ReilEmulatorTainter(self, arch=self.__arch)
 
-        # Instructions pre and post handlers.
-        self.__instr_handler_pre = None, None
-        self.__instr_handler_post = None, None
+        # Instructions pre and post hooks.
+        self.__hooks_pre = ReilHookTable()
+        self.__hooks_post = ReilHookTable()
+
+        # Handles of the hooks set through the instruction handler methods
+        # and of the taint propagation hook.
+        self.__instr_handler_pre = None
+        self.__instr_handler_post = None
+        self.__taint_hook = None
+
+        # Whether taint is propagated with sequence summaries when
+        # possible (see execute_sequence).
+        self.__taint_summaries = True
 
-        self.__set_default_handlers()
+        # Execution statistics (None when disabled).
+        self.__stats = None
+
+        # Whether instructions go through the hooked path (hooks or
+        # statistics are enabled).
+        self.__hooked = False
 
     # Execution methods
     # ======================================================================== #
     def execute(self, container, start=None, end=None, registers=None):
         """Execute instructions.
         """
+        if self.__stats:
+            self.__stats.start()
+
+            try:
+                return self.__execute(container, start, end, registers)
+            finally:
+                self.__stats.stop()
+
+        return self.__execute(container, start, end, registers)
+
+    def __execute(self, container, start, end, registers):
         if registers:
             self.__cpu.registers = dict(registers)
 
@@ -93,13 +144,17 @@ class ReilEmulator(object):
 
         while ip and ip != end:
             try:
-                instr = container.fetch(ip)
+                sequence = container.fetch_sequence(ip)
             except ReilContainerInvalidAddressError:
                 logger.info("Invalid address: {:#010x}:{:#02x}".format(ip >> 8, ip & 0xff))
 
                 raise ReilCpuInvalidAddressError()
 
-            next_ip = self.__execute_one(instr)
+            _, index = split_address(ip)
+
+            code = self.__cpu.compile_sequence(sequence)
+
+            next_ip = self.__execute_one(sequence.get(index), code[index])
 
             ip = next_ip if next_ip else container.get_next_address(ip)
 
@@ -107,35 +162,160 @@ class ReilEmulator(object):
 
     def execute_lite(self, instructions, context=None):
         """Execute a list of instructions. It does not support loops.
+
+        If *instructions* is a ReilSequence, its compiled instructions
+        are used (and cached for subsequent executions).
+
         """
+        if self.__stats:
+            self.__stats.start()
+
+            try:
+                return self.__execute_lite(instructions, context)
+            finally:
+                self.__stats.stop()
+
+        return self.__execute_lite(instructions, context)
+
+    def __execute_lite(self, instructions, context):
         if context:
             self.__cpu.registers = dict(context)
 
-        for instr in instructions:
-            self.__execute_one(instr)
+        if isinstance(instructions, ReilSequence):
+            code = self.__cpu.compile_sequence(instructions)
+
+            for instr, fn in zip(instructions, code):
+                self.__execute_one(instr, fn)
+        else:
+            for instr in instructions:
+                self.__execute_one(instr)
 
         return dict(self.__cpu.registers), self.__mem
 
+    def execute_sequence(self, sequence, index=0):
+        """Execute a sequence (the translation of a native instruction)
+        starting at the given index.
+
+        Return the REIL address where execution continues when a branch
+        leaves the sequence or goes back to its start, which executes the
+        native instruction again (for example, ``jmp $`` or an iteration
+        of a rep prefixed instruction). Otherwise, return the sequence's
+        next sequence address.
+
+        """
+        code = self.__cpu.compile_sequence(sequence)
+
+        base_addr, _ = split_address(sequence.address)
+        count = len(code)
+
+        execute_one = self.__execute_one
+        summary = None
+
+        # When taint propagation is the only hook, the taint summary of
+        # the sequence is applied once it has been executed instead of
+        # tainting each instruction.
+        if index == 0 and self.__taint_hook and self.__taint_summaries and \
+                not self.__stats and not self.__hooks_pre and len(self.__hooks_post) == 1:
+            summary = self.__tainter.summarize(sequence)
+
+            if summary:
+                execute_one = self.__execute_untainted
+
+        while index < count:
+            next_ip = execute_one(sequence.get(index), code[index])
+
+            if next_ip:
+                next_base_addr, index = split_address(next_ip)
+
+                if next_base_addr != base_addr or index == 0:
+                    break
+
+                # A branch within the sequence, the instructions from the
+                # target on are tainted one by one.
+                if summary:
+                    self.__tainter.apply_summary(summary)
+
+                    summary = None
+                    execute_one = self.__execute_one
+            else:
+                index += 1
+        else:
+            next_ip = sequence.next_sequence_address
+
+        if summary:
+            self.__tainter.apply_summary(summary)
+
+        return next_ip
+
     def single_step(self, instruction):
         return self.__execute_one(instruction)
 
-    def __execute_one(self, instruction):
-        # Execute pre instruction handlers
-        handler_fn_pre, handler_param_pre = self.__instr_handler_pre
-        handler_fn_pre(self, instruction, handler_param_pre)
+    def __execute_one(self, instruction, fn=None):
+        # The hooked path is only taken when there is something to do
+        # besides executing instructions (see __update_hooked).
+        if self.__hooked:
+            return self.__execute_one_hooked(instruction, fn)
 
-        # Execute instruction
-        next_addr = self.__cpu.execute(instruction)
+        if fn:
+            return fn()
 
-        # Taint instruction
-        self.__tainter.taint(instruction)
+        return self.__cpu.execute(instruction)
+
+    def __execute_untainted(self, instruction, fn):
+        # Used while the taint hook is the only one and it is replaced by
+        # a sequence summary.
+        return fn()
+
+    def __execute_one_hooked(self, instruction, fn=None):
+        if self.__stats:
+            self.__stats.reil_instrs[instruction.mnemonic] += 1
+
+        # Execute pre instruction hooks
+        if self.__hooks_pre:
+            self.__hooks_pre.dispatch(self, instruction)
+
+        # Execute instruction
+        if fn:
+            next_addr = fn()
+        else:
+            next_addr = self.__cpu.execute(instruction)
 
-        # Execute post instruction handlers
-        handler_fn_post, handler_param_post = self.__instr_handler_post
-        handler_fn_post(self, instruction, handler_param_post)
+        # Execute post instruction hooks (taint propagation included)
+        if self.__hooks_post:
+            self.__hooks_post.dispatch(self, instruction)
 
         return next_addr
 
+    def __update_hooked(self):
+        self.__hooked = bool(self.__stats or self.__hooks_pre or self.__hooks_post)
+
+    # Statistics methods
+    # ======================================================================== #
+    def enable_stats(self):
+        """Start collecting execution statistics. Statistics have no cost
+        while they are disabled.
+        """
+        if self.__stats:
+            return self.__stats
+
+        self.__stats = ReilEmulatorStats()
+        self.__stats.attach_memory(self.__mem)
+
+        self.__update_hooked()
+
+        return self.__stats
+
+    def disable_stats(self):
+        """Stop collecting execution statistics.
+        """
+        if not self.__stats:
+            return
+
+        self.__stats.detach_memory(self.__mem)
+        self.__stats = None
+
+        self.__update_hooked()
+
     # Reset methods
     # ======================================================================== #
     def reset(self):
@@ -145,11 +325,15 @@ class ReilEmulator(object):
         self.__cpu.reset()
         self.__tainter.reset()
 
-        # Instructions pre and post handlers.
-        self.__instr_handler_pre = None, None
-        self.__instr_handler_post = None, None
+        # Instructions pre and post hooks.
+        self.__hooks_pre.clear()
+        self.__hooks_post.clear()
+
+        self.__instr_handler_pre = None
+        self.__instr_handler_post = None
+        self.__taint_hook = None
 
-        self.__set_default_handlers()
+        self.__update_hooked()
 
     def reset_memory(self):
         self.__mem.reset()
@@ -160,21 +344,141 @@ class ReilEmulator(object):
     def reset_tainter(self):
         self.__tainter.reset()
 
-    # Instruction's handler methods
+    # Snapshot methods
+    # ======================================================================== #
+    def snapshot(self):
+        """Return a snapshot of the emulator state (registers, memory and
+        taint information). Memory pages are shared copy-on-write, so
+        taking a snapshot does not copy the memory.
+        """
+        return self.__cpu.snapshot(), self.__mem.snapshot(), self.__tainter.snapshot()
+
+    def restore(self, snapshot):
+        """Restore the emulator state to a snapshot. A snapshot can be
+        restored any number of times.
+        """
+        cpu, memory, tainter = snapshot
+
+        self.__cpu.restore(cpu)
+        self.__mem.restore(memory)
+        self.__tainter.restore(tainter)
+
+        if any(tainter):
+            self.enable_taint()
+
+    def fork(self):
+        """Return a new emulator with the same state (and instruction
+        hooks) as this one. Both emulators share memory pages until
+        they are written.
+        """
+        emulator = ReilEmulator(self.__arch, memory=self.__mem.fork())
+
+        emulator.__hooks_pre = self.__hooks_pre.copy()
+        emulator.__hooks_post = self.__hooks_post.copy()
+
+        emulator.__instr_handler_pre = self.__instr_handler_pre
+        emulator.__instr_handler_post = self.__instr_handler_post
+        emulator.__taint_hook = self.__taint_hook
+        emulator.__taint_summaries = self.__taint_summaries
+
+        emulator.__update_hooked()
+
+        emulator.restore(self.snapshot())
+
+        return emulator
+
+    # Instruction's hook methods
     # ======================================================================== #
+    def add_hook(self, func, parameter=None, mnemonics=None, addresses=None, pre=False, priority=0):
+        """Add an instruction hook, ``func(emulator, instruction, parameter)``.
+
+        The hook is called after (or before, if *pre* is set) executing
+        each instruction. It can be restricted to a set of mnemonics
+        and/or (REIL) addresses. Return a handle to remove it.
+
+        """
+        hooks = self.__hooks_pre if pre else self.__hooks_post
+
+        handle = hooks.add(func, parameter, mnemonics=mnemonics, addresses=addresses, priority=priority)
+
+        self.__update_hooked()
+
+        return handle
+
+    def remove_hook(self, handle):
+        """Remove an instruction hook.
+        """
+        if not self.__hooks_pre.remove(handle) and not self.__hooks_post.remove(handle):
+            raise KeyError(handle)
+
+        self.__update_hooked()
+
     def set_instruction_pre_handler(self, func, parameter):
-        self.__instr_handler_pre = (func, parameter)
+        """Set the hook that is called before executing each instruction.
+        It replaces the one previously set with this method.
+        """
+        if self.__instr_handler_pre:
+            self.remove_hook(self.__instr_handler_pre)
+
+        self.__instr_handler_pre = self.add_hook(func, parameter, pre=True)
 
     def set_instruction_post_handler(self, func, parameter):
-        self.__instr_handler_post = (func, parameter)
+        """Set the hook that is called after executing each instruction.
+        It replaces the one previously set with this method.
+        """
+        if self.__instr_handler_post:
+            self.remove_hook(self.__instr_handler_post)
+
+        self.__instr_handler_post = self.add_hook(func, parameter)
+
+    @property
+    def hooked(self):
+        """Return whether there are instruction hooks (taint propagation
+        included).
+        """
+        return bool(self.__hooks_pre or self.__hooks_post)
 
-    # Instruction's handler auxiliary methods
+    # Taint propagation methods
     # ======================================================================== #
-    def __set_default_handlers(self):
-        empty_fn, empty_param = lambda emu, instr, param: None, None
+    def enable_taint(self):
+        """Propagate taint information while executing instructions.
+        Propagation is enabled automatically when something is tainted
+        (set_*_taint) or a snapshot with taint is restored; otherwise,
+        instructions do not propagate taint.
+        """
+        if self.__taint_hook:
+            return
+
+        # Taint is propagated before calling the other post hooks.
+        self.__taint_hook = self.add_hook(ReilEmulator.__taint_instruction, priority=-1)
+
+    def disable_taint(self):
+        """Stop propagating taint information.
+        """
+        if not self.__taint_hook:
+            return
+
+        self.remove_hook(self.__taint_hook)
+
+        self.__taint_hook = None
+
+    @property
+    def taint_enabled(self):
+        return self.__taint_hook is not None
+
+    @property
+    def taint_summaries(self):
+        """Return whether execute_sequence propagates taint with sequence
+        summaries (see ReilEmulatorTainter.summarize).
+        """
+        return self.__taint_summaries
+
+    @taint_summaries.setter
+    def taint_summaries(self, value):
+        self.__taint_summaries = value
 
-        self.__instr_handler_pre = (empty_fn, empty_param)
-        self.__instr_handler_post = (empty_fn, empty_param)
+    def __taint_instruction(self, instruction, parameter):
+        self.__tainter.taint(instruction)
 
     # Read/Write methods
     # ======================================================================== #
@@ -192,10 +496,26 @@ class ReilEmulator(object):
 
     # Taint methods
     # ======================================================================== #
+    def taint_label(self, name):
+        """Return the taint mask of a label (see ReilEmulatorTainter).
+        """
+        return self.__tainter.taint_label(name)
+
+    def taint_labels(self, mask):
+        """Return the set of label names of a taint mask.
+        """
+        return self.__tainter.taint_labels(mask)
+
     def get_operand_taint(self, register):
         return self.__tainter.get_operand_taint(register)
 
+    def get_operand_taint_mask(self, register):
+        return self.__tainter.get_operand_taint_mask(register)
+
     def set_operand_taint(self, register, value):
+        if value:
+            self.enable_taint()
+
         self.__tainter.set_operand_taint(register, value)
 
     def clear_operand_taint(self, register):
@@ -204,7 +524,13 @@ class ReilEmulator(object):
     def get_register_taint(self, register):
         return self.__tainter.get_register_taint(register)
 
+    def get_register_taint_mask(self, register):
+        return self.__tainter.get_register_taint_mask(register)
+
     def set_register_taint(self, register, value):
+        if value:
+            self.enable_taint()
+
         self.__tainter.set_register_taint(register, value)
 
     def clear_register_taint(self, register):
@@ -213,7 +539,13 @@ class ReilEmulator(object):
     def get_memory_taint(self, address, size):
         return self.__tainter.get_memory_taint(address, size)
 
+    def get_memory_taint_mask(self, address, size):
+        return self.__tainter.get_memory_taint_mask(address, size)
+
     def set_memory_taint(self, address, size, value):
+        if value:
+            self.enable_taint()
+
         self.__tainter.set_memory_taint(address, size, value)
 
     def clear_memory_taint(self, address, size):
@@ -245,6 +577,12 @@ class ReilEmulator(object):
         """
         return self.__cpu
 
+    @property
+    def stats(self):
+        """Return execution statistics (None if they are disabled).
+        """
+        return self.__stats
+
     @property
     def read_registers(self):
         """Return read (native) registers.
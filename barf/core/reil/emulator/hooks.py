@@ -0,0 +1,149 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Instruction hooks for the REIL emulator.
+
+A hook is a function with signature ``fn(emulator, instruction, param)``.
+It can be subscribed to every instruction, to a set of mnemonics or to a
+set of (REIL) addresses, or to both (the instruction has to match both
+sets). Hooks subscribed to every instruction run first, then the ones
+subscribed by mnemonic and then the ones subscribed by address. Within
+each group, hooks run in order of priority (lower first) and then in
+order of registration.
+"""
+from __future__ import absolute_import
+
+import itertools
+
+
+# Hook handles are unique among all tables, so tables can be copied.
+_hook_handles = itertools.count(1)
+
+
+class ReilHookTable(object):
+
+    """Set of hooks that run at the same point of the execution of an
+    instruction (before or after it).
+    """
+
+    def __init__(self):
+        # Hooks, list of (priority, handle, function, parameter, mnemonics,
+        # addresses).
+        self.__entries = []
+
+        # Dispatch tables.
+        self.__any = []
+        self.__by_mnemonic = {}
+        self.__by_address = {}
+
+    def add(self, func, parameter=None, mnemonics=None, addresses=None, priority=0):
+        """Add a hook and return its handle.
+        """
+        handle = next(_hook_handles)
+
+        mnemonics = frozenset(mnemonics) if mnemonics is not None else None
+        addresses = frozenset(addresses) if addresses is not None else None
+
+        self.__entries.append((priority, handle, func, parameter, mnemonics, addresses))
+        self.__entries.sort(key=lambda entry: entry[:2])
+
+        self.__build()
+
+        return handle
+
+    def remove(self, handle):
+        """Remove a hook. Return whether it was found.
+        """
+        entries = [entry for entry in self.__entries if entry[1] != handle]
+
+        if len(entries) == len(self.__entries):
+            return False
+
+        self.__entries = entries
+
+        self.__build()
+
+        return True
+
+    def clear(self):
+        self.__entries = []
+
+        self.__build()
+
+    def dispatch(self, emulator, instruction):
+        """Call the hooks that are subscribed to an instruction.
+        """
+        for func, parameter in self.__any:
+            func(emulator, instruction, parameter)
+
+        if self.__by_mnemonic:
+            for func, parameter in self.__by_mnemonic.get(instruction.mnemonic, ()):
+                func(emulator, instruction, parameter)
+
+        if self.__by_address:
+            for func, parameter in self.__by_address.get(instruction.address, ()):
+                func(emulator, instruction, parameter)
+
+    def copy(self):
+        table = ReilHookTable()
+
+        table.__entries = list(self.__entries)
+        table.__build()
+
+        return table
+
+    def __contains__(self, handle):
+        return any(entry[1] == handle for entry in self.__entries)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __build(self):
+        self.__any = []
+        self.__by_mnemonic = {}
+        self.__by_address = {}
+
+        for _, _, func, parameter, mnemonics, addresses in self.__entries:
+            if addresses is not None:
+                if mnemonics is not None:
+                    func = _filter_mnemonics(func, mnemonics)
+
+                for address in addresses:
+                    self.__by_address.setdefault(address, []).append((func, parameter))
+            elif mnemonics is not None:
+                for mnemonic in mnemonics:
+                    self.__by_mnemonic.setdefault(mnemonic, []).append((func, parameter))
+            else:
+                self.__any.append((func, parameter))
+
+
+def _filter_mnemonics(func, mnemonics):
+    def hook(emulator, instruction, parameter):
+        if instruction.mnemonic in mnemonics:
+            func(emulator, instruction, parameter)
+
+    return hook
@@ -0,0 +1,142 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Interval map used to keep memory taint information.
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_left
+from bisect import bisect_right
+
+
+class ReilIntervalMap(object):
+
+    """Map from addresses to values, stored as sorted disjoint intervals
+    [start, end). Adjacent intervals with the same value are merged.
+    Addresses that are not mapped have no value (None).
+    """
+
+    def __init__(self):
+        self.__starts = []
+        self.__ends = []
+        self.__values = []
+
+    def set(self, start, end, value):
+        """Set the value of a range. A false value (None, False, 0) clears
+        the range.
+        """
+        if start >= end:
+            return
+
+        starts, ends, values = self.__starts, self.__ends, self.__values
+
+        # Intervals i..j-1 overlap [start, end).
+        i = bisect_right(ends, start)
+        j = bisect_left(starts, end)
+
+        intervals = []
+
+        if i < j and starts[i] < start:
+            intervals.append((starts[i], start, values[i]))
+
+        if value:
+            intervals.append((start, end, value))
+
+        if i < j and ends[j - 1] > end:
+            intervals.append((end, ends[j - 1], values[j - 1]))
+
+        # Include adjacent intervals, so they can be merged.
+        if i > 0 and ends[i - 1] == start:
+            i -= 1
+            intervals.insert(0, (starts[i], ends[i], values[i]))
+
+        if j < len(starts) and starts[j] == end:
+            intervals.append((starts[j], ends[j], values[j]))
+            j += 1
+
+        merged = []
+
+        for interval in intervals:
+            if merged and merged[-1][1] == interval[0] and merged[-1][2] == interval[2]:
+                merged[-1] = (merged[-1][0], interval[1], interval[2])
+            else:
+                merged.append(interval)
+
+        starts[i:j] = [interval[0] for interval in merged]
+        ends[i:j] = [interval[1] for interval in merged]
+        values[i:j] = [interval[2] for interval in merged]
+
+    def clear(self, start, end):
+        """Clear a range.
+        """
+        self.set(start, end, None)
+
+    def get(self, address):
+        """Return the value of an address (None if it is not mapped).
+        """
+        i = bisect_right(self.__starts, address) - 1
+
+        if i >= 0 and address < self.__ends[i]:
+            return self.__values[i]
+
+        return None
+
+    def any(self, start, end):
+        """Return whether any address of a range is mapped.
+        """
+        i = bisect_right(self.__ends, start)
+
+        return i < len(self.__starts) and self.__starts[i] < end
+
+    def values(self, start, end):
+        """Return the values of the intervals that overlap a range.
+        """
+        i = bisect_right(self.__ends, start)
+        j = bisect_left(self.__starts, end)
+
+        return self.__values[i:j]
+
+    def intervals(self):
+        """Return the list of intervals, as tuples (start, end, value).
+        """
+        return list(zip(self.__starts, self.__ends, self.__values))
+
+    def reset(self):
+        self.__starts = []
+        self.__ends = []
+        self.__values = []
+
+    # Snapshot methods
+    # ======================================================================== #
+    def snapshot(self):
+        return tuple(self.intervals())
+
+    def restore(self, snapshot):
+        self.__starts = [interval[0] for interval in snapshot]
+        self.__ends = [interval[1] for interval in snapshot]
+        self.__values = [interval[2] for interval in snapshot]
+
+    def __len__(self):
+        return len(self.__starts)
@@ -0,0 +1,516 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+This module contains a block compiler for REIL. It turns the REIL
+translation of a native basic block into a single Python function. The
+function is generated as source code and compiled with *compile()*.
+
+Registers are kept in local variables while the block executes and they
+are written back to the register dictionary when the block exits (either
+normally or because of an exception). Temporary registers never leave
+the function.
+
+The generated function has the following signature:
+
+    block(regs, mem) -> next REIL address or None
+
+where *regs* is a ReilRegisterFile and *mem* a ReilMemory.
+
+Only straight-line code is supported: a JCC instruction can only appear
+as the last instruction of the block and it must transfer control
+outside of it. UNKN instructions are not supported either. Use
+**ReilBlockCompiler.check_sequence** to find out whether a sequence can
+be part of a block.
+
+"""
+from __future__ import absolute_import
+
+import random
+
+from barf.core.reil import ReilImmediateOperand
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.emulator.cpu import ReilCpuZeroDivisionError
+from barf.core.reil.emulator.cpu import _signed_div
+from barf.core.reil.emulator.cpu import _signed_mod
+from barf.core.reil.emulator.cpu import _signed_mul
+from barf.core.reil.emulator.registers import register_slots
+from barf.core.reil.helpers import split_address
+
+
+# Sequence kinds (see ReilBlockCompiler.check_sequence).
+SEQUENCE_INVALID = 0        # It cannot be compiled.
+SEQUENCE_STRAIGHT = 1       # It does not branch.
+SEQUENCE_BRANCH = 2         # It ends with a branch out of the sequence.
+
+
+class ReilBlockCompilerError(Exception):
+    pass
+
+
+class ReilBlockCompiler(object):
+
+    """Compile blocks of REIL instructions into Python functions.
+    """
+
+    def __init__(self, arch):
+        # Architecture information.
+        self.__arch = arch
+
+        # Register file slots.
+        self.__slots = register_slots(arch)
+
+        # Statement generators.
+        self.__generators = {
+            # Arithmetic Instructions
+            ReilMnemonic.ADD: self.__gen_binary_op,
+            ReilMnemonic.SUB: self.__gen_binary_op,
+            ReilMnemonic.MUL: self.__gen_binary_op,
+            ReilMnemonic.DIV: self.__gen_div,
+            ReilMnemonic.MOD: self.__gen_div,
+            ReilMnemonic.BSH: self.__gen_bsh,
+
+            # Bitwise Instructions
+            ReilMnemonic.AND: self.__gen_binary_op,
+            ReilMnemonic.OR:  self.__gen_binary_op,
+            ReilMnemonic.XOR: self.__gen_binary_op,
+
+            # Data Transfer Instructions
+            ReilMnemonic.LDM: self.__gen_ldm,
+            ReilMnemonic.STM: self.__gen_stm,
+            ReilMnemonic.STR: self.__gen_str,
+
+            # Conditional Instructions
+            ReilMnemonic.BISZ: self.__gen_bisz,
+
+            # Other Instructions
+            ReilMnemonic.UNDEF: self.__gen_undef,
+            ReilMnemonic.NOP:   self.__gen_nop,
+
+            # Extensions
+            ReilMnemonic.SEXT: self.__gen_sext,
+            ReilMnemonic.SDIV: self.__gen_signed_op,
+            ReilMnemonic.SMOD: self.__gen_signed_op,
+            ReilMnemonic.SMUL: self.__gen_signed_op,
+        }
+
+    def check_sequence(self, sequence):
+        """Classify a sequence (the translation of a native
+        instruction) according to how it can be compiled.
+        """
+        instrs = list(sequence)
+
+        if not instrs:
+            return SEQUENCE_INVALID
+
+        for index, instr in enumerate(instrs):
+            if instr.mnemonic == ReilMnemonic.UNKN:
+                return SEQUENCE_INVALID
+
+            if instr.mnemonic == ReilMnemonic.JCC and index != len(instrs) - 1:
+                return SEQUENCE_INVALID
+
+        last = instrs[-1]
+
+        if last.mnemonic != ReilMnemonic.JCC:
+            return SEQUENCE_STRAIGHT
+
+        # Intra-instruction branches are not supported.
+        target = last.operands[2]
+
+        if isinstance(target, ReilImmediateOperand):
+            if split_address(target.immediate)[0] == split_address(last.address)[0]:
+                return SEQUENCE_INVALID
+
+        return SEQUENCE_BRANCH
+
+    def compile(self, sequences, name="block"):
+        """Compile a list of sequences (instruction lists) into a
+        function. Each sequence can be preceded by extra instructions
+        (for example, an instruction pointer update).
+        """
+        source = self.generate(sequences, name=name)
+
+        namespace = {
+            "randint": random.randint,
+            "ReilCpuZeroDivisionError": ReilCpuZeroDivisionError,
+            "signed_div": _signed_div,
+            "signed_mod": _signed_mod,
+            "signed_mul": _signed_mul,
+        }
+
+        code = compile(source, "<reil-block {}>".format(name), "exec")
+
+        exec(code, namespace)
+
+        return namespace[name]
+
+    def generate(self, sequences, name="block"):
+        """Generate the source code of a block.
+        """
+        instrs = [instr for sequence in sequences for instr in sequence]
+
+        for index, instr in enumerate(instrs):
+            if instr.mnemonic == ReilMnemonic.UNKN:
+                raise ReilBlockCompilerError("Unknown instruction: {}".format(instr))
+
+            if instr.mnemonic == ReilMnemonic.JCC and index != len(instrs) - 1:
+                raise ReilBlockCompilerError("Branch in the middle of a block: {}".format(instr))
+
+        self.__bases = {}           # Base register name -> size
+        self.__loaded = set()       # Base registers loaded at entry
+        self.__written = set()      # Base registers written
+        self.__temps = {}           # Temporary register name -> size
+        self.__body = []
+        self.__tmp_count = 0
+
+        for instr in instrs:
+            if instr.mnemonic == ReilMnemonic.JCC:
+                self.__gen_jcc(instr)
+            else:
+                self.__generators[instr.mnemonic](instr)
+
+        lines = ["def {}(regs, mem):".format(name)]
+
+        lines += ["    values = regs.values"]
+
+        # Load registers.
+        for base in sorted(self.__loaded):
+            var, mask = self.__var(base), 2**self.__bases[base] - 1
+
+            if base in self.__slots:
+                lines += [
+                    "    {} = {}".format(var, self.__ref(base)),
+                    "    if {} is None:".format(var),
+                    "        {} = {} = randint(0, {:#x})".format(var, self.__ref(base), mask),
+                    "    else:",
+                    "        {} &= {:#x}".format(var, mask),
+                ]
+            else:
+                lines += [
+                    "    if {!r} in regs:".format(base),
+                    "        {} = regs[{!r}] & {:#x}".format(var, base, mask),
+                    "    else:",
+                    "        {} = regs[{!r}] = randint(0, {:#x})".format(var, base, mask),
+                ]
+
+        for base in sorted(self.__written - self.__loaded):
+            lines += ["    {} = None".format(self.__var(base))]
+
+        lines += ["    next_addr = None"]
+
+        # Execute instructions.
+        lines += ["    try:"]
+        lines += ["        " + stmt for stmt in self.__body] or ["        pass"]
+
+        # Write back registers in case of an exception.
+        lines += ["    except Exception:"]
+
+        for base in sorted(self.__written):
+            var = self.__var(base)
+
+            if base in self.__loaded:
+                lines += ["        {} = {}".format(self.__ref(base), var)]
+            else:
+                lines += [
+                    "        if {} is not None:".format(var),
+                    "            {} = {}".format(self.__ref(base), var),
+                ]
+
+        lines += ["        raise"]
+
+        # Write back registers.
+        for base in sorted(self.__written):
+            lines += ["    {} = {}".format(self.__ref(base), self.__var(base))]
+
+        lines += ["    return next_addr"]
+
+        return "\n".join(lines) + "\n"
+
+    # Operand auxiliary methods
+    # ======================================================================== #
+    def __is_temporal(self, name):
+        return name.startswith("t") and \
+            name not in self.__arch.registers_size and \
+            name not in self.__arch.alias_mapper
+
+    def __var(self, name):
+        prefix = "t_" if self.__is_temporal(name) else "r_"
+
+        return prefix + name
+
+    def __ref(self, base):
+        if base in self.__slots:
+            return "values[{}]".format(self.__slots[base])
+
+        return "regs[{!r}]".format(base)
+
+    def __new_tmp(self):
+        self.__tmp_count += 1
+
+        return "v{}".format(self.__tmp_count)
+
+    def __register_info(self, register):
+        if register.name in self.__arch.alias_mapper:
+            base, offset = self.__arch.alias_mapper[register.name]
+            base_size = self.__arch.registers_size[base]
+        else:
+            base, offset = register.name, 0
+            base_size = register.size
+
+        return base, base_size, offset
+
+    def __read(self, operand):
+        """Return an expression (and its width in bits) that reads an
+        operand.
+        """
+        if isinstance(operand, ReilImmediateOperand):
+            return "{:#x}".format(operand.immediate), operand.size
+
+        if not isinstance(operand, ReilRegisterOperand):
+            raise ReilBlockCompilerError("Invalid operand type : %s" % str(operand))
+
+        if self.__is_temporal(operand.name):
+            var = self.__var(operand.name)
+
+            if operand.name not in self.__temps:
+                # The temporary register is read before it is written.
+                self.__temps[operand.name] = operand.size
+                self.__body += ["{} = randint(0, {:#x})".format(var, 2**operand.size - 1)]
+
+            if operand.size < self.__temps[operand.name]:
+                var = "({} & {:#x})".format(var, 2**operand.size - 1)
+
+            return var, operand.size
+
+        base, base_size, offset = self.__register_info(operand)
+
+        self.__use_base(base, base_size, load=True)
+
+        expr = self.__var(base)
+
+        if offset != 0:
+            expr = "({} >> {})".format(expr, offset)
+
+        if offset != 0 or operand.size != base_size:
+            expr = "({} & {:#x})".format(expr, 2**operand.size - 1)
+
+        return expr, operand.size
+
+    def __write(self, operand, expr, width):
+        """Generate a statement that writes an expression to an operand.
+        """
+        if not isinstance(operand, ReilRegisterOperand):
+            raise ReilBlockCompilerError("Invalid operand type : %s" % str(operand))
+
+        mask = 2**operand.size - 1
+
+        if width is None or width > operand.size:
+            expr = "({}) & {:#x}".format(expr, mask)
+
+        if self.__is_temporal(operand.name):
+            self.__temps[operand.name] = operand.size
+            self.__body += ["{} = {}".format(self.__var(operand.name), expr)]
+
+            return
+
+        base, base_size, offset = self.__register_info(operand)
+
+        var = self.__var(base)
+
+        if offset == 0 and operand.size == base_size:
+            self.__use_base(base, base_size, load=False)
+            self.__body += ["{} = {}".format(var, expr)]
+        else:
+            self.__use_base(base, base_size, load=True)
+
+            clear_mask = (2**base_size - 1) & ~(mask << offset)
+
+            if offset != 0:
+                expr = "(({}) << {})".format(expr, offset)
+
+            self.__body += ["{} = ({} & {:#x}) | {}".format(var, var, clear_mask, expr)]
+
+        self.__written.add(base)
+
+    def __use_base(self, base, base_size, load):
+        if base not in self.__bases:
+            self.__bases[base] = base_size
+
+            # Only registers whose current value is needed are loaded.
+            if load:
+                self.__loaded.add(base)
+        elif load and base not in self.__written:
+            self.__loaded.add(base)
+
+    # Arithmetic instructions
+    # ======================================================================== #
+    def __gen_binary_op(self, instr):
+        operators = {
+            ReilMnemonic.ADD: "+",
+            ReilMnemonic.SUB: "-",
+            ReilMnemonic.MUL: "*",
+            ReilMnemonic.AND: "&",
+            ReilMnemonic.OR:  "|",
+            ReilMnemonic.XOR: "^",
+        }
+
+        op0, width0 = self.__read(instr.operands[0])
+        op1, width1 = self.__read(instr.operands[1])
+
+        if instr.mnemonic in [ReilMnemonic.AND, ReilMnemonic.OR, ReilMnemonic.XOR]:
+            width = max(width0, width1)
+        else:
+            width = None
+
+        expr = "{} {} {}".format(op0, operators[instr.mnemonic], op1)
+
+        self.__write(instr.operands[2], expr, width)
+
+    def __gen_div(self, instr):
+        operator = "//" if instr.mnemonic == ReilMnemonic.DIV else "%"
+
+        op0, width0 = self.__read(instr.operands[0])
+        op1, _ = self.__read(instr.operands[1])
+
+        divisor = self.__new_tmp()
+
+        self.__body += [
+            "{} = {}".format(divisor, op1),
+            "if {} == 0:".format(divisor),
+            "    raise ReilCpuZeroDivisionError()",
+        ]
+
+        self.__write(instr.operands[2], "{} {} {}".format(op0, operator, divisor), width0)
+
+    def __gen_bsh(self, instr):
+        op0, width0 = self.__read(instr.operands[0])
+
+        oprnd1 = instr.operands[1]
+
+        if isinstance(oprnd1, ReilImmediateOperand):
+            shift = oprnd1.immediate
+
+            if shift >> (oprnd1.size - 1) == 0:
+                self.__write(instr.operands[2], "{} << {}".format(op0, shift), None)
+            else:
+                shift = 2**oprnd1.size - shift
+
+                self.__write(instr.operands[2], "{} >> {}".format(op0, shift), width0)
+
+            return
+
+        op1, _ = self.__read(oprnd1)
+
+        value, shift = self.__new_tmp(), self.__new_tmp()
+
+        self.__body += [
+            "{} = {}".format(value, op0),
+            "{} = {}".format(shift, op1),
+        ]
+
+        expr = "{v} << {s} if {s} >> {sb} == 0 else {v} >> ({m} - {s})".format(v=value, s=shift,
+                                                                            sb=oprnd1.size - 1,
+                                                                            m=2**oprnd1.size)
+
+        self.__write(instr.operands[2], expr, None)
+
+    # Data transfer instructions
+    # ======================================================================== #
+    def __gen_ldm(self, instr):
+        op0, _ = self.__read(instr.operands[0])
+
+        size = instr.operands[2].size
+
+        self.__write(instr.operands[2], "mem.read({}, {})".format(op0, size // 8), size)
+
+    def __gen_stm(self, instr):
+        op0, _ = self.__read(instr.operands[0])     # Data.
+        op2, _ = self.__read(instr.operands[2])     # Memory address.
+
+        size = instr.operands[0].size
+
+        self.__body += ["mem.write({}, {}, {})".format(op2, size // 8, op0)]
+
+    def __gen_str(self, instr):
+        op0, width0 = self.__read(instr.operands[0])
+
+        self.__write(instr.operands[2], op0, width0)
+
+    # Conditional instructions
+    # ======================================================================== #
+    def __gen_bisz(self, instr):
+        op0, _ = self.__read(instr.operands[0])
+
+        self.__write(instr.operands[2], "1 if {} == 0 else 0".format(op0), 1)
+
+    def __gen_jcc(self, instr):
+        op0, _ = self.__read(instr.operands[0])     # Branch condition.
+        op2, _ = self.__read(instr.operands[2])     # Target address.
+
+        self.__body += ["next_addr = {} if {} != 0 else None".format(op2, op0)]
+
+    # Other instructions
+    # ======================================================================== #
+    def __gen_undef(self, instr):
+        size = instr.operands[2].size
+
+        self.__write(instr.operands[2], "randint(0, {:#x})".format(2**size - 1), None)
+
+    def __gen_nop(self, instr):
+        pass
+
+    # REIL extension instructions
+    # ======================================================================== #
+    def __gen_sext(self, instr):
+        op0, _ = self.__read(instr.operands[0])
+
+        op0_size = instr.operands[0].size
+        op2_mask = (2**instr.operands[2].size-1) & ~(2**op0_size-1)
+
+        value = self.__new_tmp()
+
+        self.__body += ["{} = {}".format(value, op0)]
+
+        expr = "{v} | {m:#x} if {v} >> {sb} == 1 else {v}".format(v=value, m=op2_mask, sb=op0_size - 1)
+
+        self.__write(instr.operands[2], expr, None)
+
+    def __gen_signed_op(self, instr):
+        functions = {
+            ReilMnemonic.SDIV: "signed_div",
+            ReilMnemonic.SMOD: "signed_mod",
+            ReilMnemonic.SMUL: "signed_mul",
+        }
+
+        op0, _ = self.__read(instr.operands[0])
+        op1, _ = self.__read(instr.operands[1])
+
+        expr = "{}({}, {}, {}, {}, {})".format(functions[instr.mnemonic],
+                                               op0, instr.operands[0].size,
+                                               op1, instr.operands[1].size,
+                                               instr.operands[2].size)
+
+        self.__write(instr.operands[2], expr, instr.operands[2].size)
@@ -21,15 +21,808 @@
 # CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
-
 from __future__ import absolute_import
 
+import binascii
 import random
 
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
 
 REIL_MEMORY_ENDIANNESS_LE = 0x0     # Little Endian
 REIL_MEMORY_ENDIANNESS_BE = 0x1     # Big Endian
 
+REIL_MEMORY_PAGE_SIZE = 0x1000      # Page size (allocation and copy-on-write granularity)
+
+
+# Conversions between integers and little endian bytes (int.from_bytes and
+# int.to_bytes are not available in Python 2).
+if hasattr(int, "from_bytes"):
+    def _bytes_to_int(data):
+        return int.from_bytes(data, 'little')
+
+    def _int_to_bytes(value, size):
+        return value.to_bytes(size, 'little')
+else:
+    def _bytes_to_int(data):
+        return int(binascii.hexlify(bytes(data)[::-1]), 16) if data else 0
+
+    def _int_to_bytes(value, size):
+        return binascii.unhexlify("{:0{}x}".format(value, size * 2))[::-1]
+
+
+class ReilMemoryPages(MutableMapping):
+
+    """Byte store split in pages that are shared copy-on-write between
+    snapshots.
+
+    Each page is a pair of bytearrays: its content and a map of the bytes
+    that are defined (written or read before). Pages are allocated on
+    first touch. Undefined bytes are initialized when they are first
+    read, with random values if *random_init* is set, or zeros otherwise.
+
+    The store can also be used as a dictionary (address -> byte) of the
+    defined bytes.
+
+    Read-only buffers (for example, a memory mapped file) can be mapped in
+    the store. Their pages are copied into the store the first time they
+    are accessed.
+
+    Taking a snapshot only hands out the current page table, which is not
+    modified afterwards: the first write to the store copies the table and
+    the first write to each page copies that page.
+    """
+
+    def __init__(self, page_size=REIL_MEMORY_PAGE_SIZE, random_init=True):
+        self.__page_size = page_size
+        self.__page_shift = page_size.bit_length() - 1
+        self.__page_mask = page_size - 1
+
+        self.__random_init = random_init
+
+        # Page table (page number -> (content, defined bytes map)).
+        self.__table = {}
+
+        # Whether the page table can be modified in place.
+        self.__table_owned = True
+
+        # Pages that can be modified in place.
+        self.__owned = set()
+
+        # Mapped buffers, tuple of (start address, end address, data).
+        self.__regions = ()
+
+        # Undo records of the changes to the store (None when disabled).
+        self.__journal = None
+
+        # Reverse index, byte value -> set of addresses (None when disabled).
+        self.__index = None
+
+        # Watched pages (see watch) and function called when they change.
+        self.__watched = set()
+        self.__watcher = None
+
+    # Journal methods
+    # ======================================================================== #
+    @property
+    def journal(self):
+        """Return the list where undo records are appended (None if changes
+        are not journaled).
+        """
+        return self.__journal
+
+    @journal.setter
+    def journal(self, value):
+        self.__journal = value
+
+    def undo(self, record):
+        """Revert the change described by an undo record.
+        """
+        _, address, content, defined = record
+
+        if address is None:
+            self.__regions = content
+
+            self.__notify_all()
+
+            return
+
+        page_number = address >> self.__page_shift
+        page = self.__writable_page(page_number)
+        offset = address & self.__page_mask
+
+        if self.__index is not None:
+            self.__update_index(page, address, len(content), False)
+
+        page[0][offset:offset + len(content)] = content
+        page[1][offset:offset + len(content)] = defined
+
+        if self.__index is not None:
+            self.__update_index(page, address, len(content), True)
+
+        if page_number in self.__watched:
+            self.__notify_write(address, len(content))
+
+    # Watch methods
+    # ======================================================================== #
+    def watch(self, address, size):
+        """Watch the pages of a range of bytes. The watcher is called with
+        the range (start, end) of each write to a watched page, and of
+        the bytes that differ when a snapshot is restored. When a whole
+        page is replaced (clear, map), it is called with the range of the
+        page and the page is no longer watched.
+        """
+        first = address >> self.__page_shift
+        last = (address + max(size, 1) - 1) >> self.__page_shift
+
+        self.__watched.update(range(first, last + 1))
+
+    @property
+    def watcher(self):
+        """Return the function called when a watched page changes.
+        """
+        return self.__watcher
+
+    @watcher.setter
+    def watcher(self, value):
+        self.__watcher = value
+
+    # Index methods
+    # ======================================================================== #
+    def enable_index(self):
+        """Keep a reverse index (byte value -> addresses) of the defined
+        bytes, used by find. It is updated on every change to the store.
+        """
+        if self.__index is None:
+            self.__build_index()
+
+    def disable_index(self):
+        self.__index = None
+
+    @property
+    def indexed(self):
+        return self.__index is not None
+
+    # Mapping methods
+    # ======================================================================== #
+    def map(self, address, data):
+        """Map a read-only buffer at an address. Its content is copied
+        into the store one page at a time, on first access.
+        """
+        data = memoryview(data)
+        end = address + len(data)
+
+        if address == end:
+            return
+
+        # Pages already present are updated right away.
+        first, last = address >> self.__page_shift, (end - 1) >> self.__page_shift
+
+        for page_number in [pn for pn in self.__table if first <= pn <= last]:
+            start = max(address, page_number << self.__page_shift)
+            stop = min(end, (page_number + 1) << self.__page_shift)
+
+            self.write_bytes(start, data[start - address:stop - address])
+
+        if self.__journal is not None:
+            self.__journal.append((self, None, self.__regions, None))
+
+        self.__regions += ((address, end, data),)
+
+        for page_number in [pn for pn in self.__watched if first <= pn <= last]:
+            self.__notify(page_number)
+
+        # The index has to cover all defined bytes, so the new pages are
+        # loaded and indexed right away.
+        if self.__index is not None:
+            for page_number in [pn for pn in range(first, last + 1) if pn not in self.__table]:
+                page = self.__page(page_number)
+
+                self.__update_index(page, page_number << self.__page_shift, self.__page_size, True)
+
+    # Multi-byte access methods (little endian)
+    # ======================================================================== #
+    def defined(self, address, size):
+        """Return whether all bytes in a range are defined.
+        """
+        offset = address & self.__page_mask
+
+        if offset + size > self.__page_size:
+            return all(self.defined(addr, sz) for addr, sz in self.__split(address, size))
+
+        page = self.__page(address >> self.__page_shift)
+
+        return page is not None and page[1].find(b"\x00", offset, offset + size) == -1
+
+    def defined_ranges(self, address, size):
+        """Return the defined parts of a range of bytes as a list of
+        (address, size) tuples.
+        """
+        offset = address & self.__page_mask
+
+        if offset + size > self.__page_size:
+            return [r for addr, sz in self.__split(address, size) for r in self.defined_ranges(addr, sz)]
+
+        page = self.__page(address >> self.__page_shift)
+
+        if page is None:
+            return []
+
+        ranges = []
+        defined = page[1]
+        end = offset + size
+        start = defined.find(b"\x01", offset, end)
+
+        while start != -1:
+            stop = defined.find(b"\x00", start, end)
+            stop = end if stop == -1 else stop
+
+            ranges.append((address + start - offset, stop - start))
+
+            start = defined.find(b"\x01", stop, end)
+
+        return ranges
+
+    def peek(self, address, size):
+        """Return the value in a range of defined bytes.
+        """
+        return _bytes_to_int(self.peek_bytes(address, size))
+
+    def peek_bytes(self, address, size):
+        """Return the content of a range of defined bytes.
+        """
+        offset = address & self.__page_mask
+
+        if offset + size > self.__page_size:
+            return b"".join(self.peek_bytes(addr, sz) for addr, sz in self.__split(address, size))
+
+        return bytes(self.__page(address >> self.__page_shift)[0][offset:offset + size])
+
+    def read(self, address, size):
+        """Return the value in a range of bytes. Undefined bytes become
+        defined.
+        """
+        return _bytes_to_int(self.read_bytes(address, size))
+
+    def read_bytes(self, address, size):
+        """Return the content of a range of bytes. Undefined bytes become
+        defined.
+        """
+        offset = address & self.__page_mask
+
+        if offset + size > self.__page_size:
+            return b"".join(self.read_bytes(addr, sz) for addr, sz in self.__split(address, size))
+
+        page_number = address >> self.__page_shift
+        page = self.__page(page_number)
+
+        if page is None or page[1].find(b"\x00", offset, offset + size) != -1:
+            page = self.__writable_page(page_number)
+
+            if self.__journal is not None:
+                self.__record(page, address, size)
+
+            if self.__index is not None:
+                self.__update_index(page, address, size, False)
+
+            self.__define(page, offset, size)
+
+            if self.__index is not None:
+                self.__update_index(page, address, size, True)
+
+        return bytes(page[0][offset:offset + size])
+
+    def write(self, address, size, value):
+        """Set the value of a range of bytes.
+        """
+        mask = (1 << (size * 8)) - 1
+
+        self.write_bytes(address, _int_to_bytes(value & mask, size))
+
+    def write_bytes(self, address, data):
+        """Set the content of a range of bytes.
+        """
+        size = len(data)
+        offset = address & self.__page_mask
+
+        if offset + size > self.__page_size:
+            start = 0
+
+            for addr, sz in self.__split(address, size):
+                self.write_bytes(addr, data[start:start + sz])
+
+                start += sz
+
+            return
+
+        page_number = address >> self.__page_shift
+        page = self.__writable_page(page_number)
+
+        # Writes to watched pages are only reported if they change something.
+        changed = page_number in self.__watched and \
+            (page[0][offset:offset + size] != data or page[1].count(b"\x01", offset, offset + size) != size)
+
+        if self.__journal is not None:
+            self.__record(page, address, size)
+
+        if self.__index is not None:
+            self.__update_index(page, address, size, False)
+
+        page[0][offset:offset + size] = data
+        page[1][offset:offset + size] = b"\x01" * size
+
+        if self.__index is not None:
+            self.__update_index(page, address, size, True)
+
+        if changed:
+            self.__notify_write(address, size)
+
+    def find(self, data):
+        """Return the sorted list of addresses where a sequence of defined
+        bytes matches *data*.
+        """
+        if self.__index is not None:
+            return self.__find_indexed(data)
+
+        data = bytes(data)
+        size = len(data)
+        addresses = []
+        chunks = self.__chunks()
+
+        for i, (address, content, defined) in enumerate(chunks):
+            # Matches can span the chunks that follow this one.
+            tail_content, tail_defined = bytearray(), bytearray()
+            end = address + len(content)
+
+            for next_address, next_content, next_defined in chunks[i + 1:]:
+                if next_address != end or len(tail_content) >= size - 1:
+                    break
+
+                count = min(size - 1 - len(tail_content), len(next_content))
+
+                tail_content += next_content[:count]
+                tail_defined += next_defined[:count] if next_defined is not None else b"\x01" * count
+
+                end += len(next_content)
+
+            haystack = bytearray(content) + tail_content
+            offset = haystack.find(data)
+
+            while offset != -1 and offset < len(content):
+                stop = offset + size
+
+                if (defined is None or defined.find(b"\x00", offset, min(stop, len(content))) == -1) and \
+                        (stop <= len(content) or tail_defined.find(b"\x00", 0, stop - len(content)) == -1):
+                    addresses.append(address + offset)
+
+                offset = haystack.find(data, offset + 1)
+
+        return addresses
+
+    # Snapshot methods
+    # ======================================================================== #
+    def snapshot(self):
+        """Return the current content. It shares all pages with the store.
+        """
+        self.__table_owned = False
+        self.__owned = set()
+
+        return self.__table, self.__regions
+
+    def restore(self, snapshot):
+        """Set the content of the store to a snapshot.
+        """
+        table, regions = self.__table, self.__regions
+
+        self.__table, self.__regions = snapshot
+        self.__table_owned = False
+        self.__owned = set()
+
+        # Pages are replaced when they are written, so watched pages that
+        # are still the same object did not change. Otherwise, only the
+        # range of bytes that differ is reported.
+        for page_number in list(self.__watched):
+            if regions is not self.__regions:
+                self.__notify(page_number)
+            elif table.get(page_number) is not self.__table.get(page_number):
+                self.__notify_changes(page_number, table.get(page_number), self.__table.get(page_number))
+
+        # Only the pages that are not the same object are reindexed (the
+        # mapped pages of the snapshot are loaded first, see map).
+        if self.__index is not None:
+            if self.__regions:
+                self.__load_regions()
+
+            for page_number in set(table) | set(self.__table):
+                if table.get(page_number) is not self.__table.get(page_number):
+                    self.__reindex_page(page_number, table.get(page_number), self.__table.get(page_number))
+
+    # Dictionary interface
+    # ======================================================================== #
+    def __getitem__(self, address):
+        page = self.__page(address >> self.__page_shift)
+        offset = address & self.__page_mask
+
+        if page is None or not page[1][offset]:
+            raise KeyError(address)
+
+        return page[0][offset]
+
+    def __setitem__(self, address, value):
+        page_number = address >> self.__page_shift
+        page = self.__writable_page(page_number)
+        offset = address & self.__page_mask
+
+        if self.__journal is not None:
+            self.__record(page, address, 1)
+
+        if self.__index is not None:
+            self.__update_index(page, address, 1, False)
+
+        page[0][offset] = value
+        page[1][offset] = 1
+
+        if self.__index is not None:
+            self.__update_index(page, address, 1, True)
+
+        if page_number in self.__watched:
+            self.__notify_write(address, 1)
+
+    def __delitem__(self, address):
+        if address not in self:
+            raise KeyError(address)
+
+        page_number = address >> self.__page_shift
+        page = self.__writable_page(page_number)
+
+        if self.__journal is not None:
+            self.__record(page, address, 1)
+
+        if self.__index is not None:
+            self.__update_index(page, address, 1, False)
+
+        page[1][address & self.__page_mask] = 0
+
+        if page_number in self.__watched:
+            self.__notify_write(address, 1)
+
+    def __contains__(self, address):
+        page = self.__page(address >> self.__page_shift)
+
+        return page is not None and page[1][address & self.__page_mask] == 1
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(len(content) if defined is None else defined.count(b"\x01")
+                   for _, content, defined in self.__chunks())
+
+    def get(self, address, default=None):
+        page = self.__page(address >> self.__page_shift)
+        offset = address & self.__page_mask
+
+        if page is None or not page[1][offset]:
+            return default
+
+        return page[0][offset]
+
+    def items(self):
+        items = []
+
+        for address, content, defined in self.__chunks():
+            content = bytearray(content)
+            offsets = range(len(content)) if defined is None else self.__defined_offsets(defined)
+
+            items += [(address + offset, content[offset]) for offset in offsets]
+
+        return items
+
+    def keys(self):
+        keys = []
+
+        for address, content, defined in self.__chunks():
+            if defined is None:
+                keys += range(address, address + len(content))
+            else:
+                keys += [address + offset for offset in self.__defined_offsets(defined)]
+
+        return keys
+
+    def unmap(self, keep=False):
+        """Stop referencing the mapped buffers. The pages that were not
+        accessed yet are dropped, or copied into the store if *keep* is
+        set.
+        """
+        if not self.__regions:
+            return
+
+        if keep:
+            self.__load_regions()
+
+        if self.__journal is not None:
+            self.__journal.append((self, None, self.__regions, None))
+
+        dropped = [pn for pn in self.__watched if pn not in self.__table and self.__is_mapped(pn)]
+
+        self.__regions = ()
+
+        for page_number in dropped:
+            self.__notify(page_number)
+
+    def clear(self):
+        self.__table = {}
+        self.__table_owned = True
+        self.__owned = set()
+        self.__regions = ()
+
+        if self.__index is not None:
+            self.__index = {}
+
+        self.__notify_all()
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __notify_write(self, address, size):
+        # Report a write to a watched page.
+        if self.__watcher:
+            self.__watcher(address, address + size)
+
+    def __notify(self, page_number):
+        # Report a change to a whole watched page.
+        self.__watched.discard(page_number)
+
+        if self.__watcher:
+            start = page_number << self.__page_shift
+
+            self.__watcher(start, start + self.__page_size)
+
+    def __notify_changes(self, page_number, old, new):
+        # Report the range of bytes that differ between two versions of a
+        # watched page (a missing page is loaded from the mapped regions).
+        old = old if old is not None else self.__blank_page(page_number)
+        new = new if new is not None else self.__blank_page(page_number)
+
+        offsets = [self.__changed_range(a, b) for a, b in zip(old, new) if a != b]
+
+        if offsets:
+            start = page_number << self.__page_shift
+
+            first = min(offset for offset, _ in offsets)
+            last = max(offset for _, offset in offsets)
+
+            self.__notify_write(start + first, last - first)
+
+    @staticmethod
+    def __changed_range(a, b):
+        # Return the offsets (start, end) of the bytes that differ between
+        # two buffers of the same size (which are known to be different).
+        # Slice comparisons are done by bisection so they run in C.
+        def common_prefix(a, b):
+            low, high = 0, len(a)
+
+            while high - low > 1:
+                middle = (low + high) // 2
+
+                if a[low:middle] == b[low:middle]:
+                    low = middle
+                else:
+                    high = middle
+
+            return low
+
+        return common_prefix(a, b), len(a) - common_prefix(a[::-1], b[::-1])
+
+    def __blank_page(self, page_number):
+        page = bytearray(self.__page_size), bytearray(self.__page_size)
+
+        if self.__regions:
+            self.__load_page(page_number, page)
+
+        return page
+
+    def __notify_all(self):
+        for page_number in list(self.__watched):
+            self.__notify(page_number)
+
+    def __split(self, address, size):
+        # Split a range of bytes at page boundaries.
+        end = address + size
+
+        while address < end:
+            size = min(end, (address | self.__page_mask) + 1) - address
+
+            yield address, size
+
+            address += size
+
+    @staticmethod
+    def __defined_offsets(defined):
+        offsets = []
+        offset = defined.find(b"\x01")
+
+        while offset != -1:
+            end = defined.find(b"\x00", offset)
+            end = len(defined) if end == -1 else end
+
+            offsets += range(offset, end)
+
+            offset = defined.find(b"\x01", end)
+
+        return offsets
+
+    def __build_index(self):
+        self.__index = None
+
+        index = {}
+
+        for address, value in self.items():
+            index.setdefault(value, set()).add(address)
+
+        self.__index = index
+
+    def __update_index(self, page, address, size, add):
+        # Add (or remove) the defined bytes of a range (within a page) to
+        # the index.
+        content, defined = page
+        offset = address & self.__page_mask
+        index = self.__index
+
+        for i in range(size):
+            if defined[offset + i]:
+                if add:
+                    index.setdefault(content[offset + i], set()).add(address + i)
+                else:
+                    index[content[offset + i]].discard(address + i)
+
+    def __reindex_page(self, page_number, old, new):
+        # Update the index with the range of bytes that differ between two
+        # versions of a page (a missing page has no defined bytes).
+        old = old if old is not None else (bytearray(self.__page_size), bytearray(self.__page_size))
+        new = new if new is not None else (bytearray(self.__page_size), bytearray(self.__page_size))
+
+        offsets = [self.__changed_range(a, b) for a, b in zip(old, new) if a != b]
+
+        if offsets:
+            first = min(offset for offset, _ in offsets)
+            last = max(offset for _, offset in offsets)
+
+            address = (page_number << self.__page_shift) + first
+
+            self.__update_index(old, address, last - first, False)
+            self.__update_index(new, address, last - first, True)
+
+    def __find_indexed(self, data):
+        data = bytearray(data)
+
+        # Start from the smallest set of candidates.
+        sets = [self.__index.get(value, ()) for value in data]
+        position = min(range(len(data)), key=lambda i: len(sets[i]))
+
+        candidates = [address - position for address in sets[position]]
+
+        return sorted(address for address in candidates
+                      if self.defined(address, len(data)) and self.peek_bytes(address, len(data)) == data)
+
+    def __record(self, page, address, size):
+        # Append an undo record of a range (within a page) to the journal.
+        offset = address & self.__page_mask
+
+        self.__journal.append((self, address, bytes(page[0][offset:offset + size]),
+                               bytes(page[1][offset:offset + size])))
+
+    def __define(self, page, offset, size):
+        # Initialize the undefined bytes of a range.
+        content, defined = page
+
+        if self.__random_init:
+            values = bytearray(_int_to_bytes(random.getrandbits(size * 8), size))
+
+            for i in range(size):
+                if not defined[offset + i]:
+                    content[offset + i] = values[i]
+
+        defined[offset:offset + size] = b"\x01" * size
+
+    def __page(self, page_number):
+        # Return a page (None if it is not present). Mapped pages are
+        # loaded on first access.
+        page = self.__table.get(page_number)
+
+        if page is None and self.__regions and self.__is_mapped(page_number):
+            page = self.__writable_page(page_number)
+
+        return page
+
+    def __is_mapped(self, page_number):
+        start = page_number << self.__page_shift
+        end = start + self.__page_size
+
+        return any(r_start < end and start < r_end for r_start, r_end, _ in self.__regions)
+
+    def __chunks(self):
+        # Return the content of the store as a sorted list of (address,
+        # content, defined bytes map) chunks, without loading mapped pages:
+        # the loaded pages, and the runs of the mapped buffers that are not
+        # loaded (all defined, their map is None). Pages where buffers
+        # overlap are built apart.
+        chunks = [(page_number << self.__page_shift, content, defined)
+                  for page_number, (content, defined) in self.__table.items()]
+
+        mapped = {}
+
+        for region in self.__regions:
+            start, end, _ = region
+
+            for page_number in range(start >> self.__page_shift, ((end - 1) >> self.__page_shift) + 1):
+                if page_number not in self.__table:
+                    mapped.setdefault(page_number, []).append(region)
+
+        runs = []
+
+        for page_number in sorted(mapped):
+            regions = mapped[page_number]
+
+            if len(regions) > 1:
+                content, defined = self.__blank_page(page_number)
+
+                chunks.append((page_number << self.__page_shift, content, defined))
+            elif runs and runs[-1][0] is regions[0] and runs[-1][2] == page_number:
+                runs[-1][2] = page_number + 1
+            else:
+                runs.append([regions[0], page_number, page_number + 1])
+
+        for (r_start, r_end, data), first, last in runs:
+            start = max(r_start, first << self.__page_shift)
+            end = min(r_end, last << self.__page_shift)
+
+            chunks.append((start, data[start - r_start:end - r_start], None))
+
+        return sorted(chunks, key=lambda chunk: chunk[0])
+
+    def __load_regions(self):
+        # Load all mapped pages.
+        for start, end, _ in self.__regions:
+            for page_number in range(start >> self.__page_shift, ((end - 1) >> self.__page_shift) + 1):
+                self.__page(page_number)
+
+    def __load_page(self, page_number, page):
+        # Copy the content of the mapped buffers into a new page.
+        content, defined = page
+        start = page_number << self.__page_shift
+        end = start + self.__page_size
+
+        for r_start, r_end, data in self.__regions:
+            if r_start < end and start < r_end:
+                lo, hi = max(start, r_start), min(end, r_end)
+
+                content[lo - start:hi - start] = data[lo - r_start:hi - r_start]
+                defined[lo - start:hi - start] = b"\x01" * (hi - lo)
+
+    def __writable_page(self, page_number):
+        if not self.__table_owned:
+            self.__table = dict(self.__table)
+            self.__table_owned = True
+
+        if page_number not in self.__owned:
+            page = self.__table.get(page_number)
+
+            if page is None:
+                page = bytearray(self.__page_size), bytearray(self.__page_size)
+
+                if self.__regions:
+                    self.__load_page(page_number, page)
+            else:
+                page = bytearray(page[0]), bytearray(page[1])
+
+            self.__table[page_number] = page
+            self.__owned.add(page_number)
+
+        return self.__table[page_number]
+
 
 class ReilMemory(object):
 
@@ -47,8 +840,9 @@ class ReilMemory(object):
         # Memory's endianness.
         self.__endianness = REIL_MEMORY_ENDIANNESS_LE
 
-        # Dictionary that implements the memory itself.
-        self._memory = {}
+        # Pages that implement the memory itself. Undefined bytes are
+        # initialized with random values when they are read.
+        self._memory = ReilMemoryPages()
 
     @property
     def address_size(self):
@@ -59,48 +853,97 @@ class ReilMemory(object):
     def read(self, address, size):
         """Read arbitrary size content from memory.
         """
-        value = 0x0
-
-        for i in range(0, size):
-            value |= self._read_byte(address + i) << (i * 8)
-
-        return value
+        return self._memory.read(address, size)
 
     def _read_byte(self, address):
         """Read a byte from memory.
         """
-        # Initialize memory location with a random value.
-        if address not in self._memory:
-            self._memory[address] = random.randint(0x00, 0xff)
+        return self._memory.read(address, 1)
 
-        return self._memory[address]
+    def read_bytes(self, address, size):
+        """Read a range of bytes from memory.
+        """
+        return self._memory.read_bytes(address, size)
 
     # Write methods
     # ======================================================================== #
     def write(self, address, size, value):
         """Write arbitrary size content to memory.
         """
-        for i in range(0, size):
-            self.__write_byte(address + i, (value >> (i * 8)) & 0xff)
+        self._memory.write(address, size, value)
+
+    def write_bytes(self, address, data):
+        """Write a range of bytes to memory.
+        """
+        self._memory.write_bytes(address, data)
+
+    # Mapping methods
+    # ======================================================================== #
+    def map(self, address, data):
+        """Map a read-only buffer (for example, a memory mapped file) at
+        an address. Pages are copied from the buffer on first access.
+        """
+        self._memory.map(address, data)
+
+    def unmap(self, keep=False):
+        """Release the mapped buffers. The pages that were not accessed
+        yet are dropped, or loaded first if *keep* is set.
+        """
+        self._memory.unmap(keep)
+
+    # Watch methods
+    # ======================================================================== #
+    def watch(self, address, size):
+        """Watch the pages of a range of addresses (for example, the ones
+        that hold translated code). The watcher is called with the range
+        (start, end) of the bytes that change in watched pages.
+        """
+        self._memory.watch(address, size)
+
+    @property
+    def watcher(self):
+        return self._memory.watcher
+
+    @watcher.setter
+    def watcher(self, value):
+        self._memory.watcher = value
+
+    # Snapshot methods
+    # ======================================================================== #
+    def snapshot(self):
+        """Return a snapshot of the memory. Pages are shared copy-on-write
+        with the memory, so this is a constant time operation.
+        """
+        return self._memory.snapshot()
+
+    def restore(self, snapshot):
+        """Restore the memory to a snapshot.
+        """
+        self._memory.restore(snapshot)
 
-    def __write_byte(self, address, value):
-        """Write byte in memory.
+    def fork(self):
+        """Return a new memory with the same content. Pages are shared
+        copy-on-write between both memories.
         """
-        self._memory[address] = value & 0xff
+        memory = self.__class__(self.__address_size)
+
+        memory.restore(self.snapshot())
+
+        return memory
 
     # Misc methods
     # ======================================================================== #
     def reset(self):
-        # Dictionary that implements the memory itself.
-        self._memory = {}
+        # Pages that implement the memory itself.
+        self._memory.clear()
 
     # Magic methods
     # ======================================================================== #
     def __str__(self):
         lines = []
 
-        for addr in sorted(self._memory.keys()):
-            lines += ["0x%08x : 0x%08x" % (addr, self._memory[addr])]
+        for addr, value in self._memory.items():
+            lines += ["0x%08x : 0x%08x" % (addr, value)]
 
         return "\n".join(lines)
 
@@ -109,42 +952,33 @@ class ReilMemoryEx(ReilMemory):
 
     """Reil memory extended class"""
 
-    def __init__(self, address_size):
+    def __init__(self, address_size, value_index=False):
         super(ReilMemoryEx, self).__init__(address_size)
 
-        # Previous state of memory.
-        self.__memory_prev = {}
+        # Keep a reverse index of byte values for read_inverse.
+        if value_index:
+            self._memory.enable_index()
 
         # Write operations counter.
         self.__write_count = 0
 
+        # Undo records since the first checkpoint (None if there are no
+        # checkpoints).
+        self.__journal = None
+
     # Read methods
     # ======================================================================== #
     def read_inverse(self, value, size):
         """Return a list of memory addresses that contain the specified
         value.
 
-        """
-        addr_candidates = [addr for addr, val in self._memory.items() if val == (value & 0xff)]
-        addr_matches = []
-
-        for addr in addr_candidates:
-            match = True
+        If the value index is enabled, only the addresses that hold the
+        bytes of the value are checked. Otherwise, memory is scanned.
 
-            for i in range(0, size):
-                byte_curr = (value >> (i * 8)) & 0xff
-                try:
-                    match = self._memory[addr + i] == byte_curr
-                except KeyError:
-                    match = False
-
-                if not match:
-                    break
-
-            if match:
-                addr_matches += [addr]
+        """
+        mask = (1 << (size * 8)) - 1
 
-        return addr_matches
+        return self._memory.find(_int_to_bytes(value & mask, size))
 
     def try_read(self, address, size):
         """Try to read memory content at specified address.
@@ -153,77 +987,176 @@ class ReilMemoryEx(ReilMemory):
         (False, None). Otherwise, it returns (True, memory content).
 
         """
-        value = 0x0
-
-        for i in range(0, size):
-            addr = address + i
-
-            if addr in self._memory:
-                value |= self._read_byte(addr) << (i * 8)
-            else:
-                return False, None
+        if not self._memory.defined(address, size):
+            return False, None
 
-        return True, value
+        return True, self._memory.peek(address, size)
 
     def try_read_prev(self, address, size):
-        """Try to read previous memory content at specified address.
+        """Try to read the memory content at specified address before it
+        was last written.
 
-        If any location was not written before, it returns a tuple
-        (False, None). Otherwise, it returns (True, memory content).
+        Previous content is taken from the undo records of the journal,
+        so only the writes made since the first checkpoint are known. If
+        any location was not written since then, or was not defined
+        before, it returns a tuple (False, None). Otherwise, it returns
+        (True, memory content).
 
         """
-        value = 0x0
+        if self.__journal is None:
+            return False, None
 
-        for i in range(0, size):
-            addr = address + i
+        previous = {}
 
-            if addr in self.__memory_prev:
-                _, val_byte = self.__try_read_byte_prev(addr)
-                value |= val_byte << (i * 8)
-            else:
-                return False, None
+        # The most recent record of each byte holds its value before the
+        # last write.
+        for store, record_address, content, defined in reversed(self.__journal):
+            if store is not self._memory or record_address is None:
+                continue
 
-        return True, value
+            start = max(address, record_address)
+            end = min(address + size, record_address + len(content))
 
-    def __try_read_byte_prev(self, address):
-        """Read previous value for memory location.
+            if start >= end:
+                continue
 
-        Return a tuple (True, Byte) in case of successful read,
-        (False, None) otherwise.
+            content, defined = bytearray(content), bytearray(defined)
 
-        """
-        # Initialize memory location with a random value
-        if address not in self.__memory_prev:
+            for addr in range(start, end):
+                if addr not in previous:
+                    offset = addr - record_address
+
+                    previous[addr] = content[offset] if defined[offset] else None
+
+            if len(previous) == size:
+                break
+
+        if len(previous) != size or None in previous.values():
             return False, None
 
-        return True, self.__memory_prev[address]
+        return True, _bytes_to_int(bytes(bytearray(previous[address + i] for i in range(size))))
 
     # Write methods
     # ======================================================================== #
     def write(self, address, size, value):
         """Write arbitrary size content to memory.
         """
-        for i in range(0, size):
-            self.__write_byte(address + i, (value >> (i * 8)) & 0xff)
+        self._memory.write(address, size, value)
+
+        self.__write_count += 1
+
+    def write_bytes(self, address, data):
+        """Write a range of bytes to memory.
+        """
+        self._memory.write_bytes(address, data)
 
         self.__write_count += 1
 
-    def __write_byte(self, address, value):
-        """Write byte in memory.
+    # Value index methods
+    # ======================================================================== #
+    def enable_value_index(self):
+        """Keep a reverse index (byte value -> addresses) of the memory,
+        updated on each write, to speed up read_inverse.
+        """
+        self._memory.enable_index()
+
+    def disable_value_index(self):
+        self._memory.disable_index()
+
+    # Checkpoint methods
+    # ======================================================================== #
+    def checkpoint(self):
+        """Return a checkpoint of the current state of the memory.
+
+        From the first checkpoint on, changes to the memory are journaled
+        as undo records (the previous content of each written range) until
+        the memory is reset or restored, or checkpoints are released.
+
+        """
+        if self.__journal is None:
+            self.__journal = []
+
+            self._memory.journal = self.__journal
+
+        return len(self.__journal), self.__write_count
+
+    def rollback(self, checkpoint):
+        """Revert all changes made since a checkpoint. Checkpoints taken
+        after it are no longer valid.
+        """
+        position, write_count = checkpoint
+
+        if self.__journal is None or position > len(self.__journal):
+            raise ValueError("Invalid checkpoint.")
+
+        journal = self.__journal
+
+        while len(journal) > position:
+            record = journal.pop()
+
+            record[0].undo(record)
+
+        self.__write_count = write_count
+
+    def diff(self, checkpoint):
+        """Return the bytes that changed since a checkpoint as a dictionary
+        address -> (previous value, current value). Undefined bytes have
+        value None.
         """
-        # Save previous address content.
-        if address in self._memory:
-            self.__memory_prev[address] = self._memory[address]
+        position, _ = checkpoint
+
+        if self.__journal is None or position > len(self.__journal):
+            raise ValueError("Invalid checkpoint.")
+
+        previous = {}
+
+        for store, address, content, defined in self.__journal[position:]:
+            if store is not self._memory or address is None:
+                continue
+
+            content, defined = bytearray(content), bytearray(defined)
 
-        self._memory[address] = value & 0xff
+            for i in range(len(content)):
+                if address + i not in previous:
+                    previous[address + i] = content[i] if defined[i] else None
+
+        changes = {}
+
+        for address in sorted(previous):
+            current = self._memory.get(address)
+
+            if current != previous[address]:
+                changes[address] = previous[address], current
+
+        return changes
+
+    def release_checkpoints(self):
+        """Drop all checkpoints and stop journaling changes.
+        """
+        self.__journal = None
+
+        self._memory.journal = None
+
+    # Snapshot methods
+    # ======================================================================== #
+    def snapshot(self):
+        return super(ReilMemoryEx, self).snapshot(), self.__write_count
+
+    def restore(self, snapshot):
+        memory, write_count = snapshot
+
+        self.release_checkpoints()
+
+        super(ReilMemoryEx, self).restore(memory)
+
+        self.__write_count = write_count
 
     # Misc methods
     # ======================================================================== #
     def reset(self):
-        super(ReilMemoryEx, self).reset()
+        self.release_checkpoints()
 
-        # Previous state of memory.
-        self.__memory_prev = {}
+        super(ReilMemoryEx, self).reset()
 
         # Write operations counter.
         self.__write_count = 0
@@ -231,7 +1164,7 @@ class ReilMemoryEx(ReilMemory):
     def get_addresses(self):
         """Get accessed addresses.
         """
-        return list(self._memory.keys())
+        return self._memory.keys()
 
     def get_write_count(self):
         """Get number of write operations performed on the memory.
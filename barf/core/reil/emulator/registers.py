@@ -0,0 +1,292 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+This module contains the register file of the REIL cpu.
+
+Base registers of the architecture live in fixed slots of a list, temporary
+registers live in a scratch dictionary that is cleared after each native
+instruction. Register
+accesses are resolved (base register, offset, masks) once per register
+name and size, and the result is cached.
+
+The register file behaves as a dictionary keyed by register name, which
+is the interface the emulator used to expose.
+
+"""
+from __future__ import absolute_import
+
+import copy
+import random
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+def register_slots(arch):
+    """Return the slot assigned to each base register of an architecture.
+    """
+    if arch is None:
+        return {}
+
+    bases = [name for name in arch.registers_size if name not in arch.alias_mapper]
+
+    return {name: slot for slot, name in enumerate(sorted(bases))}
+
+
+def is_temporal_register(name):
+    return name.startswith("t")
+
+
+class ReilRegisterFile(MutableMapping):
+
+    """REIL register file.
+    """
+
+    def __init__(self, arch=None):
+        # Architecture information.
+        self.__arch = arch
+
+        # Slots of the base registers.
+        self.__slots = register_slots(arch)
+
+        # Resolved register accesses, (name, size) -> info.
+        self.__info = {}
+
+        # Base register values (None means undefined).
+        self.__values = [None] * len(self.__slots)
+
+        # Temporary registers.
+        self.__temps = {}
+
+        # Registers that do not belong to the architecture.
+        self.__others = {}
+
+    # Register access methods
+    # ======================================================================== #
+    def resolve(self, name, size):
+        """Resolve a register access. Return a tuple (slot, base register,
+        offset, base max value, mask, clear mask, tracked, temporal).
+        """
+        info = self.__info.get((name, size))
+
+        if info is None:
+            info = self.__resolve(name, size)
+
+            self.__info[(name, size)] = info
+
+        return info
+
+    def read_base(self, info):
+        """Return the value of the base register of a resolved access.
+        An undefined register is initialized with a random value.
+        """
+        slot = info[0]
+
+        if slot is not None:
+            value = self.__values[slot]
+
+            if value is None:
+                value = self.__values[slot] = random.randint(0, info[3])
+
+            return value
+
+        store = self.__temps if info[7] else self.__others
+        base = info[1]
+
+        if base not in store:
+            store[base] = random.randint(0, info[3])
+
+        return store[base]
+
+    def write_base(self, info, value):
+        """Set the value of the base register of a resolved access.
+        """
+        slot = info[0]
+
+        if slot is not None:
+            self.__values[slot] = value
+        elif info[7]:
+            self.__temps[info[1]] = value
+        else:
+            self.__others[info[1]] = value
+
+    def reset_temporaries(self):
+        """Drop all temporary registers. Only the scratch area is
+        cleared, the rest of the register file is not scanned.
+        """
+        self.__temps.clear()
+
+    def reset(self):
+        """Drop all registers.
+        """
+        self.__values[:] = [None] * len(self.__slots)
+        self.__temps.clear()
+        self.__others.clear()
+
+    def snapshot(self):
+        """Return an immutable copy of the content of the register file.
+        """
+        return tuple(self.__values), dict(self.__temps), dict(self.__others)
+
+    def restore(self, snapshot):
+        """Restore the register file to a snapshot. The register file is
+        updated in place, compiled instructions hold references to it.
+        """
+        values, temps, others = snapshot
+
+        self.__values[:] = values
+
+        self.__temps.clear()
+        self.__temps.update(temps)
+
+        self.__others.clear()
+        self.__others.update(others)
+
+    # Properties
+    # ======================================================================== #
+    @property
+    def slots(self):
+        return self.__slots
+
+    @property
+    def values(self):
+        return self.__values
+
+    @property
+    def temporaries(self):
+        return self.__temps
+
+    # Dictionary interface
+    # ======================================================================== #
+    def __getitem__(self, name):
+        slot = self.__slots.get(name)
+
+        if slot is not None:
+            value = self.__values[slot]
+
+            if value is None:
+                raise KeyError(name)
+
+            return value
+
+        return self.__store(name)[name]
+
+    def __setitem__(self, name, value):
+        slot = self.__slots.get(name)
+
+        if slot is not None:
+            self.__values[slot] = value
+        else:
+            self.__store(name)[name] = value
+
+    def __delitem__(self, name):
+        slot = self.__slots.get(name)
+
+        if slot is not None:
+            if self.__values[slot] is None:
+                raise KeyError(name)
+
+            self.__values[slot] = None
+        else:
+            del self.__store(name)[name]
+
+    def __contains__(self, name):
+        slot = self.__slots.get(name)
+
+        if slot is not None:
+            return self.__values[slot] is not None
+
+        return name in self.__store(name)
+
+    def __iter__(self):
+        values = self.__values
+
+        for name, slot in self.__slots.items():
+            if values[slot] is not None:
+                yield name
+
+        for name in list(self.__others):
+            yield name
+
+        for name in list(self.__temps):
+            yield name
+
+    def __len__(self):
+        return len(self.__values) - self.__values.count(None) + len(self.__others) + len(self.__temps)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        regs = ReilRegisterFile.__new__(ReilRegisterFile)
+
+        regs.__arch = self.__arch
+        regs.__slots = self.__slots
+        regs.__info = self.__info
+        regs.__values = list(self.__values)
+        regs.__temps = dict(self.__temps)
+        regs.__others = dict(self.__others)
+
+        return regs
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        regs = self.copy()
+
+        regs.__values = copy.deepcopy(self.__values, memo)
+        regs.__temps = copy.deepcopy(self.__temps, memo)
+        regs.__others = copy.deepcopy(self.__others, memo)
+
+        return regs
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __store(self, name):
+        return self.__temps if is_temporal_register(name) else self.__others
+
+    def __resolve(self, name, size):
+        arch = self.__arch
+
+        if arch and name in arch.alias_mapper:
+            base, offset = arch.alias_mapper[name]
+            base_size = arch.registers_size[base]
+        else:
+            base, offset = name, 0
+            base_size = size
+
+        mask = 2**size - 1
+
+        slot = self.__slots.get(base)
+
+        # Keep track of native registers only.
+        tracked = arch is not None and name in arch.registers_gp_all
+
+        temporal = slot is None and is_temporal_register(base)
+
+        return slot, base, offset, 2**base_size - 1, mask, ~(mask << offset), tracked, temporal
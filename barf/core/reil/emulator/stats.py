@@ -0,0 +1,161 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Execution statistics for the REIL and native emulators.
+
+Statistics are disabled by default. Once enabled (see
+ReilEmulator.enable_stats and Emulator.enable_stats) the emulators count
+executed REIL instructions (per mnemonic), executed native instructions
+(per address), translation cache hits and misses, and memory reads and
+writes. Time spent inside the emulators is also measured to compute
+execution rates.
+"""
+from __future__ import absolute_import
+
+import json
+import time
+
+from collections import Counter
+
+from barf.core.reil import ReilMnemonic
+
+
+class ReilEmulatorStats(object):
+
+    """Execution statistics."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Executed REIL instructions, mnemonic -> count.
+        self.reil_instrs = Counter()
+
+        # Executed native instructions, address -> count.
+        self.asm_instrs = Counter()
+
+        # Translation cache lookups.
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Memory accesses (number of operations and bytes).
+        self.mem_reads = 0
+        self.mem_reads_bytes = 0
+        self.mem_writes = 0
+        self.mem_writes_bytes = 0
+
+        # Time spent executing (in seconds).
+        self.elapsed = 0.0
+
+        self.__timer_depth = 0
+        self.__timer_start = None
+
+    # Timing methods
+    # ======================================================================== #
+    def start(self):
+        """Start measuring execution time. Calls can be nested, only the
+        outermost one is measured.
+        """
+        if self.__timer_depth == 0:
+            self.__timer_start = time.time()
+
+        self.__timer_depth += 1
+
+    def stop(self):
+        """Stop measuring execution time.
+        """
+        self.__timer_depth -= 1
+
+        if self.__timer_depth == 0:
+            self.elapsed += time.time() - self.__timer_start
+
+    # Memory methods
+    # ======================================================================== #
+    def attach_memory(self, memory):
+        """Count reads and writes of a memory. Accesses are counted by
+        wrapping the instance's read and write methods.
+        """
+        read, write = memory.read, memory.write
+
+        def counted_read(address, size):
+            self.mem_reads += 1
+            self.mem_reads_bytes += size
+
+            return read(address, size)
+
+        def counted_write(address, size, value):
+            self.mem_writes += 1
+            self.mem_writes_bytes += size
+
+            write(address, size, value)
+
+        memory.read = counted_read
+        memory.write = counted_write
+
+    @staticmethod
+    def detach_memory(memory):
+        """Stop counting reads and writes of a memory.
+        """
+        for name in ["read", "write"]:
+            memory.__dict__.pop(name, None)
+
+    # Export methods
+    # ======================================================================== #
+    def as_dict(self):
+        reil_count = sum(self.reil_instrs.values())
+        asm_count = sum(self.asm_instrs.values())
+        cache_lookups = self.cache_hits + self.cache_misses
+
+        return {
+            "reil_instructions": reil_count,
+            "reil_instructions_by_mnemonic": {ReilMnemonic.to_string(m): c for m, c in self.reil_instrs.items()},
+            "asm_instructions": asm_count,
+            "asm_instructions_by_address": dict(self.asm_instrs),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hits / float(cache_lookups) if cache_lookups else 0.0,
+            "memory_reads": self.mem_reads,
+            "memory_reads_bytes": self.mem_reads_bytes,
+            "memory_writes": self.mem_writes,
+            "memory_writes_bytes": self.mem_writes_bytes,
+            "elapsed": self.elapsed,
+            "reil_instructions_per_second": reil_count / self.elapsed if self.elapsed else 0.0,
+            "asm_instructions_per_second": asm_count / self.elapsed if self.elapsed else 0.0,
+        }
+
+    def to_json(self, **kwargs):
+        """Return the statistics as a JSON string. Native instruction
+        addresses are output in hexadecimal.
+        """
+        stats = self.as_dict()
+
+        stats["asm_instructions_by_address"] = {
+            "{:#x}".format(addr): count for addr, count in sorted(self.asm_instrs.items())
+        }
+
+        return json.dumps(stats, **kwargs)
+
+    def __str__(self):
+        return self.to_json(indent=4, sort_keys=True)
@@ -27,10 +27,44 @@ from __future__ import absolute_import
 from barf.core.reil import ReilImmediateOperand
 from barf.core.reil import ReilMnemonic
 from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.emulator.intervals import ReilIntervalMap
+
+
+class ReilTaintSummary(object):
+
+    """Taint transfer function of a REIL sequence.
+
+    Expressions are pairs (registers, loads): the union of the taint of
+    some input registers and of some memory loads of the sequence.
+    Memory accesses keep their address operand, which is read when the
+    summary is applied.
+    """
+
+    __slots__ = ["inputs", "memory", "outputs"]
+
+    def __init__(self, inputs, memory, outputs):
+        # Base registers whose taint is read.
+        self.inputs = inputs
+
+        # Memory accesses in execution order, list of (load, address
+        # operand, size, registers, loads). Registers and loads are the
+        # expression of the stored value (stores only).
+        self.memory = memory
+
+        # Registers written, list of (base register, registers, loads).
+        self.outputs = outputs
 
 
 class ReilEmulatorTainter(object):
 
+    """Taint propagation.
+
+    Taint is a bitmask of labels (see taint_label). Each byte of memory
+    and each register holds a mask, 0 means untainted, and instructions
+    propagate the union of the masks of their sources. Tainting with
+    True uses the first label.
+    """
+
     def __init__(self, emulator, arch=None):
         # Reil emulator instance.
         self.__emu = emulator
@@ -39,8 +73,12 @@ class ReilEmulatorTainter(object):
         self.__arch = arch
 
         # Taint information.
-        self.__taint_reg = set()   # Register-level tainting
-        self.__taint_mem = set()   # Byte-level tainting
+        self.__taint_reg = {}                   # Register-level tainting (register -> mask)
+        self.__taint_mem = ReilIntervalMap()    # Byte-level tainting (ranges -> mask)
+
+        # Taint labels (name -> mask) and label sets (mask -> names).
+        self.__labels = {}
+        self.__label_sets = {}
 
         # Taint function lookup table.
         self.__tainter = {
@@ -81,18 +119,113 @@ class ReilEmulatorTainter(object):
     def taint(self, instruction):
         self.__tainter[instruction.mnemonic](instruction)
 
+    def summarize(self, sequence):
+        """Return the taint summary of a sequence, or None if it cannot
+        be summarized. Summaries are built on first use and cached on
+        the sequence.
+        """
+        cache = sequence.taint_summary
+
+        if cache is None or cache[0] is not self.__arch:
+            cache = (self.__arch, self.__summarize(sequence))
+
+            sequence.taint_summary = cache
+
+        return cache[1]
+
+    def apply_summary(self, summary):
+        """Propagate taint as if the instructions of a summarized sequence
+        were tainted one by one. It must be applied right after the
+        sequence is executed.
+        """
+        taint_reg = self.__taint_reg
+
+        if not taint_reg and not self.__taint_mem:
+            # Nothing is tainted, so nothing can be.
+            return
+
+        inputs = {base: taint_reg.get(base, 0) for base in summary.inputs}
+        loads = []
+
+        for load, operand, size, registers, indexes in summary.memory:
+            address = self.__emu.read_operand(operand)
+
+            if load:
+                loads.append(self.get_memory_taint_mask(address, size))
+            else:
+                mask = 0
+
+                for base in registers:
+                    mask |= inputs[base]
+
+                for index in indexes:
+                    mask |= loads[index]
+
+                self.__taint_mem.set(address, address + size, mask)
+
+        for base, registers, indexes in summary.outputs:
+            mask = 0
+
+            for reg in registers:
+                mask |= inputs[reg]
+
+            for index in indexes:
+                mask |= loads[index]
+
+            if mask:
+                taint_reg[base] = mask
+            else:
+                taint_reg.pop(base, None)
+
     def reset(self):
         # Taint information.
-        self.__taint_reg = set()
-        self.__taint_mem = set()
+        self.__taint_reg = {}
+        self.__taint_mem.reset()
+
+    def snapshot(self):
+        return tuple(self.__taint_reg.items()), self.__taint_mem.snapshot()
+
+    def restore(self, snapshot):
+        taint_reg, taint_mem = snapshot
+
+        self.__taint_reg = dict(taint_reg)
+        self.__taint_mem.restore(taint_mem)
+
+    # Label methods
+    # ======================================================================== #
+    def taint_label(self, name):
+        """Return the mask of a label. Labels are allocated on first use.
+        """
+        mask = self.__labels.get(name)
+
+        if mask is None:
+            mask = self.__labels[name] = 1 << len(self.__labels)
+
+        return mask
+
+    def taint_labels(self, mask):
+        """Return the (interned) set of label names of a mask. Bits that do
+        not belong to a named label are ignored.
+        """
+        labels = self.__label_sets.get(mask)
+
+        if labels is None:
+            labels = frozenset(name for name, bit in self.__labels.items() if mask & bit)
+
+            self.__label_sets[mask] = labels
+
+        return labels
 
     # Operand taint methods
     # ======================================================================== #
     def get_operand_taint(self, operand):
+        return self.get_operand_taint_mask(operand) != 0
+
+    def get_operand_taint_mask(self, operand):
         if isinstance(operand, ReilRegisterOperand):
-            taint = self.get_register_taint(operand.name)
+            taint = self.get_register_taint_mask(operand.name)
         elif isinstance(operand, ReilImmediateOperand):
-            taint = False
+            taint = 0
         else:
             raise Exception("Invalid operand: %s" % str(operand))
 
@@ -113,37 +246,201 @@ class ReilEmulatorTainter(object):
     # Memory taint methods
     # ======================================================================== #
     def get_memory_taint(self, address, size):
-        tainted = False
+        return self.__taint_mem.any(address, address + size)
 
-        for i in range(0, size):
-            tainted = tainted or address + i in self.__taint_mem
+    def get_memory_taint_mask(self, address, size):
+        mask = 0
 
-        return tainted
+        for value in self.__taint_mem.values(address, address + size):
+            mask |= value
+
+        return mask
 
     def set_memory_taint(self, address, size, taint):
-        for i in range(0, size):
-            if taint:
-                self.__taint_mem.add(address + i)
-            else:
-                self.__taint_mem.discard(address + i)
+        self.__taint_mem.set(address, address + size, int(taint))
 
     def clear_memory_taint(self, address, size):
-        for i in range(0, size):
-            self.__taint_mem.discard(address + i)
+        self.__taint_mem.clear(address, address + size)
 
     # Register taint methods
     # ======================================================================== #
     def get_register_taint(self, register):
         return self.__get_base_register(register) in self.__taint_reg
 
+    def get_register_taint_mask(self, register):
+        return self.__taint_reg.get(self.__get_base_register(register), 0)
+
     def set_register_taint(self, register, taint):
         if taint:
-            self.__taint_reg.add(self.__get_base_register(register))
+            self.__taint_reg[self.__get_base_register(register)] = int(taint)
         else:
-            self.__taint_reg.discard(self.__get_base_register(register))
+            self.__taint_reg.pop(self.__get_base_register(register), None)
 
     def clear_register_taint(self, register):
-        self.__taint_reg.discard(self.__get_base_register(register))
+        self.__taint_reg.pop(self.__get_base_register(register), None)
+
+    # Taint summary methods
+    # ======================================================================== #
+    def __summarize(self, sequence):
+        # Temporary registers can only be told apart with architecture
+        # information.
+        if not self.__arch:
+            return None
+
+        instrs = list(sequence)
+        empty = (frozenset(), frozenset())
+
+        state = {}          # base register -> expression
+        memory = []         # memory accesses (see ReilTaintSummary)
+        addresses = []      # (instruction index, base register of address)
+        writes = []         # (instruction index, base register written)
+        loads = 0
+
+        for index, instr in enumerate(instrs):
+            mnemonic = instr.mnemonic
+
+            if mnemonic == ReilMnemonic.JCC:
+                # Only a final branch keeps the sequence straight-line.
+                if index != len(instrs) - 1:
+                    return None
+
+                continue
+
+            if mnemonic in (ReilMnemonic.NOP, ReilMnemonic.UNKN):
+                continue
+
+            if mnemonic == ReilMnemonic.STM:
+                value = self.__summarize_read(state, instr.operands[0])
+
+                if value is None:
+                    return None
+
+                address = instr.operands[2]
+
+                if not self.__summarize_address(state, address, index, addresses):
+                    return None
+
+                memory.append((False, address, instr.operands[0].size // 8) + value)
+
+                continue
+
+            if mnemonic == ReilMnemonic.LDM:
+                address = instr.operands[0]
+
+                if not self.__summarize_address(state, address, index, addresses):
+                    return None
+
+                memory.append((True, address, instr.operands[2].size // 8, (), ()))
+
+                value = (frozenset(), frozenset([loads]))
+
+                loads += 1
+            elif mnemonic == ReilMnemonic.UNDEF:
+                value = empty
+            elif mnemonic in (ReilMnemonic.STR, ReilMnemonic.BISZ, ReilMnemonic.SEXT):
+                value = self.__summarize_read(state, instr.operands[0])
+            else:
+                value = self.__summarize_read(state, instr.operands[0])
+                other = self.__summarize_read(state, instr.operands[1])
+
+                if value is not None and other is not None:
+                    value = (value[0] | other[0], value[1] | other[1])
+                else:
+                    value = None
+
+            if value is None:
+                return None
+
+            base = self.__get_base_register(instr.operands[2].name)
+
+            state[base] = value
+            writes.append((index, base))
+
+        # Address operands are read after the sequence is executed, so
+        # they cannot be written after being used.
+        for index, base in addresses:
+            if any(w_index > index and w_base == base for w_index, w_base in writes):
+                return None
+
+        outputs = []
+
+        for base, (registers, indexes) in state.items():
+            if self.__is_temporary(base) or (registers == frozenset([base]) and not indexes):
+                continue
+
+            outputs.append((base, tuple(registers), tuple(indexes)))
+
+        # Drop loads whose taint is not used.
+        used = set()
+
+        for entry in memory:
+            used.update(entry[4])
+
+        for entry in outputs:
+            used.update(entry[2])
+
+        renumber = {}
+        summary_memory = []
+        load_index = 0
+
+        for load, operand, size, registers, indexes in memory:
+            if load:
+                if load_index in used:
+                    renumber[load_index] = len(renumber)
+
+                    summary_memory.append((load, operand, size, (), ()))
+
+                load_index += 1
+            else:
+                indexes = tuple(renumber[i] for i in indexes)
+
+                summary_memory.append((load, operand, size, tuple(registers), indexes))
+
+        outputs = [(base, registers, tuple(renumber[i] for i in indexes))
+                   for base, registers, indexes in outputs]
+
+        inputs = set()
+
+        for entry in summary_memory:
+            inputs.update(entry[3])
+
+        for entry in outputs:
+            inputs.update(entry[1])
+
+        return ReilTaintSummary(tuple(inputs), summary_memory, outputs)
+
+    def __summarize_read(self, state, operand):
+        if isinstance(operand, ReilImmediateOperand):
+            return frozenset(), frozenset()
+
+        base = self.__get_base_register(operand.name)
+
+        value = state.get(base)
+
+        if value is None:
+            # A temporary read before being written would get its taint
+            # from a previous sequence.
+            if self.__is_temporary(base):
+                return None
+
+            value = frozenset([base]), frozenset()
+
+        return value
+
+    def __summarize_address(self, state, operand, index, addresses):
+        if isinstance(operand, ReilRegisterOperand):
+            base = self.__get_base_register(operand.name)
+
+            if base not in state and self.__is_temporary(base):
+                return False
+
+            addresses.append((index, base))
+
+        return True
+
+    def __is_temporary(self, register):
+        return register not in self.__arch.registers_size and \
+            register not in self.__arch.alias_mapper
 
     # Taint auxiliary methods
     # ======================================================================== #
@@ -161,11 +458,11 @@ class ReilEmulatorTainter(object):
     # ======================================================================== #
     def __taint_binary_op(self, instr):
         # Get taint information.
-        op0_taint = self.get_operand_taint(instr.operands[0])
-        op1_taint = self.get_operand_taint(instr.operands[1])
+        op0_taint = self.get_operand_taint_mask(instr.operands[0])
+        op1_taint = self.get_operand_taint_mask(instr.operands[1])
 
         # Propagate taint.
-        self.set_operand_taint(instr.operands[2], op0_taint or op1_taint)
+        self.set_operand_taint(instr.operands[2], op0_taint | op1_taint)
 
     def __taint_load(self, instr):
         """Taint LDM instruction.
@@ -174,7 +471,7 @@ class ReilEmulatorTainter(object):
         op0_val = self.__emu.read_operand(instr.operands[0])
 
         # Get taint information.
-        op0_taint = self.get_memory_taint(op0_val, instr.operands[2].size // 8)
+        op0_taint = self.get_memory_taint_mask(op0_val, instr.operands[2].size // 8)
 
         # Propagate taint.
         self.set_operand_taint(instr.operands[2], op0_taint)
@@ -187,7 +484,7 @@ class ReilEmulatorTainter(object):
 
         # Get taint information.
         op0_size = instr.operands[0].size
-        op0_taint = self.get_operand_taint(instr.operands[0])
+        op0_taint = self.get_operand_taint_mask(instr.operands[0])
 
         # Propagate taint.
         self.set_memory_taint(op2_val, op0_size // 8, op0_taint)
@@ -196,7 +493,7 @@ class ReilEmulatorTainter(object):
         """Taint registers move instruction.
         """
         # Get taint information.
-        op0_taint = self.get_operand_taint(instr.operands[0])
+        op0_taint = self.get_operand_taint_mask(instr.operands[0])
 
         # Propagate taint.
         self.set_operand_taint(instr.operands[2], op0_taint)
@@ -205,7 +502,7 @@ class ReilEmulatorTainter(object):
         """Taint UNDEF instruction.
         """
         # Propagate taint.
-        self.set_operand_taint(instr.operands[2], False)
+        self.set_operand_taint(instr.operands[2], 0)
 
     def __taint_nothing(self, instr):
         """Taint nothing.
@@ -0,0 +1,472 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+This module contains a multi-lane REIL emulator.
+
+It runs a list of REIL instructions over several contexts (lanes) at
+once. Registers are kept as NumPy arrays with one element per lane
+(*uint64* for registers of up to 64 bits, Python integers for wider
+ones), each lane has its own sparse memory. As *execute_lite*, branches
+are not taken into account.
+
+NumPy is an optional dependency, use *vector_emulator_available* to
+check whether the emulator can be used.
+
+"""
+from __future__ import absolute_import
+
+import random
+
+from barf.core.reil import ReilImmediateOperand
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.emulator.cpu import ReilCpuInvalidInstruction
+from barf.core.reil.emulator.cpu import ReilCpuZeroDivisionError
+from barf.core.reil.emulator.cpu import _signed_binary_ops
+from barf.core.reil.emulator.memory import ReilMemoryEx
+from barf.core.reil.emulator.registers import ReilRegisterFile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def vector_emulator_available():
+    """Check whether the vector emulator can be used (it requires NumPy).
+    """
+    return numpy is not None
+
+
+def _is_wide(size):
+    return size > 64
+
+
+def _random_lanes(max_value, lanes):
+    """Return an array of random values between 0 and max_value.
+    """
+    if max_value < 2**64:
+        return numpy.random.randint(0, max_value + 1, size=lanes, dtype=numpy.uint64)
+
+    return numpy.array([random.randint(0, max_value) for _ in range(lanes)], dtype=object)
+
+
+def _fit(values, size):
+    """Mask an array of values to size bits and convert it to the
+    representation used for that size.
+    """
+    if _is_wide(size):
+        if values.dtype != object:
+            values = values.astype(object)
+
+        return values & (2**size - 1)
+
+    if values.dtype == object:
+        values = (values & (2**size - 1)).astype(numpy.uint64)
+    elif size < 64:
+        values = values & numpy.uint64(2**size - 1)
+
+    return values
+
+
+def _wide(values):
+    return values if values.dtype == object else values.astype(object)
+
+
+class ReilVectorEmulator(object):
+
+    """Multi-lane REIL emulator.
+    """
+
+    def __init__(self, arch):
+        if numpy is None:
+            raise ImportError("ReilVectorEmulator requires NumPy.")
+
+        # Architecture information.
+        self.__arch = arch
+
+        # Used to resolve register accesses only.
+        self.__regs_info = ReilRegisterFile(arch)
+
+        # Number of lanes.
+        self.__lanes = 0
+
+        # Registers (base register name -> array of values).
+        self.__regs = {}
+
+        # Registers read and written (the same for all lanes).
+        self.__regs_read = set()
+        self.__regs_written = set()
+
+        # Memory of each lane.
+        self.__mems = []
+
+        # Exception raised by each lane (None if it did not fail).
+        self.__errors = []
+
+        # Instruction implementation.
+        self.__executors = {
+            # Arithmetic Instructions
+            ReilMnemonic.ADD: self.__execute_binary_op,
+            ReilMnemonic.SUB: self.__execute_binary_op,
+            ReilMnemonic.MUL: self.__execute_binary_op,
+            ReilMnemonic.DIV: self.__execute_binary_op,
+            ReilMnemonic.MOD: self.__execute_binary_op,
+            ReilMnemonic.BSH: self.__execute_bsh,
+
+            # Bitwise Instructions
+            ReilMnemonic.AND: self.__execute_binary_op,
+            ReilMnemonic.OR:  self.__execute_binary_op,
+            ReilMnemonic.XOR: self.__execute_binary_op,
+
+            # Data Transfer Instructions
+            ReilMnemonic.LDM: self.__execute_ldm,
+            ReilMnemonic.STM: self.__execute_stm,
+            ReilMnemonic.STR: self.__execute_str,
+
+            # Conditional Instructions
+            ReilMnemonic.BISZ: self.__execute_bisz,
+            ReilMnemonic.JCC:  self.__execute_jcc,
+
+            # Other Instructions
+            ReilMnemonic.UNDEF: self.__execute_undef,
+            ReilMnemonic.UNKN:  self.__execute_unkn,
+            ReilMnemonic.NOP:   self.__execute_skip,
+
+            # Extensions
+            ReilMnemonic.SEXT: self.__execute_sext,
+            ReilMnemonic.SDIV: self.__execute_signed_op,
+            ReilMnemonic.SMOD: self.__execute_signed_op,
+            ReilMnemonic.SMUL: self.__execute_signed_op,
+        }
+
+    # Execution methods
+    # ======================================================================== #
+    def execute_lite(self, instructions, contexts):
+        """Execute a list of instructions once for each context (a
+        dictionary of register values). It does not support loops.
+
+        Return a list with, for each context, a tuple (registers, memory)
+        as ReilEmulator.execute_lite does, or None if the execution
+        raised an exception (see errors).
+
+        """
+        self.reset()
+
+        self.__lanes = len(contexts)
+        self.__mems = [ReilMemoryEx(self.__arch.address_size) for _ in contexts]
+        self.__errors = [None] * self.__lanes
+
+        # Writes are journaled, so the previous content of memory can be
+        # read (see ReilMemoryEx.try_read_prev).
+        for mem in self.__mems:
+            mem.checkpoint()
+
+        self.__load_contexts(contexts)
+
+        for instr in instructions:
+            self.__executors[instr.mnemonic](instr)
+
+        return self.__results()
+
+    def reset(self):
+        self.__lanes = 0
+        self.__regs = {}
+        self.__regs_read = set()
+        self.__regs_written = set()
+        self.__mems = []
+        self.__errors = []
+
+    # Properties
+    # ======================================================================== #
+    @property
+    def lanes(self):
+        return self.__lanes
+
+    @property
+    def registers(self):
+        return self.__regs
+
+    @property
+    def read_registers(self):
+        return self.__regs_read
+
+    @property
+    def written_registers(self):
+        return self.__regs_written
+
+    @property
+    def errors(self):
+        return self.__errors
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __load_contexts(self, contexts):
+        names = set()
+
+        for context in contexts:
+            names.update(context.keys())
+
+        for name in names:
+            size = self.__arch.registers_size.get(name, 64)
+
+            # Registers missing from a context are initialized randomly.
+            values = [context[name] if name in context else random.randint(0, 2**size - 1)
+                      for context in contexts]
+
+            if _is_wide(size) or any(value >= 2**64 for value in values):
+                self.__regs[name] = numpy.array(values, dtype=object)
+            else:
+                self.__regs[name] = numpy.array(values, dtype=numpy.uint64)
+
+    def __results(self):
+        regs = dict((name, values.tolist()) for name, values in self.__regs.items())
+
+        results = []
+
+        for lane in range(self.__lanes):
+            if self.__errors[lane] is not None:
+                results.append(None)
+                continue
+
+            results.append((dict((name, int(values[lane])) for name, values in regs.items()),
+                            self.__mems[lane]))
+
+        return results
+
+    def __fail(self, lanes, exception):
+        for lane in numpy.nonzero(lanes)[0]:
+            if self.__errors[lane] is None:
+                self.__errors[lane] = exception
+
+    # Read/Write methods
+    # ======================================================================== #
+    def __read_operand(self, operand):
+        if isinstance(operand, ReilImmediateOperand):
+            if _is_wide(operand.size):
+                return numpy.full(self.__lanes, operand.immediate, dtype=object)
+
+            return numpy.full(self.__lanes, operand.immediate, dtype=numpy.uint64)
+
+        if isinstance(operand, ReilRegisterOperand):
+            return self.__read_register(operand)
+
+        raise Exception("Invalid operand type : %s" % str(operand))
+
+    def __read_register(self, register):
+        info = self.__regs_info.resolve(register.name, register.size)
+        _, base_register, offset, base_max, mask, _, tracked, _ = info
+
+        if base_register not in self.__regs:
+            self.__regs[base_register] = _random_lanes(base_max, self.__lanes)
+
+        base_value = self.__regs[base_register]
+
+        if offset:
+            base_value = base_value >> (offset if base_value.dtype == object else numpy.uint64(offset))
+
+        # Keep track of native register reads.
+        if tracked:
+            self.__regs_read.add(register.name)
+
+        return _fit(base_value, register.size)
+
+    def __write_register(self, register, values):
+        info = self.__regs_info.resolve(register.name, register.size)
+        _, base_register, offset, base_max, mask, clear_mask, tracked, _ = info
+
+        base_size = base_max.bit_length()
+
+        values = _fit(values, register.size)
+
+        if offset or mask != base_max:
+            if base_register not in self.__regs:
+                self.__regs[base_register] = _random_lanes(base_max, self.__lanes)
+
+            base_value = self.__regs[base_register]
+
+            if _is_wide(base_size):
+                values = (_wide(base_value) & clear_mask) | (_wide(values) << offset)
+            else:
+                values = (base_value & numpy.uint64(clear_mask & base_max)) | \
+                         (values.astype(numpy.uint64) << numpy.uint64(offset))
+
+        self.__regs[base_register] = _fit(values, base_size)
+
+        # Keep track of native register writes.
+        if tracked:
+            self.__regs_written.add(register.name)
+
+    # REIL instructions implementation
+    # ======================================================================== #
+    def __execute_bsh(self, instr):
+        op0, op1, op2 = instr.operands
+
+        op0_val = self.__read_operand(op0)
+        op1_val = self.__read_operand(op1)
+
+        if _is_wide(op0.size) or _is_wide(op1.size) or _is_wide(op2.size):
+            def shift(value, amount):
+                if amount >> (op1.size - 1) == 0:
+                    return value << amount
+
+                return value >> (2**op1.size - amount)
+
+            op2_val = numpy.frompyfunc(shift, 2, 1)(_wide(op0_val), _wide(op1_val))
+        else:
+            sign = (op1_val >> numpy.uint64(op1.size - 1)) != 0
+            amount = numpy.where(sign, numpy.uint64(2**op1.size - 1) - op1_val + numpy.uint64(1), op1_val)
+
+            # NumPy does not define shifts by more than 63 bits.
+            out = amount > 63
+            amount = numpy.where(out, numpy.uint64(0), amount)
+
+            op2_val = numpy.where(sign, op0_val >> amount, op0_val << amount)
+            op2_val = numpy.where(out, numpy.uint64(0), op2_val)
+
+        self.__write_register(op2, op2_val)
+
+    def __execute_binary_op(self, instr):
+        op0, op1, op2 = instr.operands
+
+        op0_val = self.__read_operand(op0)
+        op1_val = self.__read_operand(op1)
+
+        mnemonic = instr.mnemonic
+
+        if mnemonic in (ReilMnemonic.DIV, ReilMnemonic.MOD):
+            zero = op1_val == 0
+
+            if zero.any():
+                self.__fail(zero, ReilCpuZeroDivisionError())
+
+                op1_val = numpy.where(zero, 1, op1_val).astype(op1_val.dtype)
+
+        if _is_wide(op0.size) or _is_wide(op1.size) or _is_wide(op2.size):
+            op0_val, op1_val = _wide(op0_val), _wide(op1_val)
+
+        if mnemonic == ReilMnemonic.ADD:
+            op2_val = op0_val + op1_val
+        elif mnemonic == ReilMnemonic.SUB:
+            op2_val = op0_val - op1_val
+        elif mnemonic == ReilMnemonic.MUL:
+            op2_val = op0_val * op1_val
+        elif mnemonic == ReilMnemonic.DIV:
+            op2_val = op0_val // op1_val
+        elif mnemonic == ReilMnemonic.MOD:
+            op2_val = op0_val % op1_val
+        elif mnemonic == ReilMnemonic.AND:
+            op2_val = op0_val & op1_val
+        elif mnemonic == ReilMnemonic.OR:
+            op2_val = op0_val | op1_val
+        else:
+            op2_val = op0_val ^ op1_val
+
+        self.__write_register(op2, op2_val)
+
+    def __execute_signed_op(self, instr):
+        op0, op1, op2 = instr.operands
+
+        op0_val = _wide(self.__read_operand(op0))
+        op1_val = _wide(self.__read_operand(op1))
+
+        if instr.mnemonic in (ReilMnemonic.SDIV, ReilMnemonic.SMOD):
+            zero = op1_val == 0
+
+            if zero.any():
+                self.__fail(zero, ZeroDivisionError())
+
+                op1_val = numpy.where(zero, 1, op1_val).astype(object)
+
+        fn = _signed_binary_ops[instr.mnemonic]
+
+        def execute(op0_lane, op1_lane):
+            return fn(op0_lane, op0.size, op1_lane, op1.size, op2.size)
+
+        op2_val = numpy.frompyfunc(execute, 2, 1)(op0_val, op1_val)
+
+        self.__write_register(op2, op2_val)
+
+    def __execute_ldm(self, instr):
+        op0, _, op2 = instr.operands
+
+        addresses = self.__read_operand(op0).tolist()
+
+        values = [mem.read(address, op2.size // 8) for mem, address in zip(self.__mems, addresses)]
+
+        self.__write_register(op2, numpy.array(values, dtype=object))
+
+    def __execute_stm(self, instr):
+        op0, _, op2 = instr.operands
+
+        values = self.__read_operand(op0).tolist()
+        addresses = self.__read_operand(op2).tolist()
+
+        for mem, address, value in zip(self.__mems, addresses, values):
+            mem.write(address, op0.size // 8, value)
+
+    def __execute_str(self, instr):
+        self.__write_register(instr.operands[2], self.__read_operand(instr.operands[0]))
+
+    def __execute_bisz(self, instr):
+        op0_val = self.__read_operand(instr.operands[0])
+
+        self.__write_register(instr.operands[2], (op0_val == 0).astype(numpy.uint64))
+
+    def __execute_jcc(self, instr):
+        # Branches are not taken, operands are read for consistency.
+        self.__read_operand(instr.operands[0])
+        self.__read_operand(instr.operands[2])
+
+    def __execute_undef(self, instr):
+        size = instr.operands[2].size
+
+        self.__write_register(instr.operands[2], _random_lanes(2**size - 1, self.__lanes))
+
+    def __execute_unkn(self, instr):
+        raise ReilCpuInvalidInstruction()
+
+    def __execute_skip(self, instr):
+        pass
+
+    def __execute_sext(self, instr):
+        op0, _, op2 = instr.operands
+
+        op0_val = self.__read_operand(op0)
+
+        ext_mask = (2**op2.size - 1) & ~(2**op0.size - 1)
+
+        if _is_wide(op2.size):
+            op0_val = _wide(op0_val)
+
+            sign = (op0_val >> (op0.size - 1)) != 0
+
+            op2_val = numpy.where(sign, op0_val | ext_mask, op0_val).astype(object)
+        else:
+            sign = (op0_val >> numpy.uint64(op0.size - 1)) != 0
+
+            op2_val = numpy.where(sign, op0_val | numpy.uint64(ext_mask), op0_val)
+
+        self.__write_register(op2, op2_val)
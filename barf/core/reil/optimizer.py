@@ -0,0 +1,698 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+This module contains an optimizer for REIL code.
+
+The optimizer runs a pipeline of passes over a list of REIL instructions
+(the translation of one or more native instructions). The default
+pipeline is:
+
+    * Constant folding (and propagation of constant temporaries).
+    * Copy propagation.
+    * Redundant STR removal.
+    * Dead temporary elimination.
+
+Temporary registers are assumed to be dead at the end of the code, native
+registers and memory are always considered live. Targets of
+intra-instruction JCCs are preserved and, once instructions are removed,
+REIL addresses are renumbered and JCC targets updated accordingly.
+
+"""
+from __future__ import absolute_import
+
+from barf.core.reil import ReilEmptyOperand
+from barf.core.reil import ReilImmediateOperand
+from barf.core.reil import ReilInstruction
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.container import ReilSequence
+from barf.core.reil.emulator.cpu import _binary_ops
+from barf.core.reil.emulator.cpu import _signed_binary_ops
+from barf.core.reil.helpers import split_address
+from barf.core.reil.helpers import to_reil_address
+from barf.utils.utils import extract_sign_bit
+from barf.utils.utils import twos_complement
+
+
+# Instructions without side effects other than writing their destination
+# operand.
+_pure_mnemonics = (
+    ReilMnemonic.ADD,
+    ReilMnemonic.SUB,
+    ReilMnemonic.MUL,
+    ReilMnemonic.BSH,
+    ReilMnemonic.AND,
+    ReilMnemonic.OR,
+    ReilMnemonic.XOR,
+    ReilMnemonic.STR,
+    ReilMnemonic.BISZ,
+    ReilMnemonic.UNDEF,
+    ReilMnemonic.SEXT,
+    ReilMnemonic.SMUL,
+)
+
+# Instructions that raise an exception when the divisor is zero.
+_division_mnemonics = (
+    ReilMnemonic.DIV,
+    ReilMnemonic.MOD,
+    ReilMnemonic.SDIV,
+    ReilMnemonic.SMOD,
+)
+
+
+# Auxiliary functions
+# ============================================================================ #
+def _source_indexes(instr):
+    """Return the indexes of the operands an instruction reads.
+    """
+    mnemonic = instr.mnemonic
+
+    if mnemonic in (ReilMnemonic.STM, ReilMnemonic.JCC):
+        return (0, 2)
+
+    if mnemonic in (ReilMnemonic.LDM, ReilMnemonic.STR, ReilMnemonic.BISZ, ReilMnemonic.SEXT):
+        return (0,)
+
+    if mnemonic in (ReilMnemonic.UNDEF, ReilMnemonic.UNKN, ReilMnemonic.NOP):
+        return ()
+
+    return (0, 1)
+
+
+def _destination(instr):
+    """Return the register an instruction writes, or None.
+    """
+    if instr.mnemonic in (ReilMnemonic.STM, ReilMnemonic.JCC, ReilMnemonic.NOP, ReilMnemonic.UNKN):
+        return None
+
+    operand = instr.operands[2]
+
+    return operand if isinstance(operand, ReilRegisterOperand) else None
+
+
+def _build(mnemonic, operands, address, comment=None):
+    instr = ReilInstruction()
+
+    instr.mnemonic = mnemonic
+    instr.operands = list(operands)
+    instr.address = address
+    instr.comment = comment
+
+    return instr
+
+
+def _replace(instr, operands=None, mnemonic=None):
+    return _build(mnemonic if mnemonic is not None else instr.mnemonic,
+                  operands if operands is not None else instr.operands,
+                  instr.address, instr.comment)
+
+
+def _nop(address):
+    return _build(ReilMnemonic.NOP, [ReilEmptyOperand()] * 3, address)
+
+
+def _evaluate(instr, values):
+    """Compute the result of an instruction whose source operands are
+    known. Return None if it cannot be computed.
+    """
+    mnemonic = instr.mnemonic
+    operands = instr.operands
+
+    if mnemonic == ReilMnemonic.STR:
+        return values[0]
+
+    if mnemonic == ReilMnemonic.BISZ:
+        return 1 if values[0] == 0 else 0
+
+    if mnemonic == ReilMnemonic.SEXT:
+        op0_size, op2_size = operands[0].size, operands[2].size
+
+        if extract_sign_bit(values[0], op0_size) == 1:
+            return values[0] | ((2**op2_size-1) & ~(2**op0_size-1))
+
+        return values[0]
+
+    if mnemonic == ReilMnemonic.BSH:
+        if extract_sign_bit(values[1], operands[1].size) == 0:
+            return values[0] << values[1]
+
+        return values[0] >> twos_complement(values[1], operands[1].size)
+
+    if mnemonic in _division_mnemonics and values[1] == 0:
+        return None
+
+    if mnemonic in _signed_binary_ops:
+        return _signed_binary_ops[mnemonic](values[0], operands[0].size,
+                                            values[1], operands[1].size,
+                                            operands[2].size)
+
+    if mnemonic in _binary_ops:
+        return _binary_ops[mnemonic](values[0], values[1])
+
+    return None
+
+
+def _simplify(instr):
+    """Apply algebraic identities (x + 0, x & 0xff..ff, etc). Return the
+    operand the instruction is equivalent to a copy of, or None.
+    """
+    mnemonic = instr.mnemonic
+    op0, op1, op2 = instr.operands
+
+    def is_imm(oprnd, value):
+        return isinstance(oprnd, ReilImmediateOperand) and oprnd.immediate == value
+
+    if mnemonic in (ReilMnemonic.ADD, ReilMnemonic.OR, ReilMnemonic.XOR):
+        if is_imm(op1, 0):
+            return op0
+        if is_imm(op0, 0):
+            return op1
+
+    if mnemonic in (ReilMnemonic.SUB, ReilMnemonic.BSH) and is_imm(op1, 0):
+        return op0
+
+    if mnemonic == ReilMnemonic.MUL:
+        if is_imm(op1, 1):
+            return op0
+        if is_imm(op0, 1):
+            return op1
+
+    if mnemonic == ReilMnemonic.AND:
+        for src, mask in [(op0, op1), (op1, op0)]:
+            if isinstance(mask, ReilImmediateOperand):
+                bits = 2**min(src.size, op2.size) - 1
+
+                if mask.immediate & bits == bits:
+                    return src
+
+    return None
+
+
+class ReilCode(object):
+
+    """REIL code being optimized. It gives the passes access to the
+    instructions, jump targets and temporary registers liveness.
+    """
+
+    def __init__(self, instrs, arch=None):
+        self.__arch = arch
+
+        self.instrs = list(instrs)
+
+    def is_temporal(self, name):
+        """Check whether a register is a temporary register.
+        """
+        if self.__arch and (name in self.__arch.registers_size or name in self.__arch.alias_mapper):
+            return False
+
+        return name.startswith("t")
+
+    def base_register(self, name):
+        """Return the base register of a register.
+        """
+        if self.__arch and name in self.__arch.alias_mapper:
+            return self.__arch.alias_mapper[name][0]
+
+        return name
+
+    def leaders(self):
+        """Return the indexes of the instructions that are targets of
+        intra-code JCCs.
+        """
+        return set(target for _, target in self.__jumps().items())
+
+    def successors(self):
+        """Return, for each instruction, the indexes of its successors
+        within the code.
+        """
+        jumps = self.__jumps()
+
+        succs = []
+
+        for index, instr in enumerate(self.instrs):
+            targets = []
+
+            if index + 1 < len(self.instrs):
+                targets.append(index + 1)
+
+            if index in jumps:
+                targets.append(jumps[index])
+
+            succs.append(targets)
+
+        return succs
+
+    def live_temporaries(self):
+        """Return, for each instruction, the set of temporary registers
+        that are live after it.
+        """
+        succs = self.successors()
+
+        uses, defs = [], []
+
+        for instr in self.instrs:
+            uses.append(set(instr.operands[i].name for i in _source_indexes(instr)
+                            if isinstance(instr.operands[i], ReilRegisterOperand) and
+                            self.is_temporal(instr.operands[i].name)))
+
+            dst = _destination(instr)
+
+            defs.append(set([dst.name]) if dst and self.is_temporal(dst.name) else set())
+
+        live_in = [set() for _ in self.instrs]
+        live_out = [set() for _ in self.instrs]
+
+        changed = True
+
+        while changed:
+            changed = False
+
+            for index in reversed(range(len(self.instrs))):
+                out = set()
+
+                for succ in succs[index]:
+                    out |= live_in[succ]
+
+                inp = uses[index] | (out - defs[index])
+
+                if out != live_out[index] or inp != live_in[index]:
+                    live_out[index], live_in[index] = out, inp
+                    changed = True
+
+        return live_out
+
+    def __jumps(self):
+        addresses = {}
+
+        for index, instr in enumerate(self.instrs):
+            if instr.address is not None:
+                addresses[instr.address] = index
+
+        jumps = {}
+
+        for index, instr in enumerate(self.instrs):
+            if instr.mnemonic != ReilMnemonic.JCC:
+                continue
+
+            target = instr.operands[2]
+
+            if isinstance(target, ReilImmediateOperand) and target.immediate in addresses:
+                jumps[index] = addresses[target.immediate]
+
+        return jumps
+
+
+# Optimization passes
+# ============================================================================ #
+class ReilOptimizationPass(object):
+
+    """Base class of the optimization passes.
+    """
+
+    def run(self, code):
+        """Run the pass over a ReilCode. Return True if the code changed.
+        """
+        raise NotImplementedError()
+
+
+class ReilConstantFolding(ReilOptimizationPass):
+
+    """Propagate the value of temporaries that hold constants and
+    replace instructions whose operands are constants by a STR.
+    Conditional jumps that are never taken are removed.
+    """
+
+    def run(self, code):
+        leaders = code.leaders()
+        consts = {}
+        changed = False
+
+        instrs = []
+
+        for index, instr in enumerate(code.instrs):
+            if index in leaders:
+                consts = {}
+
+            operands = list(instr.operands)
+
+            for i in _source_indexes(instr):
+                oprnd = operands[i]
+
+                if isinstance(oprnd, ReilRegisterOperand) and oprnd.name in consts:
+                    operands[i] = ReilImmediateOperand(consts[oprnd.name] & (2**oprnd.size-1), oprnd.size)
+
+            new_instr = _replace(instr, operands=operands) if operands != instr.operands else instr
+
+            sources = [operands[i] for i in _source_indexes(instr)]
+            dst = _destination(instr)
+
+            if dst and sources and instr.mnemonic != ReilMnemonic.LDM and \
+               all(isinstance(oprnd, ReilImmediateOperand) for oprnd in sources):
+                value = _evaluate(instr, [oprnd.immediate if oprnd.size else 0 for oprnd in operands[:2]])
+
+                if value is not None:
+                    folded = [ReilImmediateOperand(value & (2**dst.size-1), dst.size), ReilEmptyOperand(), dst]
+
+                    if instr.mnemonic != ReilMnemonic.STR or folded != instr.operands:
+                        new_instr = _build(ReilMnemonic.STR, folded, instr.address, instr.comment)
+
+            if dst and new_instr.mnemonic != ReilMnemonic.STR:
+                source = _simplify(new_instr)
+
+                if source is not None:
+                    new_instr = _build(ReilMnemonic.STR, [source, ReilEmptyOperand(), dst],
+                                       instr.address, instr.comment)
+
+            if instr.mnemonic == ReilMnemonic.JCC and \
+               isinstance(operands[0], ReilImmediateOperand) and operands[0].immediate == 0:
+                # The branch is never taken.
+                new_instr = _nop(instr.address)
+
+            if dst:
+                if new_instr.mnemonic == ReilMnemonic.STR and code.is_temporal(dst.name) and \
+                   isinstance(new_instr.operands[0], ReilImmediateOperand):
+                    consts[dst.name] = new_instr.operands[0].immediate & (2**dst.size-1)
+                else:
+                    consts.pop(dst.name, None)
+
+            changed = changed or new_instr is not instr
+
+            instrs.append(new_instr)
+
+        code.instrs = instrs
+
+        return changed
+
+
+class ReilCopyPropagation(ReilOptimizationPass):
+
+    """Replace reads of temporaries that are copies of other registers
+    (STR reg, tmp) by reads of the original register.
+    """
+
+    def run(self, code):
+        leaders = code.leaders()
+        copies = {}
+        changed = False
+
+        instrs = []
+
+        for index, instr in enumerate(code.instrs):
+            if index in leaders:
+                copies = {}
+
+            operands = list(instr.operands)
+
+            for i in _source_indexes(instr):
+                oprnd = operands[i]
+
+                if isinstance(oprnd, ReilRegisterOperand) and oprnd.name in copies and \
+                   copies[oprnd.name].size == oprnd.size:
+                    operands[i] = copies[oprnd.name]
+
+            if operands != instr.operands:
+                instr = _replace(instr, operands=operands)
+                changed = True
+
+            dst = _destination(instr)
+
+            if dst:
+                base = code.base_register(dst.name)
+
+                # Invalidate copies of the written register.
+                copies = {name: src for name, src in copies.items()
+                          if name != dst.name and code.base_register(src.name) != base}
+
+                src = operands[0]
+
+                if instr.mnemonic == ReilMnemonic.STR and code.is_temporal(dst.name) and \
+                   isinstance(src, ReilRegisterOperand) and src.size == dst.size and \
+                   src.name != dst.name:
+                    copies[dst.name] = src
+
+            instrs.append(instr)
+
+        code.instrs = instrs
+
+        return changed
+
+
+class ReilRedundantStrElimination(ReilOptimizationPass):
+
+    """Remove STR instructions that copy a register onto itself, and
+    merge "op ..., tmp; STR tmp, reg" into "op ..., reg" when the
+    temporary is not used afterwards.
+    """
+
+    def run(self, code):
+        leaders = code.leaders()
+        live_out = code.live_temporaries()
+        changed = False
+
+        instrs = []
+        skip = False
+
+        for index, instr in enumerate(code.instrs):
+            if skip:
+                skip = False
+                continue
+
+            if instr.mnemonic == ReilMnemonic.STR and instr.operands[0] == instr.operands[2]:
+                if index in leaders:
+                    instrs.append(_nop(instr.address))
+
+                changed = True
+                continue
+
+            dst = _destination(instr)
+            following = code.instrs[index + 1] if index + 1 < len(code.instrs) else None
+
+            if dst and following is not None and index + 1 not in leaders and \
+               instr.mnemonic != ReilMnemonic.STR and \
+               code.is_temporal(dst.name) and \
+               following.mnemonic == ReilMnemonic.STR and \
+               following.operands[0] == dst and \
+               isinstance(following.operands[2], ReilRegisterOperand) and \
+               following.operands[2].size == dst.size and \
+               dst.name not in live_out[index + 1]:
+                operands = list(instr.operands)
+                operands[2] = following.operands[2]
+
+                instrs.append(_replace(instr, operands=operands))
+
+                skip = True
+                changed = True
+                continue
+
+            instrs.append(instr)
+
+        code.instrs = instrs
+
+        return changed
+
+
+class ReilDeadTemporaryElimination(ReilOptimizationPass):
+
+    """Remove instructions that write temporaries that are never read,
+    and NOPs.
+    """
+
+    def run(self, code):
+        changed = False
+
+        while True:
+            leaders = code.leaders()
+            live_out = code.live_temporaries()
+
+            instrs = []
+            removed = False
+
+            for index, instr in enumerate(code.instrs):
+                if self.__is_dead(code, instr, live_out[index]):
+                    if index in leaders:
+                        if instr.mnemonic != ReilMnemonic.NOP:
+                            instrs.append(_nop(instr.address))
+                            removed = True
+                        else:
+                            instrs.append(instr)
+                    else:
+                        removed = True
+
+                    continue
+
+                instrs.append(instr)
+
+            code.instrs = instrs
+
+            if not removed:
+                break
+
+            changed = True
+
+        return changed
+
+    def __is_dead(self, code, instr, live):
+        if instr.mnemonic == ReilMnemonic.NOP:
+            return True
+
+        dst = _destination(instr)
+
+        if dst is None or not code.is_temporal(dst.name) or dst.name in live:
+            return False
+
+        if instr.mnemonic in _pure_mnemonics:
+            return True
+
+        # Divisions are removed only if they cannot raise an exception.
+        divisor = instr.operands[1]
+
+        return instr.mnemonic in _division_mnemonics and \
+            isinstance(divisor, ReilImmediateOperand) and divisor.immediate != 0
+
+
+# Optimizer
+# ============================================================================ #
+class ReilOptimizer(object):
+
+    """REIL optimizer. It runs a pipeline of passes until the code does
+    not change anymore.
+    """
+
+    def __init__(self, arch=None, passes=None, max_iterations=4):
+        # Architecture information.
+        self.__arch = arch
+
+        # Optimization passes.
+        if passes is None:
+            passes = [
+                ReilConstantFolding(),
+                ReilCopyPropagation(),
+                ReilRedundantStrElimination(),
+                ReilDeadTemporaryElimination(),
+            ]
+
+        self.__passes = list(passes)
+
+        # Maximum number of times the pipeline is run.
+        self.__max_iterations = max_iterations
+
+    @property
+    def passes(self):
+        return self.__passes
+
+    def add_pass(self, optimization_pass):
+        self.__passes.append(optimization_pass)
+
+    def optimize(self, instrs):
+        """Optimize a list of REIL instructions. Return a new list, the
+        original instructions are not modified.
+        """
+        instrs = list(instrs)
+
+        code = ReilCode(instrs, arch=self.__arch)
+
+        for _ in range(self.__max_iterations):
+            changed = False
+
+            for optimization_pass in self.__passes:
+                changed = optimization_pass.run(code) or changed
+
+            if not changed:
+                break
+
+        return self.__renumber(instrs, code.instrs)
+
+    def optimize_sequence(self, sequence):
+        """Optimize a ReilSequence. Return a new sequence.
+        """
+        optimized = ReilSequence(assembly=sequence.assembly)
+
+        for instr in self.optimize(sequence):
+            optimized.append(instr)
+
+        optimized.next_sequence_address = sequence.next_sequence_address
+
+        return optimized
+
+    def optimize_block(self, bb):
+        """Optimize the REIL translation of every instruction of a basic
+        block (in place).
+        """
+        for asm_instr in bb.instrs:
+            asm_instr.ir_instrs = self.optimize(asm_instr.ir_instrs)
+
+    def __renumber(self, original, instrs):
+        """Assign consecutive addresses to the instructions of each native
+        instruction and update intra-code JCC targets.
+        """
+        if any(instr.address is None for instr in original):
+            return instrs
+
+        # Keep at least one instruction per native instruction.
+        asm_addresses = []
+
+        for instr in original:
+            asm_address, _ = split_address(instr.address)
+
+            if asm_address not in asm_addresses:
+                asm_addresses.append(asm_address)
+
+        groups = dict((asm_address, []) for asm_address in asm_addresses)
+
+        for instr in instrs:
+            groups[split_address(instr.address)[0]].append(instr)
+
+        for asm_address in asm_addresses:
+            if not groups[asm_address]:
+                groups[asm_address].append(_nop(to_reil_address(asm_address)))
+
+        # Compute new addresses.
+        mapping = {}
+        renumbered = []
+
+        for asm_address in asm_addresses:
+            for index, instr in enumerate(groups[asm_address]):
+                mapping[instr.address] = to_reil_address(asm_address, index)
+
+                renumbered.append(instr)
+
+        result = []
+
+        for instr in renumbered:
+            new_instr = _replace(instr)
+            new_instr.address = mapping[instr.address]
+
+            target = instr.operands[2]
+
+            if instr.mnemonic == ReilMnemonic.JCC and isinstance(target, ReilImmediateOperand) and \
+               target.immediate in mapping:
+                operands = list(instr.operands)
+                operands[2] = ReilImmediateOperand(mapping[target.immediate], target.size)
+
+                new_instr.operands = operands
+
+            result.append(new_instr)
+
+        return result
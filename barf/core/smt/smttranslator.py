@@ -87,6 +87,9 @@ class SmtTranslator(object):
         self._arch_regs_size = {}
         self._arch_alias_mapper = {}
 
+        # An (optional) REIL optimizer.
+        self._optimizer = None
+
         # Instructions translators (from REIL to SMT expressions)
         self._instr_translators = {
             # Arithmetic Instructions
@@ -135,6 +138,20 @@ class SmtTranslator(object):
 
             raise
 
+    def translate_instructions(self, instrs):
+        """Return the SMT representation of a list of REIL instructions.
+        The instructions are optimized first if an optimizer was set.
+        """
+        if self._optimizer:
+            instrs = self._optimizer.optimize(instrs)
+
+        exprs = []
+
+        for instr in instrs:
+            exprs += self.translate(instr)
+
+        return exprs
+
     def get_name_init(self, name):
         """Get initial name of symbol.
         """
@@ -193,6 +210,11 @@ class SmtTranslator(object):
         """
         self._arch_regs_size = registers_size
 
+    def set_optimizer(self, optimizer):
+        """Set a REIL optimizer (see translate_instructions).
+        """
+        self._optimizer = optimizer
+
     def make_bitvec(self, size, name):
         assert size in [1, 8, 16, 32, 40, 64, 72, 128, 256]
 
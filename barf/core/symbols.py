@@ -24,78 +24,21 @@
 
 from __future__ import absolute_import
 
-import logging
-import pefile
-
-from elftools.elf.elffile import ELFFile
-
-from elftools.elf.sections import SymbolTableSection
-from elftools.elf.descriptions import (
-    describe_symbol_type,
-    describe_symbol_shndx)
-
-
-logger = logging.getLogger(__name__)
+from barf.core.binary import load_image
 
 
 def load_symbols_pe(filename):
-    # TODO: Implement this
-    pe = pefile.PE(filename)
-
-    pe.parse_data_directories()
-
-    pe.close()
-
-    return {}
+    return dict(load_image(filename).symbols)
 
 
 def load_symbols_elf(filename):
     """ Load the symbol tables contained in the file
     """
-    f = open(filename, 'rb')
-
-    elffile = ELFFile(f)
-
-    symbols = []
-
-    for section in elffile.iter_sections():
-        if not isinstance(section, SymbolTableSection):
-            continue
-
-        if section['sh_entsize'] == 0:
-            logger.warn("Symbol table {} has a sh_entsize of zero.".format(section.name))
-
-            continue
-
-        logger.info("Symbol table {} contains {} entries.".format(section.name, section.num_symbols()))
-
-        for _, symbol in enumerate(section.iter_symbols()):
-            if describe_symbol_shndx(symbol['st_shndx']) != "UND" and \
-                describe_symbol_type(symbol['st_info']['type']) == "FUNC":
-                symbols.append((symbol['st_value'], symbol['st_size'], symbol.name))
-
-    f.close()
-
-    symbols_by_addr = {
-        addr: (name, size, True) for addr, size, name in symbols
-    }
-
-    return symbols_by_addr
+    return dict(load_image(filename).symbols)
 
 
 def load_symbols(filename):
-    try:
-        fd = open(filename, 'rb')
-        signature = fd.read(4)
-        fd.close()
-    except:
-        raise Exception("Error loading file.")
-
-    if signature[:4] == b"\x7f\x45\x4c\x46":
-        symbols = load_symbols_elf(filename)
-    elif signature[:2] == b'\x4d\x5a':
-        symbols = load_symbols_pe(filename)
-    else:
-        raise Exception("Unknown file format.")
-
-    return symbols
+    """Load the function symbols of a file. The file is parsed once and
+    shared with the other components that load it (see load_image).
+    """
+    return dict(load_image(filename).symbols)
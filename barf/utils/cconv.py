@@ -43,6 +43,8 @@ class X86SystemVParameterManager(object):
 
 class X86SystemV(object):
 
+    return_register = 'eax'
+
     def __init__(self, emulator):
         self.__emulator = emulator
         self.__parameters = X86SystemVParameterManager(emulator)
@@ -100,6 +102,8 @@ class X86_64SystemVParameterManager(object):
 
 class X86_64SystemV(object):
 
+    return_register = 'rax'
+
     def __init__(self, emulator):
         self.__emulator = emulator
         self.__parameters = X86_64SystemVParameterManager(emulator)
@@ -149,6 +153,8 @@ class ArmSystemVParameterManager(object):
 
 class ArmSystemV(object):
 
+    return_register = 'r0'
+
     def __init__(self, emulator):
         self.__emulator = emulator
         self.__parameters = ArmSystemVParameterManager(emulator)
@@ -0,0 +1,268 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Python models of libc functions for the native code emulator.
+
+Emulating functions such as memcpy or strlen one REIL instruction at a
+time is slow. The models in this module do the same work directly on the
+emulator memory and return according to the calling convention of the
+architecture (see barf.utils.cconv). They are used as Emulator hooks and
+are bound to the functions of a binary by symbol name, for example::
+
+    symbols = load_symbols(filename)    # see barf.core.symbols
+
+    libc = LibcModels(emulator)
+    hooks = libc.hooks(symbols)
+
+    emulator.emulate(start, end, hooks, None, False)
+
+Supported functions: memcpy, memmove, memset, strlen, strcmp, malloc,
+calloc and free. Taint information is propagated when taint propagation
+is enabled in the REIL emulator.
+"""
+from __future__ import absolute_import
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.arm import ArmArchitectureInformation
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.utils.cconv import ArmSystemV
+from barf.utils.cconv import X86SystemV
+from barf.utils.cconv import X86_64SystemV
+
+
+# Default heap location and size (see malloc).
+LIBC_HEAP_ADDRESS = 0x70000000
+LIBC_HEAP_SIZE = 0x1000000
+
+# Strings are read in aligned chunks of this size.
+LIBC_STRING_CHUNK_SIZE = 0x10
+
+
+class LibcModels(object):
+
+    """Models of libc functions.
+
+    Memory is allocated from a simple heap: blocks are never reused and
+    free does nothing.
+    """
+
+    def __init__(self, emulator, heap_address=LIBC_HEAP_ADDRESS, heap_size=LIBC_HEAP_SIZE):
+        # Native code emulator.
+        self.__emulator = emulator
+
+        # REIL emulator (where the models do their work).
+        self.__ir_emulator = emulator.ir_emulator
+
+        # Calling convention.
+        self.__cc = self.__get_calling_convention(emulator.arch_info, self.__ir_emulator)
+
+        # Mask of the return value.
+        self.__mask = 2**emulator.arch_info.address_size - 1
+
+        # Heap.
+        self.__heap_next = heap_address
+        self.__heap_end = heap_address + heap_size
+
+        # Models by function name.
+        self.__models = {
+            "memcpy": self.memcpy,
+            "memmove": self.memmove,
+            "memset": self.memset,
+            "strlen": self.strlen,
+            "strcmp": self.strcmp,
+            "malloc": self.malloc,
+            "calloc": self.calloc,
+            "free": self.free,
+        }
+
+    @property
+    def models(self):
+        """Return the names of the modeled functions.
+        """
+        return sorted(self.__models)
+
+    def hooks(self, symbols, names=None):
+        """Return the hooks (see Emulator.emulate) of the modeled functions
+        of a symbol table (address -> (name, size, returns), as returned
+        by load_symbols). *names* optionally maps other symbol names to
+        modeled functions (for example, {"__strlen_sse2": "strlen"}).
+        """
+        names = names if names else {}
+        hooks = {}
+
+        for address, (name, _, _) in symbols.items():
+            model = self.__models.get(names.get(name, name))
+
+            if model:
+                hooks[address] = (model, None, True, 0)
+
+        return hooks
+
+    # Models
+    # ======================================================================== #
+    def memcpy(self, emulator, param):
+        # void *memcpy(void *dest, const void *src, size_t n);
+        dst, src, size = self.__cc.parameters[0], self.__cc.parameters[1], self.__cc.parameters[2]
+
+        self.__copy(dst, src, size)
+
+        self.__return(dst)
+
+    def memmove(self, emulator, param):
+        # void *memmove(void *dest, const void *src, size_t n);
+        self.memcpy(emulator, param)
+
+    def memset(self, emulator, param):
+        # void *memset(void *s, int c, size_t n);
+        dst, value, size = self.__cc.parameters[0], self.__cc.parameters[1], self.__cc.parameters[2]
+
+        if size:
+            self.__ir_emulator.memory.write_bytes(dst, bytes(bytearray([value & 0xff])) * size)
+
+            if self.__ir_emulator.taint_enabled:
+                self.__ir_emulator.clear_memory_taint(dst, size)
+
+        self.__return(dst)
+
+    def strlen(self, emulator, param):
+        # size_t strlen(const char *s);
+        address = self.__cc.parameters[0]
+
+        length = self.__string_length(address)
+
+        self.__return(length, self.__get_taint(address, length + 1))
+
+    def strcmp(self, emulator, param):
+        # int strcmp(const char *s1, const char *s2);
+        address_1, address_2 = self.__cc.parameters[0], self.__cc.parameters[1]
+
+        memory = self.__ir_emulator.memory
+
+        string_1 = memory.read_bytes(address_1, self.__string_length(address_1) + 1)
+        string_2 = memory.read_bytes(address_2, self.__string_length(address_2) + 1)
+
+        # Compare up to the first difference (or the end of a string).
+        index = 0
+
+        while string_1[index:index + 1] == string_2[index:index + 1] and string_1[index:index + 1] != b"\x00":
+            index += 1
+
+        result = bytearray(string_1)[index] - bytearray(string_2)[index]
+
+        taint = self.__get_taint(address_1, index + 1) | self.__get_taint(address_2, index + 1)
+
+        self.__return(result, taint)
+
+    def malloc(self, emulator, param):
+        # void *malloc(size_t size);
+        self.__return(self.__allocate(self.__cc.parameters[0]))
+
+    def calloc(self, emulator, param):
+        # void *calloc(size_t nmemb, size_t size);
+        size = self.__cc.parameters[0] * self.__cc.parameters[1]
+
+        address = self.__allocate(size)
+
+        if address and size:
+            self.__ir_emulator.memory.write_bytes(address, b"\x00" * size)
+
+        self.__return(address)
+
+    def free(self, emulator, param):
+        # void free(void *ptr);
+        pass
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __return(self, value, taint=0):
+        self.__cc.return_value = value & self.__mask
+
+        if self.__ir_emulator.taint_enabled:
+            self.__ir_emulator.set_register_taint(self.__cc.return_register, taint)
+
+    def __allocate(self, size):
+        # Blocks are 16-byte aligned. Return 0 when the heap is exhausted.
+        address = self.__heap_next
+        end = address + ((size + 0xf) & ~0xf)
+
+        if end > self.__heap_end:
+            return 0
+
+        self.__heap_next = end
+
+        if self.__ir_emulator.taint_enabled:
+            self.__ir_emulator.clear_memory_taint(address, end - address)
+
+        return address
+
+    def __copy(self, dst, src, size):
+        if not size:
+            return
+
+        memory = self.__ir_emulator.memory
+
+        memory.write_bytes(dst, memory.read_bytes(src, size))
+
+        if self.__ir_emulator.taint_enabled:
+            # Copy taint byte by byte (the source may overlap the target).
+            masks = [self.__ir_emulator.get_memory_taint_mask(src + i, 1) for i in range(size)]
+
+            for i, mask in enumerate(masks):
+                self.__ir_emulator.set_memory_taint(dst + i, 1, mask)
+
+    def __string_length(self, address):
+        # Read aligned chunks, as optimized implementations do, so a read
+        # does not cross a page unless the string does.
+        memory = self.__ir_emulator.memory
+        start = address
+
+        while True:
+            size = LIBC_STRING_CHUNK_SIZE - (address % LIBC_STRING_CHUNK_SIZE)
+
+            index = memory.read_bytes(address, size).find(b"\x00")
+
+            if index != -1:
+                return address + index - start
+
+            address += size
+
+    def __get_taint(self, address, size):
+        if not self.__ir_emulator.taint_enabled:
+            return 0
+
+        return self.__ir_emulator.get_memory_taint_mask(address, size)
+
+    @staticmethod
+    def __get_calling_convention(arch_info, ir_emulator):
+        if isinstance(arch_info, X86ArchitectureInformation):
+            if arch_info.architecture_mode == ARCH_X86_MODE_32:
+                return X86SystemV(ir_emulator)
+
+            return X86_64SystemV(ir_emulator)
+
+        if isinstance(arch_info, ArmArchitectureInformation):
+            return ArmSystemV(ir_emulator)
+
+        raise Exception("Invalid architecture.")
@@ -22,6 +22,20 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from __future__ import absolute_import
+
+import binascii
+import json
+
+from collections import OrderedDict
+
+
+# Default maximum number of entries of a TranslationCache.
+TRANSLATION_CACHE_SIZE = 0x10000
+
+# Version of the TranslationCache file format.
+TRANSLATION_CACHE_VERSION = 2
+
 
 def extract_sign_bit(value, size):
     return value >> (size-1)
@@ -101,23 +115,352 @@ class InvalidAddressError(Exception):
     pass
 
 
+class ExecutionCacheEntry(object):
+
+    """A decoded and translated instruction of an ExecutionCache.
+
+    Entries are linked to the entries of their successors (see link), so
+    consecutive instructions can be dispatched without cache lookups.
+    """
+
+    __slots__ = [
+        'instruction',
+        'sequence',
+        'ip',
+        'fallthrough',
+        'branch',
+        'successors',
+    ]
+
+    def __init__(self, instruction, sequence, ip=None):
+        self.instruction = instruction
+
+        # Translation of the instruction.
+        self.sequence = sequence
+
+        # Value of the instruction pointer while it executes (or None).
+        self.ip = ip
+
+        # Address of the next instruction.
+        self.fallthrough = instruction.address + instruction.size
+
+        # Whether the instruction is a branch (None if unknown).
+        self.branch = None
+
+        # Linked entries, by address.
+        self.successors = {}
+
+
 class ExecutionCache(object):
 
+    """Cache of decoded and translated instructions (and compiled blocks)
+    by address.
+
+    Entries are indexed by the bytes of code they were built from, so
+    they can be dropped when that code changes (see invalidate). Entries
+    and blocks can be linked to their successors (see link and
+    link_block); when an entry or block is dropped, only the links to it
+    are.
+    """
+
     def __init__(self):
         self.__container = {}
+        self.__blocks = {}
+
+        # Addresses of the entries (and blocks) built from each byte.
+        self.__bytes = {}
+        self.__block_bytes = {}
+
+        # Addresses of the entries (and blocks) linked to each address.
+        self.__predecessors = {}
+        self.__block_predecessors = {}
+
+        # Addresses where no block could be compiled.
+        self.__no_blocks = set()
 
-    def add(self, address, instruction, container):
-        # NOTE Does not take into account self modifying code.
+    def add(self, address, instruction, sequence, ip=None):
+        """Add an instruction and its translation. Return its entry.
+        """
         if address in self.__container:
             raise Exception("Invalid instruction")
 
-        self.__container[address] = (instruction, container)
+        entry = ExecutionCacheEntry(instruction, sequence, ip)
+
+        self.__container[address] = entry
+
+        self.__index(self.__bytes, address, address + instruction.size)
+
+        return entry
 
     def retrieve(self, address):
         if address not in self.__container:
-            # print("cache miss!")
             raise InvalidAddressError()
 
-        # print("cache hit!")
-
         return self.__container[address]
+
+    def get(self, address):
+        """Return the entry at address, or None.
+        """
+        return self.__container.get(address)
+
+    def link(self, entry, address, successor):
+        """Link an entry to the entry of its successor at address.
+        """
+        entry.successors[address] = successor
+
+        self.__predecessors.setdefault(address, set()).add(entry.instruction.address)
+
+    def add_block(self, address, block, end=None):
+        """Add a compiled block of the instructions in [address, end), or
+        None if no block can be compiled at address. The last element of a
+        block is the dictionary of its links.
+        """
+        if block is None:
+            self.__no_blocks.add(address)
+
+            return
+
+        self.__blocks[address] = block
+
+        self.__index(self.__block_bytes, address, end if end else address + 1)
+
+    def retrieve_block(self, address):
+        if address in self.__no_blocks:
+            return None
+
+        if address not in self.__blocks:
+            raise InvalidAddressError()
+
+        return self.__blocks[address]
+
+    def link_block(self, block, address, successor):
+        """Link a block to the block of its successor at address.
+        """
+        block[-1][address] = successor
+
+        # Blocks are added by the address of their first instruction.
+        block_address = block[3][0][0]
+
+        self.__block_predecessors.setdefault(address, set()).add(block_address)
+
+    def clear_blocks(self):
+        self.__blocks.clear()
+        self.__block_bytes.clear()
+        self.__no_blocks.clear()
+
+        self.unlink()
+
+    def unlink(self):
+        """Drop the links between entries (and blocks).
+        """
+        for entry in self.__container.values():
+            entry.successors.clear()
+
+        for block in self.__blocks.values():
+            block[-1].clear()
+
+        self.__predecessors.clear()
+        self.__block_predecessors.clear()
+
+    def invalidate(self, start, end):
+        """Drop the entries and blocks built from bytes in [start, end),
+        and the links to them.
+        """
+        dropped = self.__invalidate(self.__bytes, self.__container, start, end)
+
+        self.__unlink(dropped, self.__predecessors, self.__container,
+                      lambda entry: entry.successors)
+
+        dropped = self.__invalidate(self.__block_bytes, self.__blocks, start, end)
+
+        self.__unlink(dropped, self.__block_predecessors, self.__blocks,
+                      lambda block: block[-1])
+
+        # The changed code may compile now.
+        self.__no_blocks.clear()
+
+    def __len__(self):
+        return len(self.__container)
+
+    @staticmethod
+    def __index(index, start, end):
+        for address in range(start, end):
+            index.setdefault(address, set()).add(start)
+
+    @staticmethod
+    def __invalidate(index, entries, start, end):
+        """Drop the entries indexed by the bytes in [start, end). Return
+        their addresses.
+        """
+        if not index:
+            return []
+
+        if end - start > len(index):
+            addresses = [address for address in index if start <= address < end]
+        else:
+            addresses = range(start, end)
+
+        dropped = []
+
+        for address in addresses:
+            for entry_address in index.pop(address, ()):
+                if entries.pop(entry_address, None) is not None:
+                    dropped.append(entry_address)
+
+        return dropped
+
+    @staticmethod
+    def __unlink(dropped, predecessors, entries, links):
+        """Drop the links to the entries at the dropped addresses.
+        """
+        for address in dropped:
+            for predecessor_address in predecessors.pop(address, ()):
+                predecessor = entries.get(predecessor_address)
+
+                if predecessor is not None:
+                    links(predecessor).pop(address, None)
+
+
+class TranslationCache(object):
+
+    """Cache of native instruction translations.
+
+    Entries are (instruction, REIL instructions) pairs keyed by
+    architecture, architecture mode, address and instruction bytes, so
+    a translation is reused as long as the code does not change. The
+    cache holds at most *max_size* entries and evicts the least recently
+    used ones. It can be saved to (and loaded from) a file, which only
+    holds the location and bytes of each instruction.
+    """
+
+    def __init__(self, max_size=TRANSLATION_CACHE_SIZE):
+        self.__max_size = max_size
+
+        # Entries, (arch, mode, address, bytes) -> (instruction, REIL
+        # instructions), in least recently used order.
+        self.__entries = OrderedDict()
+
+        # Instruction sizes seen at each location, (arch, mode, address)
+        # -> {size: number of entries}.
+        self.__sizes = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, arch, mode, address, encoding):
+        """Return the translation of the instruction at *address* whose
+        bytes are a prefix of *encoding*, or None.
+        """
+        sizes = self.__sizes.get((arch, mode, address))
+
+        if sizes:
+            for size in sizes:
+                key = (arch, mode, address, bytes(encoding[:size]))
+
+                entry = self.__entries.pop(key, None)
+
+                if entry is not None:
+                    # Mark it as the most recently used.
+                    self.__entries[key] = entry
+
+                    self.hits += 1
+
+                    return entry
+
+        self.misses += 1
+
+        return None
+
+    def add(self, arch, mode, asm_instr, reil_instrs):
+        """Add the translation of an instruction.
+        """
+        key = (arch, mode, asm_instr.address, bytes(asm_instr.bytes))
+
+        if key in self.__entries:
+            self.__entries.pop(key)
+        else:
+            sizes = self.__sizes.setdefault(key[:3], {})
+            sizes[asm_instr.size] = sizes.get(asm_instr.size, 0) + 1
+
+        self.__entries[key] = (asm_instr, list(reil_instrs))
+
+        while len(self.__entries) > self.__max_size:
+            self.__evict()
+
+    def clear(self):
+        self.__entries.clear()
+        self.__sizes.clear()
+
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, filename):
+        """Save the cache to a file (JSON). Only the architecture, mode,
+        address and bytes of each instruction are saved.
+        """
+        entries = [[arch, mode, address, binascii.hexlify(encoding).decode("ascii")]
+                   for arch, mode, address, encoding in self.__entries]
+
+        with open(filename, "w") as f:
+            json.dump({"version": TRANSLATION_CACHE_VERSION, "entries": entries}, f)
+
+    def load(self, filename, arch_info, disassembler, translator):
+        """Add the entries saved in a file for an architecture. The saved
+        bytes are decoded and translated again, entries that do not decode
+        to an instruction of the same size are skipped. Files of other
+        versions are ignored.
+        """
+        with open(filename, "r") as f:
+            content = json.load(f)
+
+        if not isinstance(content, dict) or content.get("version") != TRANSLATION_CACHE_VERSION:
+            return
+
+        for entry in content.get("entries", []):
+            try:
+                arch, mode, address, encoding = entry
+
+                if arch != type(arch_info).__name__:
+                    continue
+
+                encoding = binascii.unhexlify(encoding)
+
+                asm_instr = disassembler.disassemble(encoding, address, architecture_mode=mode)
+
+                if not asm_instr or asm_instr.size != len(encoding):
+                    continue
+
+                reil_instrs = translator.translate(asm_instr)
+            except Exception:
+                # Invalid entry.
+                continue
+
+            self.add(arch, mode, asm_instr, reil_instrs)
+
+    @property
+    def max_size(self):
+        return self.__max_size
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __evict(self):
+        key = next(iter(self.__entries))
+
+        asm_instr, _ = self.__entries.pop(key)
+
+        sizes = self.__sizes[key[:3]]
+        sizes[asm_instr.size] -= 1
+
+        if sizes[asm_instr.size] == 0:
+            del sizes[asm_instr.size]
+
+        if not sizes:
+            del self.__sizes[key[:3]]
+
+
+# Process-wide translation cache, shared by all emulators by default.
+shared_translation_cache = TranslationCache()
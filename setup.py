@@ -22,6 +22,9 @@ setup(
         'pygments',
         'pyparsing',
     ],
+    extras_require   = {
+        'vector': ['numpy'],
+    },
     license          = 'BSD 2-Clause',
     name             = 'barf',
     classifiers      = [
@@ -911,6 +911,24 @@ class GadgetClassifierTests(unittest.TestCase):
         self.assertEqual(len(g_candidates), 3)
         self.assertEqual(len(g_classified), 0)
 
+    def test_classify_not_vectorized(self):
+        binary  = b"\x01\xd8"                 # 0x00 : (2) add eax, ebx
+        binary += b"\x8b\x4a\x08"             # 0x02 : (3) mov ecx, dword ptr [edx+0x8]
+        binary += b"\xc3"                     # 0x05 : (1) ret
+
+        g_finder = GadgetFinder(X86Disassembler(ARCH_X86_MODE_32), bytearray(binary), X86Translator(ARCH_X86_MODE_32), ARCH_X86, ARCH_X86_MODE_32)
+
+        g_candidates = g_finder.find(0x00000000, 0x00000005)
+
+        g_classifier = GadgetClassifier(self._ir_emulator, self._arch_info, vectorize=False)
+
+        # Both emulation strategies must classify gadgets the same way.
+        for g_candidate in g_candidates:
+            g_classified = [str(g) for g in g_classifier.classify(g_candidate)]
+            g_classified_vector = [str(g) for g in self._g_classifier.classify(g_candidate)]
+
+            self.assertEqual(g_classified, g_classified_vector)
+
     def print_candidates(self, candidates):
         print("Candidates :")
 
@@ -0,0 +1,155 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import unittest
+
+from barf.analysis.graphs import BasicBlock
+from barf.analysis.graphs import ControlFlowGraph
+from barf.analysis.graphs import FlagLivenessAnalysis
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.arch.x86.parser import X86Parser
+from barf.arch.x86.translator import X86Translator
+from barf.core.reil.emulator.emulator import ReilEmulator
+
+
+class FlagLivenessAnalysisTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        self._parser = X86Parser(ARCH_X86_MODE_32)
+        self._translator = X86Translator(ARCH_X86_MODE_32)
+        self._analysis = FlagLivenessAnalysis(self._arch_info)
+
+    def test_basic_block(self):
+        bb = self.__build_basic_block(0x1000, ["add eax, ecx", "adc eax, ebx", "dec ecx"])
+
+        liveness = self._analysis.analyze_basic_block(bb)
+
+        # ADC reads CF, DEC overwrites the rest of the flags (but CF).
+        self.assertEqual(liveness[0x1000], {"af": False, "cf": True, "of": False, "pf": False, "sf": False, "zf": False})
+        self.assertEqual(liveness[0x1002], {"af": False, "cf": True, "of": False, "pf": False, "sf": False, "zf": False})
+
+        # Flags are live at the end of the block.
+        self.assertTrue(all(liveness[0x1004].values()))
+
+    def test_basic_block_live_out(self):
+        bb = self.__build_basic_block(0x1000, ["add eax, ecx", "dec ecx"])
+
+        liveness = self._analysis.analyze_basic_block(bb, live_out=set(["zf"]))
+
+        self.assertEqual(set(flag for flag, live in liveness[0x1002].items() if live), set(["zf"]))
+        self.assertFalse(any(liveness[0x1000].values()))
+
+    def test_cfg(self):
+        # 0x1000: add eax, ecx
+        #         cmp eax, 0x10
+        #         jne 0x1000
+        # 0x1008: add eax, edx
+        #         ret
+        bb1 = self.__build_basic_block(0x1000, ["add eax, ecx", "cmp eax, 0x10", "jne 0x1000"])
+        bb1.taken_branch = 0x1000
+        bb1.not_taken_branch = 0x1006
+
+        bb2 = self.__build_basic_block(0x1006, ["add eax, edx", "ret"])
+        bb2.is_exit = True
+
+        cfg = ControlFlowGraph([bb1, bb2])
+
+        liveness = self._analysis.analyze_cfg(cfg)
+
+        # CMP overwrites every flag written by the first ADD.
+        self.assertFalse(any(liveness[0x1000].values()))
+
+        # Only ZF is read after CMP, the rest are overwritten by ADD in
+        # both successors.
+        self.assertEqual(set(flag for flag, live in liveness[0x1002].items() if live), set(["zf"]))
+
+        # Flags are live at the exit.
+        self.assertTrue(all(liveness[0x1006].values()))
+
+    def test_call(self):
+        bb = self.__build_basic_block(0x1000, ["add eax, ecx", "call 0x2000", "dec ecx"])
+
+        liveness = self._analysis.analyze_basic_block(bb)
+
+        # The callee might read the flags.
+        self.assertTrue(all(liveness[0x1000].values()))
+
+    def test_optimize_basic_block(self):
+        instrs = ["add eax, ecx", "adc eax, ebx", "sub ebx, eax", "xor ecx, ebx"]
+
+        bb = self.__build_basic_block(0x1000, instrs)
+        bb_opt = self.__build_basic_block(0x1000, instrs)
+
+        self._analysis.optimize_basic_block(bb_opt)
+
+        for asm_instr, asm_instr_opt in zip(bb.instrs[:-1], bb_opt.instrs[:-1]):
+            self.assertLess(len(asm_instr_opt.ir_instrs), len(asm_instr.ir_instrs))
+
+        self.assertEqual(len(bb_opt.instrs[-1].ir_instrs), len(bb.instrs[-1].ir_instrs))
+
+        # Check that the result is the same.
+        context = {"eax": 0x7fffffff, "ebx": 0x1, "ecx": 0x80000001, "eflags": 0x1}
+
+        self.assertEqual(self.__execute(bb, context), self.__execute(bb_opt, context))
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __build_basic_block(self, address, instrs):
+        bb = BasicBlock()
+
+        for instr in instrs:
+            asm = self._parser.parse(instr)
+            asm.address = address
+            asm.size = 2
+
+            asm.ir_instrs = self._translator.translate(asm)
+
+            bb.instrs.append(asm)
+
+            address += asm.size
+
+        return bb
+
+    def __execute(self, bb, context):
+        emulator = ReilEmulator(self._arch_info)
+
+        for reg, value in context.items():
+            emulator.registers[reg] = value
+
+        for asm_instr in bb.instrs:
+            emulator.execute_lite(asm_instr.ir_instrs)
+
+        return dict((reg, emulator.registers[reg]) for reg in ["eax", "ebx", "ecx", "eflags"])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -25,6 +25,8 @@
 from __future__ import absolute_import
 
 import os
+import shutil
+import tempfile
 import unittest
 
 from barf.arch import ARCH_ARM_MODE_ARM
@@ -35,11 +37,15 @@ from barf.arch.arm import ArmArchitectureInformation
 from barf.arch.arm.disassembler import ArmDisassembler
 from barf.arch.arm.translator import ArmTranslator
 from barf.arch.emulator import Emulator
+from barf.arch.emulator import FUZZ_STATUS_END
+from barf.arch.emulator import FUZZ_STATUS_TIMEOUT
 from barf.arch.x86 import X86ArchitectureInformation
 from barf.arch.x86.disassembler import X86Disassembler
 from barf.arch.x86.translator import X86Translator
 from barf.core.binary import BinaryFile
 from barf.core.reil.emulator.emulator import ReilEmulator
+from barf.core.reil.optimizer import ReilOptimizer
+from barf.utils.utils import TranslationCache
 
 
 def get_full_path(filename):
@@ -63,8 +69,492 @@ class EmulatorTests(unittest.TestCase):
 
         emu.load_binary(binary)
 
+        ir_emulator.registers["esp"] = 0x1000
+        ir_emulator.registers["ebp"] = 0x2000
+
+        emu.emulate(0x080483db, 0x8048407, {}, None, False)
+
+        # Check the loop counter (local variable at [ebp-0xc]).
+        self.assertEqual(ir_emulator.read_memory(0x1000 - 0x4 - 0xc, 4), 0xa)
+        self.assertEqual(ir_emulator.registers["ebp"], 0x2000)
+        self.assertEqual(ir_emulator.registers["eax"], 0x0)
+
+    def test_emulate_x86_close(self):
+        binary = BinaryFile(get_full_path("./samples/bin/loop-simple.x86"))
+        arch_mode = ARCH_X86_MODE_32
+        arch_info = X86ArchitectureInformation(arch_mode)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+        emu.load_binary(binary)
+
+        code = ir_emulator.read_memory(0x080483db, 4)
+
+        # The pages accessed before releasing the file remain, the rest
+        # are dropped...
+        emu.close()
+
+        self.assertEqual(ir_emulator.read_memory(0x080483db, 4), code)
+        self.assertEqual(ir_emulator.memory.try_read(0x08049f08, 4), (False, None))
+
+        # ...unless they are kept.
+        emu.load_binary(binary)
+
+        emu.close(keep=True)
+
+        self.assertEqual(ir_emulator.memory.try_read(0x08049f08, 4)[0], True)
+
+        # Reloading releases the previous mapping.
+        emu.load_binary(binary)
+        emu.load_binary(binary)
+
+        ir_emulator.registers["esp"] = 0x1000
+        ir_emulator.registers["ebp"] = 0x2000
+
         emu.emulate(0x080483db, 0x8048407, {}, None, False)
 
+        self.assertEqual(ir_emulator.read_memory(0x1000 - 0x4 - 0xc, 4), 0xa)
+
+        emu.close()
+
+    def test_emulate_x86_jit(self):
+        binary = BinaryFile(get_full_path("./samples/bin/loop-simple.x86"))
+        arch_mode = ARCH_X86_MODE_32
+        arch_info = X86ArchitectureInformation(arch_mode)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+        emu.load_binary(binary)
+
+        ir_emulator.registers["esp"] = 0x1000
+        ir_emulator.registers["ebp"] = 0x2000
+
+        emu.emulate(0x080483db, 0x8048407, {}, None, False, jit=True)
+
+        # Check the loop counter (local variable at [ebp-0xc]).
+        self.assertEqual(ir_emulator.read_memory(0x1000 - 0x4 - 0xc, 4), 0xa)
+        self.assertEqual(ir_emulator.registers["ebp"], 0x2000)
+        self.assertEqual(ir_emulator.registers["eax"], 0x0)
+
+    def test_emulate_x86_optimizer(self):
+        binary = BinaryFile(get_full_path("./samples/bin/loop-simple.x86"))
+        arch_mode = ARCH_X86_MODE_32
+        arch_info = X86ArchitectureInformation(arch_mode)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler, optimizer=ReilOptimizer(arch_info))
+
+        emu.load_binary(binary)
+
+        ir_emulator.registers["esp"] = 0x1000
+        ir_emulator.registers["ebp"] = 0x2000
+
+        emu.emulate(0x080483db, 0x8048407, {}, None, False, jit=True)
+
+        # Check the loop counter (local variable at [ebp-0xc]).
+        self.assertEqual(ir_emulator.read_memory(0x1000 - 0x4 - 0xc, 4), 0xa)
+        self.assertEqual(ir_emulator.registers["ebp"], 0x2000)
+        self.assertEqual(ir_emulator.registers["eax"], 0x0)
+
+    def test_emulate_x86_jit_loop(self):
+        # 0x00001000 : b8 00 00 00 00   mov eax, 0x0
+        # 0x00001005 : b9 e8 03 00 00   mov ecx, 0x3e8
+        # 0x0000100a : 01 c8            add eax, ecx
+        # 0x0000100c : 49               dec ecx
+        # 0x0000100d : 75 fb            jne 0x100a
+        code = bytearray(b"\xb8\x00\x00\x00\x00\xb9\xe8\x03\x00\x00\x01\xc8\x49\x75\xfb")
+
+        for jit in [False, True]:
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = X86Disassembler(ARCH_X86_MODE_32)
+            ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+            for i, b in enumerate(code):
+                emu.write_memory(0x1000 + i, 1, b)
+
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False, jit=jit)
+
+            self.assertEqual(ir_emulator.registers["eax"], 500500)
+            self.assertEqual(ir_emulator.registers["ecx"], 0x0)
+            self.assertEqual(ir_emulator.registers["eip"], 0x1000 + len(code))
+
+    def test_emulate_x86_jit_skip_dead_flags(self):
+        # Same code as in test_emulate_x86_jit_loop.
+        code = bytearray(b"\xb8\x00\x00\x00\x00\xb9\xe8\x03\x00\x00\x01\xc8\x49\x75\xfb")
+
+        results = []
+
+        for skip_dead_flags in [False, True]:
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = X86Disassembler(ARCH_X86_MODE_32)
+            ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler, skip_dead_flags=skip_dead_flags)
+
+            for i, b in enumerate(code):
+                emu.write_memory(0x1000 + i, 1, b)
+
+            ir_emulator.registers["eflags"] = 0x0
+
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False, jit=True)
+
+            results.append(dict(ir_emulator.registers))
+
+        self.assertEqual(results[0]["eax"], 500500)
+        self.assertEqual(results[0], results[1])
+
+    def test_emulate_x86_stats(self):
+        # Same code as in test_emulate_x86_jit_loop.
+        code = bytearray(b"\xb8\x00\x00\x00\x00\xb9\xe8\x03\x00\x00\x01\xc8\x49\x75\xfb")
+
+        for jit in [False, True]:
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = X86Disassembler(ARCH_X86_MODE_32)
+            ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+            for i, b in enumerate(code):
+                emu.write_memory(0x1000 + i, 1, b)
+
+            self.assertEqual(emu.stats, None)
+
+            stats = emu.enable_stats()
+
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False, jit=jit)
+
+            stats_dict = stats.as_dict()
+
+            self.assertEqual(ir_emulator.registers["eax"], 500500)
+            self.assertEqual(stats_dict["asm_instructions"], 3002)
+            self.assertEqual(stats_dict["asm_instructions_by_address"][0x100a], 1000)
+            self.assertEqual(stats_dict["reil_instructions_by_mnemonic"]["add"] >= 1000, True)
+            self.assertEqual(stats_dict["cache_misses"], 5)
+            self.assertTrue(stats_dict["elapsed"] > 0.0)
+            self.assertTrue('"0x100a": 1000' in stats.to_json())
+
+            emu.disable_stats()
+
+            self.assertEqual(emu.stats, None)
+
+    def test_emulate_x86_jit_max_instrs(self):
+        # Same code as in test_emulate_x86_jit_loop.
+        code = bytearray(b"\xb8\x00\x00\x00\x00\xb9\xe8\x03\x00\x00\x01\xc8\x49\x75\xfb")
+
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+        for i, b in enumerate(code):
+            emu.write_memory(0x1000 + i, 1, b)
+
+        # Compiled blocks must not run past the instruction limit.
+        emu.emulate(0x1000, 0x1000 + len(code), {}, 100, False, jit=True)
+
+        self.assertEqual(ir_emulator.registers["ecx"], 1000 - 33)
+
+    def test_emulate_x86_translation_cache(self):
+        # Same code as in test_emulate_x86_jit_loop.
+        code = bytearray(b"\xb8\x00\x00\x00\x00\xb9\xe8\x03\x00\x00\x01\xc8\x49\x75\xfb")
+
+        def emulate(translation_cache):
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = X86Disassembler(ARCH_X86_MODE_32)
+            ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler,
+                           translation_cache=translation_cache)
+
+            for i, b in enumerate(code):
+                emu.write_memory(0x1000 + i, 1, b)
+
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False)
+
+            self.assertEqual(ir_emulator.registers["eax"], 500500)
+
+        cache = TranslationCache()
+
+        # Each instruction is translated once...
+        emulate(cache)
+
+        self.assertEqual((len(cache), cache.hits, cache.misses), (5, 0, 5))
+
+        # ...and reused by other emulators.
+        emulate(cache)
+
+        self.assertEqual((len(cache), cache.hits, cache.misses), (5, 5, 5))
+
+        # Save and load it (instructions are translated again).
+        tmp_dir = tempfile.mkdtemp()
+
+        try:
+            filename = os.path.join(tmp_dir, "cache.json")
+
+            cache.save(filename)
+
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+            cache_loaded = TranslationCache()
+            cache_loaded.load(filename, arch_info, X86Disassembler(ARCH_X86_MODE_32),
+                              X86Translator(ARCH_X86_MODE_32))
+
+            # Entries of other architectures are skipped.
+            cache_other = TranslationCache()
+            cache_other.load(filename, ArmArchitectureInformation(ARCH_ARM_MODE_ARM),
+                             ArmDisassembler(ARCH_ARM_MODE_ARM), ArmTranslator(ARCH_ARM_MODE_ARM))
+
+            self.assertEqual(len(cache_other), 0)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        emulate(cache_loaded)
+
+        self.assertEqual((len(cache_loaded), cache_loaded.hits, cache_loaded.misses), (5, 5, 0))
+
+        # Least recently used entries are evicted.
+        cache_small = TranslationCache(max_size=2)
+
+        emulate(cache_small)
+
+        self.assertEqual(len(cache_small), 2)
+        self.assertEqual(("X86ArchitectureInformation", ARCH_X86_MODE_32, 0x100c, b"\x49") in cache_small, True)
+        self.assertEqual(("X86ArchitectureInformation", ARCH_X86_MODE_32, 0x100d, b"\x75\xfb") in cache_small, True)
+
+    def test_emulate_x86_self_modifying(self):
+        # 0x1000: mov ecx, 100
+        # 0x1005: xor eax, eax
+        # 0x1007: add eax, 1
+        # 0x100a: mov byte ptr [0x1009], 0x10     ; add eax, 1 -> add eax, 0x10
+        # 0x1011: dec ecx
+        # 0x1012: jne 0x1007
+        code = bytearray(b"\xb9\x64\x00\x00\x00\x31\xc0\x83\xc0\x01\xc6\x05\x09\x10\x00\x00\x10\x49\x75\xf3")
+
+        for jit in [False, True]:
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = X86Disassembler(ARCH_X86_MODE_32)
+            ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+            for i, b in enumerate(code):
+                emu.write_memory(0x1000 + i, 1, b)
+
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False, jit=jit)
+
+            self.assertEqual(ir_emulator.registers["eax"], 1 + 99 * 0x10)
+
+            stats = emu.enable_stats()
+
+            # Translations are kept between calls...
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False, jit=jit)
+
+            self.assertEqual(ir_emulator.registers["eax"], 100 * 0x10)
+            self.assertEqual(stats.cache_misses, 0)
+
+            # ...until the code is changed.
+            emu.write_memory(0x1009, 1, 0x1)
+
+            emu.emulate(0x1000, 0x1000 + len(code), {}, None, False, jit=jit)
+
+            self.assertEqual(ir_emulator.registers["eax"], 1 + 99 * 0x10)
+            self.assertEqual(stats.cache_misses, 2)
+
+    def test_emulate_x86_links(self):
+        # 0x1000: mov ecx, 100
+        # 0x1005: xor eax, eax
+        # 0x1007: add eax, 1
+        # 0x100a: dec ecx
+        # 0x100b: jne 0x1007
+        code = bytearray(b"\xb9\x64\x00\x00\x00\x31\xc0\x83\xc0\x01\x49\x75\xfa")
+
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+        for i, b in enumerate(code):
+            emu.write_memory(0x1000 + i, 1, b)
+
+        emu.emulate(0x1000, 0x1000 + len(code), {}, None, False)
+
+        self.assertEqual(ir_emulator.registers["eax"], 100)
+        self.assertEqual(ir_emulator.registers["eip"], 0x1000 + len(code))
+
+        # Linked instructions stop at the maximum number of instructions...
+        emu.emulate(0x1000, 0x1000 + len(code), {}, 10, False)
+
+        self.assertEqual(ir_emulator.registers["eax"], 3)
+
+        # ...and at hooks added later.
+        calls = []
+
+        def hook(emulator, param):
+            calls.append(param)
+
+            emulator.registers["eax"] += 1
+
+        hooks = {0x100a: (hook, None, False, 0)}
+
+        emu.emulate(0x1000, 0x1000 + len(code), hooks, None, False)
+
+        self.assertEqual(len(calls), 100)
+        self.assertEqual(ir_emulator.registers["eax"], 200)
+
+    def test_fuzz_harness_x86(self):
+        # 0x0ffb: mov ecx, 5
+        # 0x1000: mov al, byte ptr [0x3000]
+        # 0x1005: cmp al, 0x46
+        # 0x1007: jne 0x1018
+        # 0x1009: mov al, byte ptr [0x3001]
+        # 0x100e: cmp al, 0x4c
+        # 0x1010: je 0x101a
+        # 0x1012: cmp al, 0x55
+        # 0x1014: jne 0x1018
+        # 0x1016: (invalid)
+        # 0x1018: nop
+        # 0x1019: nop
+        # 0x101a: jmp 0x101a
+        code = bytearray(b"\xb9\x05\x00\x00\x00"
+                         b"\xa0\x00\x30\x00\x00\x3c\x46\x75\x0f"
+                         b"\xa0\x01\x30\x00\x00\x3c\x4c\x74\x08"
+                         b"\x3c\x55\x75\x02"
+                         b"\xff\xff\x90\x90\xeb\xfe")
+
+        for jit in [False, True]:
+            arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = X86Disassembler(ARCH_X86_MODE_32)
+            ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+            ir_emulator.memory.write_bytes(0x0ffb, bytes(code))
+
+            harness = emu.fuzz_harness(0x0ffb, 0x1000, 0x1018, max_instrs=100, jit=jit)
+            harness.add_input(0x3000, 2)
+
+            self.assertEqual(ir_emulator.registers["ecx"], 5)
+
+            result = harness.run(b"AA")
+
+            self.assertEqual(result.status, FUZZ_STATUS_END)
+            self.assertEqual(result.address, 0x1018)
+            self.assertTrue(result.new_coverage)
+
+            # Same path, no new coverage.
+            self.assertFalse(harness.run(b"BA").new_coverage)
+
+            # Not taken branches are edges too.
+            self.assertTrue(harness.run(b"FA").new_coverage)
+            self.assertFalse(harness.run(b"FB").new_coverage)
+
+            result = harness.run(b"FL")
+
+            self.assertEqual(result.status, FUZZ_STATUS_TIMEOUT)
+            self.assertEqual(result.address, 0x101a)
+            self.assertTrue(result.new_coverage)
+
+            result = harness.run(b"FU")
+
+            self.assertTrue(result.crashed)
+            self.assertEqual(result.address, 0x1016)
+            self.assertTrue("DisassemblerError" in result.error)
+
+            self.assertEqual(harness.executions, 6)
+            self.assertEqual([data for data, _ in harness.crashes], [b"FU"])
+            self.assertEqual(len([entry for entry in harness.bitmap if entry]), 7)
+
+            # Runs do not change the snapshot, so code is decoded once.
+            stats = emu.enable_stats()
+
+            for data in [b"AA", b"FA", b"FL", b"FU"]:
+                harness.run(data)
+
+            self.assertEqual(stats.cache_misses, 1)
+
+            # Runs are bounded by default.
+            harness = emu.fuzz_harness(0x1000, 0x1000, 0x1018, jit=jit)
+            harness.add_input(0x3000, 2)
+
+            result = harness.run(b"FL")
+
+            self.assertEqual(result.status, FUZZ_STATUS_TIMEOUT)
+            self.assertEqual(result.address, 0x101a)
+
+    def test_fuzz_harness_x86_buckets(self):
+        # 0x1000: movzx ecx, byte ptr [0x3000]
+        # 0x1007: dec ecx
+        # 0x1008: jne 0x1007
+        # 0x100a: nop
+        code = b"\x0f\xb6\x0d\x00\x30\x00\x00\x49\x75\xfd\x90"
+
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+        ir_emulator.memory.write_bytes(0x1000, code)
+
+        harness = emu.fuzz_harness(0x1000, 0x1000, 0x100a)
+        harness.add_input(0x3000, 1)
+
+        # The loop back edge is taken (input - 2) times. Hit counts 1, 2
+        # and 3 are different buckets, 4 to 7 are the same one.
+        for data, new_coverage in [(b"\x03", True), (b"\x04", True), (b"\x05", True), (b"\x06", True),
+                                   (b"\x09", False), (b"\x0a", True)]:
+            self.assertEqual(harness.run(data).new_coverage, new_coverage, data)
+
+    def test_emulate_x86_hook(self):
+        # 0x1000: mov ecx, 100
+        # 0x1005: xor eax, eax
+        # 0x1007: add eax, 1
+        code = bytearray(b"\xb9\x64\x00\x00\x00\x31\xc0\x83\xc0\x01")
+
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        ir_emulator = ReilEmulator(arch_info)
+        disassembler = X86Disassembler(ARCH_X86_MODE_32)
+        ir_translator = X86Translator(ARCH_X86_MODE_32)
+
+        emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+        for i, b in enumerate(code):
+            emu.write_memory(0x1000 + i, 1, b)
+
+        calls = []
+
+        def hook(emulator, param):
+            calls.append(param)
+
+        # The hooked instruction is executed after the hook.
+        hooks = {0x1005: (hook, 0x1005, False, 0)}
+
+        emu.emulate(0x1000, 0x1000 + len(code), hooks, None, False)
+
+        self.assertEqual(calls, [0x1005])
+        self.assertEqual(ir_emulator.registers["eax"], 1)
+
     def test_emulate_x86_64(self):
         binary = BinaryFile(get_full_path("./samples/bin/loop-simple.x86_64"))
         arch_mode = ARCH_X86_MODE_64
@@ -93,6 +583,36 @@ class EmulatorTests(unittest.TestCase):
 
         emu.emulate(0x10400, 0x10460, {}, None, True)
 
+    def test_emulate_arm_jit(self):
+        binary = BinaryFile(get_full_path("./samples/bin/loop-simple.arm"))
+        arch_mode = ARCH_ARM_MODE_ARM
+        arch_info = ArmArchitectureInformation(arch_mode)
+
+        results = []
+
+        for jit in [False, True]:
+            ir_emulator = ReilEmulator(arch_info)
+            disassembler = ArmDisassembler(architecture_mode=ARCH_ARM_MODE_ARM)
+            ir_translator = ArmTranslator(architecture_mode=ARCH_ARM_MODE_ARM)
+
+            emu = Emulator(arch_info, ir_emulator, ir_translator, disassembler)
+
+            emu.load_binary(binary)
+
+            for reg in arch_info.registers_gp_base + ["apsr"]:
+                ir_emulator.registers[reg] = 0x0
+
+            ir_emulator.registers["r11"] = 0x2000
+            ir_emulator.registers["r13"] = 0x1000
+
+            ir_emulator.write_memory(0xf00, 0x200, 0x0)
+
+            emu.emulate(0x10400, 0x10460, {}, None, False, jit=jit)
+
+            results.append((dict(ir_emulator.registers), ir_emulator.read_memory(0xf00, 0x200)))
+
+        self.assertEqual(results[0], results[1])
+
     def test_emulate_arm_thumb(self):
         binary = BinaryFile(get_full_path("./samples/bin/loop-simple.arm_thumb"))
         arch_mode = ARCH_ARM_MODE_THUMB
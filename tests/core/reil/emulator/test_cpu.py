@@ -26,6 +26,8 @@ from __future__ import absolute_import
 
 import unittest
 
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86 import X86ArchitectureInformation
 from barf.core.reil.emulator import ReilCpu
 from barf.core.reil.emulator import ReilMemoryEx
 from barf.core.reil.parser import ReilParser
@@ -341,3 +343,92 @@ class ReilCpuTests(unittest.TestCase):
         cpu.execute(instr)
 
         self.assertEquals((t0 % t1) & 2**32-1, cpu.registers['t2'])
+
+    # Compiled instructions
+    def test_compile(self):
+        instrs = self.__parser.parse([
+            "add [DWORD t0, DWORD t1, DWORD t2]",
+            "sub [DWORD t0, DWORD t1, DWORD t3]",
+            "bsh [DWORD t0, DWORD 0xfffffffc, DWORD t4]",
+            "bsh [DWORD t0, DWORD t1, QWORD t5]",
+            "sdiv [DWORD t0, DWORD t1, DWORD t6]",
+            "smod [DWORD t0, DWORD t1, DWORD t7]",
+            "smul [DWORD t0, DWORD t1, QWORD t8]",
+            "bisz [DWORD t0, EMPTY, BIT t9]",
+            "sext [DWORD t0, EMPTY, QWORD t10]",
+            "ldm [DWORD t1, EMPTY, WORD t11]",
+        ])
+
+        for t0, t1 in [(0x12345678, 0x1234), (-0x12345678 & 2**32-1, 0x4)]:
+            for instr in instrs:
+                instr.address = 0xcafecafe00
+
+                cpu_interp = ReilCpu(ReilMemoryEx(self.__address_size))
+                cpu_interp.registers['t0'] = t0
+                cpu_interp.registers['t1'] = t1
+                cpu_interp.memory.write(t1, 2, 0xcafe)
+
+                cpu_comp = ReilCpu(ReilMemoryEx(self.__address_size))
+                cpu_comp.registers['t0'] = t0
+                cpu_comp.registers['t1'] = t1
+                cpu_comp.memory.write(t1, 2, 0xcafe)
+
+                cpu_interp.execute(instr)
+                cpu_comp.compile(instr)()
+
+                self.assertEqual(cpu_interp.registers, cpu_comp.registers, str(instr))
+
+    def test_compile_stm(self):
+        mem = ReilMemoryEx(self.__address_size)
+        cpu = ReilCpu(mem)
+
+        instr = self.__parser.parse(["stm [DWORD t0, EMPTY, DWORD t1]"])[0]
+        instr.address = 0xcafecafe00
+
+        t0 = 0xdeadbeef
+        t1 = 0x12345678
+
+        cpu.registers['t0'] = t0
+        cpu.registers['t1'] = t1
+
+        cpu.compile(instr)()
+
+        self.assertEqual(t0, mem.read(t1, 4))
+
+    def test_compile_jcc(self):
+        mem = ReilMemoryEx(self.__address_size)
+        cpu = ReilCpu(mem)
+
+        instr = self.__parser.parse(["jcc [BIT t0, EMPTY, POINTER t1]"])[0]
+        instr.address = 0xcafecafe00
+
+        fn = cpu.compile(instr)
+
+        cpu.registers['t1'] = 0x1234567800
+
+        cpu.registers['t0'] = 0x1
+        self.assertEqual(0x1234567800, fn())
+
+        cpu.registers['t0'] = 0x0
+        self.assertEqual(None, fn())
+
+    def test_compile_register_alias(self):
+        mem = ReilMemoryEx(self.__address_size)
+        cpu = ReilCpu(mem, arch=X86ArchitectureInformation(ARCH_X86_MODE_32))
+
+        instrs = self.__parser.parse([
+            "str [BYTE 0x12, EMPTY, BYTE al]",
+            "str [BYTE 0x34, EMPTY, BYTE ah]",
+            "add [WORD ax, WORD 0x1, WORD bx]",
+        ])
+
+        cpu.registers['eax'] = 0xdeadbeef
+        cpu.registers['ebx'] = 0xcafecafe
+
+        for instr in instrs:
+            cpu.compile(instr)()
+
+        self.assertEqual(0xdead3412, cpu.registers['eax'])
+        self.assertEqual(0xcafe3413, cpu.registers['ebx'])
+        self.assertEqual({'ax'}, cpu.read_registers)
+        self.assertEqual({'al', 'ah', 'bx'}, cpu.written_registers)
@@ -30,6 +30,7 @@ from barf.arch import ARCH_X86_MODE_32
 from barf.arch.x86 import X86ArchitectureInformation
 from barf.arch.x86.parser import X86Parser
 from barf.arch.x86.translator import X86Translator
+from barf.core.reil import ReilMnemonic
 from barf.core.reil.container import ReilContainer
 from barf.core.reil.container import ReilSequence
 from barf.core.reil.emulator import ReilCpuInvalidAddressError
@@ -163,6 +164,106 @@ class ReilEmulatorTests(unittest.TestCase):
 
         self.assertTrue(len(paramter) > 0)
 
+    def test_hooks(self):
+        def hook(emulator, instruction, parameter):
+            parameter.append(instruction)
+
+        asm_instrs = [self._asm_parser.parse("mov [ebx], eax")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = self._translator.translate(asm_instrs[0])
+
+        self.assertFalse(self._emulator.hooked)
+
+        all_instrs, stm_instrs, first_instrs = [], [], []
+
+        self._emulator.add_hook(hook, all_instrs)
+        self._emulator.add_hook(hook, stm_instrs, mnemonics=[ReilMnemonic.STM], pre=True)
+        handle = self._emulator.add_hook(hook, first_instrs, addresses=[reil_instrs[0].address])
+
+        self.assertTrue(self._emulator.hooked)
+
+        self._emulator.execute_lite(reil_instrs)
+
+        self.assertEqual(all_instrs, reil_instrs)
+        self.assertEqual([instr.mnemonic for instr in stm_instrs], [ReilMnemonic.STM])
+        self.assertEqual(first_instrs, [reil_instrs[0]])
+
+        self._emulator.remove_hook(handle)
+
+        self._emulator.execute_lite(reil_instrs)
+
+        self.assertEqual(len(all_instrs), 2 * len(reil_instrs))
+        self.assertEqual(len(first_instrs), 1)
+
+        # Hooks are copied to forked emulators.
+        fork = self._emulator.fork()
+
+        fork.execute_lite(reil_instrs)
+
+        self.assertEqual(len(all_instrs), 3 * len(reil_instrs))
+
+    def test_taint_enabled_on_demand(self):
+        asm_instrs = [self._asm_parser.parse("mov ecx, eax")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = self._translator.translate(asm_instrs[0])
+
+        self.assertFalse(self._emulator.taint_enabled)
+
+        self._emulator.set_register_taint("eax", True)
+
+        self.assertTrue(self._emulator.taint_enabled)
+
+        self._emulator.execute_lite(reil_instrs)
+
+        self.assertTrue(self._emulator.get_register_taint("ecx"))
+
+        self._emulator.disable_taint()
+
+        self.assertFalse(self._emulator.hooked)
+
+    def test_taint_opt_in(self):
+        asm_instrs = [self._asm_parser.parse("mov ecx, eax")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = self._translator.translate(asm_instrs[0])
+
+        # Nothing tainted, no propagation.
+        self._emulator.execute_lite(reil_instrs)
+
+        self.assertFalse(self._emulator.taint_enabled)
+        self.assertFalse(self._emulator.hooked)
+        self.assertFalse(self._emulator.get_register_taint("ecx"))
+
+        # Clearing taint does not enable it.
+        self._emulator.set_register_taint("eax", False)
+
+        self.assertFalse(self._emulator.taint_enabled)
+
+        # Restoring a snapshot with taint enables it.
+        self._emulator.set_register_taint("eax", True)
+
+        snapshot = self._emulator.snapshot()
+
+        self._emulator.disable_taint()
+        self._emulator.restore(snapshot)
+
+        self.assertTrue(self._emulator.taint_enabled)
+
+        self._emulator.execute_lite(reil_instrs)
+
+        self.assertTrue(self._emulator.get_register_taint("ecx"))
+
+        # Explicitly enabled, without anything tainted.
+        emulator = ReilEmulator(self._arch_info)
+        emulator.enable_taint()
+
+        self.assertTrue(emulator.hooked)
+
     def test_zero_division_error_1(self):
         asm_instrs  = [self._asm_parser.parse("div ebx")]
 
@@ -218,6 +319,143 @@ class ReilEmulatorTests(unittest.TestCase):
 
         self.assertRaises(ReilCpuInvalidAddressError, self._emulator.execute, reil_instrs, start=0xdeadbef0 << 8, registers=regs_initial)
 
+    def test_execute_lite_sequence(self):
+        asm_instrs  = [self._asm_parser.parse("mov eax, 0xdeadbeef")]
+        asm_instrs += [self._asm_parser.parse("mov al, 0x12")]
+        asm_instrs += [self._asm_parser.parse("mov ah, 0x34")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = ReilSequence()
+
+        for asm_instr in asm_instrs:
+            for reil_instr in self._translator.translate(asm_instr):
+                reil_instrs.append(reil_instr)
+
+        regs_initial = {
+            "eax" : 0xffffffff,
+        }
+
+        for _ in range(2):
+            regs_final, _ = self._emulator.execute_lite(reil_instrs, context=regs_initial)
+
+            self.assertEqual(regs_final["eax"], 0xdead3412)
+
+        self.assertNotEqual(reil_instrs.compiled, None)
+
+    def test_execute_sequence(self):
+        asm_instr = self._asm_parser.parse("jmp 0x12345678")
+        asm_instr.address = 0xdeadbeef
+        asm_instr.size = 5
+
+        reil_instrs = self.__translate([asm_instr])
+
+        next_addr = self._emulator.execute_sequence(reil_instrs.fetch_sequence(0xdeadbeef << 8))
+
+        self.assertEqual(next_addr, 0x12345678 << 8)
+
+        asm_instr = self._asm_parser.parse("add eax, 0x1")
+        asm_instr.address = 0xdeadbeef
+        asm_instr.size = 3
+
+        reil_instrs = self.__translate([asm_instr])
+
+        self._emulator.registers["eax"] = 0x1
+
+        next_addr = self._emulator.execute_sequence(reil_instrs.fetch_sequence(0xdeadbeef << 8))
+
+        self.assertEqual(next_addr, None)
+        self.assertEqual(self._emulator.registers["eax"], 0x2)
+
+    def test_snapshot_restore(self):
+        asm_instrs = [self._asm_parser.parse("add eax, 0x1")]
+        asm_instrs += [self._asm_parser.parse("mov [ebx], eax")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = ReilSequence()
+
+        for asm_instr in asm_instrs:
+            for reil_instr in self._translator.translate(asm_instr):
+                reil_instrs.append(reil_instr)
+
+        self._emulator.registers["eax"] = 0x1
+        self._emulator.registers["ebx"] = 0x1000
+        self._emulator.set_register_taint("eax", True)
+
+        snapshot = self._emulator.snapshot()
+
+        for _ in range(2):
+            self._emulator.execute_lite(reil_instrs)
+
+            self.assertEqual(self._emulator.registers["eax"], 0x2)
+            self.assertEqual(self._emulator.read_memory(0x1000, 4), 0x2)
+            self.assertTrue(self._emulator.get_memory_taint(0x1000, 4))
+
+            self._emulator.restore(snapshot)
+
+            self.assertEqual(self._emulator.registers["eax"], 0x1)
+            self.assertEqual(self._emulator.memory.try_read(0x1000, 4), (False, None))
+            self.assertFalse(self._emulator.get_memory_taint(0x1000, 4))
+
+    def test_fork(self):
+        asm_instrs = [self._asm_parser.parse("mov [ebx], eax")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = self._translator.translate(asm_instrs[0])
+
+        self._emulator.registers["eax"] = 0x1
+        self._emulator.registers["ebx"] = 0x1000
+        self._emulator.write_memory(0x1000, 4, 0xdeadbeef)
+
+        fork = self._emulator.fork()
+
+        fork.execute_lite(reil_instrs)
+
+        self.assertEqual(fork.read_memory(0x1000, 4), 0x1)
+        self.assertEqual(self._emulator.read_memory(0x1000, 4), 0xdeadbeef)
+
+        fork.registers["eax"] = 0x2
+
+        self.assertEqual(self._emulator.registers["eax"], 0x1)
+
+    def test_stats(self):
+        asm_instrs = [self._asm_parser.parse("mov [ebx], eax")]
+        asm_instrs += [self._asm_parser.parse("mov ecx, [ebx]")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = ReilSequence()
+
+        for asm_instr in asm_instrs:
+            for reil_instr in self._translator.translate(asm_instr):
+                reil_instrs.append(reil_instr)
+
+        self._emulator.registers["eax"] = 0x1
+        self._emulator.registers["ebx"] = 0x1000
+
+        stats = self._emulator.enable_stats()
+
+        self._emulator.execute_lite(reil_instrs)
+
+        stats_dict = stats.as_dict()
+
+        self.assertEqual(stats_dict["reil_instructions"], len(reil_instrs))
+        self.assertEqual(stats_dict["reil_instructions_by_mnemonic"]["stm"], 1)
+        self.assertEqual(stats_dict["reil_instructions_by_mnemonic"]["ldm"], 1)
+        self.assertEqual(stats_dict["memory_writes"], 1)
+        self.assertEqual(stats_dict["memory_reads"], 1)
+        self.assertEqual(stats_dict["memory_reads_bytes"], 4)
+
+        self._emulator.disable_stats()
+
+        self._emulator.execute_lite(reil_instrs)
+
+        self.assertEqual(self._emulator.stats, None)
+        self.assertEqual(stats.as_dict(), stats_dict)
+        self.assertEqual(self._emulator.registers["ecx"], 0x1)
+
     # Auxiliary methods
     # ======================================================================== #
     def __set_address(self, address, asm_instrs):
@@ -0,0 +1,91 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import random
+import unittest
+
+from barf.core.reil.emulator import ReilIntervalMap
+
+
+class ReilIntervalMapTests(unittest.TestCase):
+
+    def test_set_clear(self):
+        intervals = ReilIntervalMap()
+
+        intervals.set(0x10, 0x20, True)
+        intervals.set(0x20, 0x30, True)
+        intervals.set(0x40, 0x50, True)
+
+        self.assertEqual(intervals.intervals(), [(0x10, 0x30, True), (0x40, 0x50, True)])
+
+        intervals.clear(0x18, 0x48)
+
+        self.assertEqual(intervals.intervals(), [(0x10, 0x18, True), (0x48, 0x50, True)])
+        self.assertTrue(intervals.any(0x0, 0x11))
+        self.assertFalse(intervals.any(0x18, 0x48))
+        self.assertEqual(intervals.get(0x17), True)
+        self.assertEqual(intervals.get(0x18), None)
+
+    def test_values(self):
+        intervals = ReilIntervalMap()
+
+        intervals.set(0x10, 0x20, 0x1)
+        intervals.set(0x18, 0x28, 0x2)
+
+        self.assertEqual(intervals.intervals(), [(0x10, 0x18, 0x1), (0x18, 0x28, 0x2)])
+        self.assertEqual(intervals.values(0x0, 0x19), [0x1, 0x2])
+        self.assertEqual(intervals.values(0x28, 0x30), [])
+
+    def test_random(self):
+        intervals = ReilIntervalMap()
+        reference = {}
+
+        for _ in range(2000):
+            start = random.randint(0, 0x100)
+            end = start + random.randint(0, 0x20)
+            value = random.choice([None, 0x1, 0x2])
+
+            intervals.set(start, end, value)
+
+            for address in range(start, end):
+                reference[address] = value
+
+            for address in range(0, 0x120):
+                self.assertEqual(intervals.get(address), reference.get(address))
+
+        # Intervals are disjoint, sorted and merged.
+        items = intervals.intervals()
+
+        for (_, end_1, value_1), (start_2, _, value_2) in zip(items, items[1:]):
+            self.assertTrue(end_1 < start_2 or (end_1 == start_2 and value_1 != value_2))
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import unittest
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.arch.x86.parser import X86Parser
+from barf.arch.x86.translator import X86Translator
+from barf.core.reil import ReilEmptyOperand
+from barf.core.reil import ReilImmediateOperand
+from barf.core.reil import ReilMnemonic
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.builder import ReilBuilder
+from barf.core.reil.container import ReilSequence
+from barf.core.reil.emulator import ReilBlockCompiler
+from barf.core.reil.emulator import ReilCpuZeroDivisionError
+from barf.core.reil.emulator import ReilEmulator
+from barf.core.reil.emulator import ReilMemoryEx
+from barf.core.reil.emulator import ReilRegisterFile
+from barf.core.reil.emulator import SEQUENCE_BRANCH
+from barf.core.reil.emulator import SEQUENCE_INVALID
+from barf.core.reil.emulator import SEQUENCE_STRAIGHT
+from barf.core.reil.helpers import to_asm_address
+
+
+class ReilBlockCompilerTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        self._compiler = ReilBlockCompiler(self._arch_info)
+
+        self._asm_parser = X86Parser(ARCH_X86_MODE_32)
+
+        self._translator = X86Translator(ARCH_X86_MODE_32)
+
+    def test_straight_code(self):
+        asm = [
+            "mov eax, 0x12345678",
+            "add eax, ebx",
+            "sub ecx, eax",
+            "xor ah, al",
+            "movsx edx, byte ptr [esi]",
+            "push eax",
+            "shl ebx, 3",
+            "shr edx, 2",
+            "imul ecx, ebx",
+            "mov word ptr [edi], cx",
+            "pop edi",
+            "and ebx, ecx",
+        ]
+
+        # Only arithmetic and logic flags that are defined for the last
+        # instruction are compared (ZF, SF).
+        self.__compare(asm, flags_mask=0xc0)
+
+    def test_branch(self):
+        asm = [
+            "add eax, 1",
+            "cmp eax, ebx",
+            "jne 0x2000",
+        ]
+
+        sequences = self.__translate(asm, 0x1000)
+
+        self.assertEqual(self._compiler.check_sequence(sequences[0]), SEQUENCE_STRAIGHT)
+        self.assertEqual(self._compiler.check_sequence(sequences[-1]), SEQUENCE_BRANCH)
+
+        block = self._compiler.compile(sequences)
+
+        regs = self.__registers({"eax": 0x1, "ebx": 0x5})
+        next_addr = block(regs, ReilMemoryEx(32))
+
+        self.assertEqual(to_asm_address(next_addr), 0x2000)
+        self.assertEqual(regs["eax"], 0x2)
+
+        regs = self.__registers({"eax": 0x4, "ebx": 0x5})
+        next_addr = block(regs, ReilMemoryEx(32))
+
+        self.assertEqual(next_addr, None)
+        self.assertEqual(regs["eax"], 0x5)
+
+    def test_invalid_sequence(self):
+        # Conditional move translates to an intra-instruction branch.
+        sequences = self.__translate(["cmovz eax, ebx"], 0x1000)
+
+        self.assertEqual(self._compiler.check_sequence(sequences[0]), SEQUENCE_INVALID)
+
+    def test_ip_update(self):
+        ip = ReilRegisterOperand("eip", 32)
+
+        sequences = self.__translate(["mov eax, ebx"], 0x1000)
+        sequences[0] = [ReilBuilder.gen_str(ReilImmediateOperand(0x1002, 32), ip)] + list(sequences[0])
+
+        block = self._compiler.compile(sequences)
+
+        regs = self.__registers({"ebx": 0x7})
+        block(regs, ReilMemoryEx(32))
+
+        self.assertEqual(regs, {"eip": 0x1002, "eax": 0x7, "ebx": 0x7})
+
+    def test_zero_division(self):
+        sequences = self.__translate(["mov eax, 1", "div ecx"], 0x1000)
+
+        block = self._compiler.compile(sequences)
+
+        regs = self.__registers({"ecx": 0x0, "edx": 0x0, "eax": 0x5})
+
+        self.assertRaises(ReilCpuZeroDivisionError, block, regs, ReilMemoryEx(32))
+
+        # Registers written before the exception are written back.
+        self.assertEqual(regs["eax"], 0x1)
+
+    def test_undef(self):
+        # UNDEF sets a random value of the size of the register, the same
+        # way in the interpreter, the compiled instructions and the JIT.
+        empty = ReilEmptyOperand()
+        undef = ReilBuilder.build(ReilMnemonic.UNDEF, empty, empty, ReilRegisterOperand("eax", 32))
+
+        sequence = ReilSequence()
+        sequence.append(undef)
+
+        block = self._compiler.compile([sequence])
+
+        emulator = ReilEmulator(self._arch_info)
+
+        values = {"interpreted": set(), "compiled": set(), "jit": set()}
+
+        for _ in range(32):
+            regs, _ = emulator.execute_lite([undef])
+            values["interpreted"].add(regs["eax"])
+
+            regs, _ = emulator.execute_lite(sequence)
+            values["compiled"].add(regs["eax"])
+
+            regs = self.__registers({})
+            block(regs, ReilMemoryEx(32))
+            values["jit"].add(regs["eax"])
+
+        for name in values:
+            self.assertTrue(max(values[name]) > 32, name)
+            self.assertTrue(max(values[name]) < 2**32, name)
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __registers(self, values):
+        regs = ReilRegisterFile(self._arch_info)
+
+        regs.update(values)
+
+        return regs
+
+    def __translate(self, asm, address):
+        sequences = []
+
+        for index, text in enumerate(asm):
+            asm_instr = self._asm_parser.parse(text)
+            asm_instr.address = address + index
+            asm_instr.size = 1
+
+            sequence = ReilSequence()
+
+            for reil_instr in self._translator.translate(asm_instr):
+                sequence.append(reil_instr)
+
+            sequences.append(sequence)
+
+        return sequences
+
+    def __compare(self, asm, flags_mask):
+        sequences = self.__translate(asm, 0x1000)
+
+        for sequence in sequences:
+            self.assertNotEqual(self._compiler.check_sequence(sequence), SEQUENCE_INVALID)
+
+        regs_initial = {
+            "eax": 0x11223344,
+            "ebx": 0x55667788,
+            "ecx": 0x99aabbcc,
+            "edx": 0xddeeff00,
+            "esi": 0x00002000,
+            "edi": 0x00003000,
+            "esp": 0x00004000,
+            "eflags": 0x0,
+        }
+
+        # Interpreted execution.
+        emulator = ReilEmulator(self._arch_info)
+        emulator.write_memory(0x2000, 4, 0x000000f0)
+
+        instrs = [instr for sequence in sequences for instr in sequence]
+
+        regs_expected, mem_expected = emulator.execute_lite(instrs, context=regs_initial)
+
+        # Compiled execution.
+        memory = ReilMemoryEx(32)
+        memory.write(0x2000, 4, 0x000000f0)
+
+        block = self._compiler.compile(sequences)
+
+        regs = self.__registers(regs_initial)
+
+        self.assertEqual(block(regs, memory), None)
+
+        regs_expected["eflags"] &= flags_mask
+        regs["eflags"] &= flags_mask
+
+        regs_expected = {name: value for name, value in regs_expected.items() if not name.startswith("t")}
+
+        self.assertEqual(regs, regs_expected)
+
+        for address, size in [(0x3000, 2), (0x3ffc, 4)]:
+            self.assertEqual(memory.read(address, size), mem_expected.read(address, size))
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,7 @@
 
 from __future__ import absolute_import
 
+import random
 import unittest
 
 from barf.core.reil.emulator import ReilMemory
@@ -101,6 +102,291 @@ class ReilMemoryTests(unittest.TestCase):
         self.assertEqual(addr0, addrs[0])
         self.assertEqual(addr1, addrs[1])
 
+    def test_page_boundary(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+
+        # Previous content is known only from the first checkpoint on.
+        memory.checkpoint()
+
+        memory.write(0x1ffe, 4, 0xdeadbeef)
+
+        self.assertEqual(memory.read(0x1ffe, 4), 0xdeadbeef)
+        self.assertEqual(memory.read(0x2000, 2), 0xdead)
+        self.assertEqual(memory.try_read(0x1ffd, 4), (False, None))
+        self.assertEqual(memory.get_addresses(), [0x1ffe, 0x1fff, 0x2000, 0x2001])
+        self.assertEqual(memory.read_inverse(0xdeadbeef, 4), [0x1ffe])
+
+        memory.write(0x1ffc, 4, 0x12345678)
+
+        self.assertEqual(memory.try_read_prev(0x1ffe, 2), (True, 0xbeef))
+        self.assertEqual(memory.try_read_prev(0x1ffc, 4), (False, None))
+        self.assertEqual(memory.get_write_count(), 2)
+
+        memory.write(0x1ffe, 2, 0xcafe)
+
+        # The previous content of each byte is the one before its last
+        # write.
+        self.assertEqual(memory.try_read_prev(0x1ffe, 2), (True, 0x1234))
+        self.assertEqual(memory.try_read_prev(0x1ffe, 4), (False, None))
+
+    def test_undefined_read(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+
+        memory.write(0x1000, 1, 0xff)
+
+        self.assertEqual(memory.try_read(0x1000, 2), (False, None))
+
+        # Reading undefined bytes defines them.
+        value = memory.read(0x1000, 2)
+
+        self.assertEqual(value & 0xff, 0xff)
+        self.assertEqual(memory.try_read(0x1000, 2), (True, value))
+
+    def test_map(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+
+        memory.write(0x1ffe, 2, 0xffff)
+
+        snapshot = memory.snapshot()
+
+        memory.map(0x1fff, bytearray(range(0x10)) * 0x200)
+
+        # Bytes already present are updated.
+        self.assertEqual(memory.read(0x1ffe, 2), 0x00ff)
+
+        self.assertEqual(memory.try_read(0x2000, 4), (True, 0x04030201))
+        self.assertEqual(memory.read(0x3ffd, 2), 0x0f0e)
+        self.assertTrue(0x3ffe in memory._memory)
+        self.assertTrue(0x3fff not in memory._memory)
+        self.assertEqual(memory.read_inverse(0x0f0e, 2)[:2], [0x200d, 0x201d])
+
+        memory.write(0x2000, 1, 0xaa)
+
+        self.assertEqual(memory.read(0x2000, 2), 0x02aa)
+
+        memory.restore(snapshot)
+
+        self.assertEqual(memory.try_read(0x2000, 1), (False, None))
+        self.assertEqual(memory.read(0x1ffe, 2), 0xffff)
+
+    def test_map_iterate(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+        memory_ref = ReilMemoryEx(address_size)
+
+        for mem in [memory, memory_ref]:
+            mem.map(0x1fff, bytearray(range(0x10)) * 0x200)
+            mem.map(0x3ff0, b"\x0e\x0f\x0e\x0f" * 0x8)
+            mem.write(0x2ffe, 4, 0x0f0e0f0e)
+            mem.write(0x5000, 2, 0x0f0e)
+
+        # The reference memory loads all mapped pages.
+        for address in range(0x1fff, 0x4010):
+            memory_ref.read(address, 1)
+
+        pages = len(memory._memory.snapshot()[0])
+
+        # Mapped pages are not loaded to iterate or search the memory.
+        self.assertEqual(memory.get_addresses(), memory_ref.get_addresses())
+        self.assertEqual(memory._memory.items(), memory_ref._memory.items())
+        self.assertEqual(len(memory._memory), len(memory_ref._memory))
+        self.assertEqual(memory.read_inverse(0x0f0e, 2), memory_ref.read_inverse(0x0f0e, 2))
+        self.assertEqual(len(memory._memory.snapshot()[0]), pages)
+
+    def test_watch(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+
+        changes = []
+
+        memory.watcher = lambda start, end: changes.append((start, end))
+
+        memory.write(0x1000, 4, 0xdeadbeef)
+
+        snapshot = memory.snapshot()
+
+        memory.watch(0x1000, 4)
+
+        # Writes to watched pages are reported if they change something.
+        memory.write(0x1002, 2, 0xdead)
+        memory.write(0x1ffe, 4, 0x12345678)
+        memory.write(0x2000, 4, 0x12345678)
+
+        self.assertEqual(changes, [(0x1ffe, 0x2000)])
+
+        # Restoring a snapshot reports the bytes that differ. The page is
+        # still watched.
+        memory.restore(snapshot)
+
+        self.assertEqual(changes, [(0x1ffe, 0x2000), (0x1ffe, 0x2000)])
+
+        memory.write(0x1000, 4, 0)
+
+        self.assertEqual(changes[2:], [(0x1000, 0x1004)])
+
+        # Restoring a snapshot that shares the page reports nothing.
+        memory.restore(memory.snapshot())
+        memory.write(0x2000, 4, 0)
+
+        self.assertEqual(len(changes), 3)
+
+        # Pages that are replaced are reported as a whole and are no
+        # longer watched.
+        memory.reset()
+
+        self.assertEqual(changes[3:], [(0x1000, 0x2000)])
+
+        memory.write(0x1000, 4, 0xdeadbeef)
+
+        self.assertEqual(len(changes), 4)
+
+    def test_checkpoint_rollback(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+
+        memory.write(0x1000, 4, 0xdeadbeef)
+
+        checkpoint_1 = memory.checkpoint()
+
+        memory.write(0x1002, 4, 0x12345678)
+
+        checkpoint_2 = memory.checkpoint()
+
+        memory.write(0x1000, 1, 0xff)
+        memory.read(0x8000, 2)
+
+        self.assertEqual(memory.diff(checkpoint_2), {
+            0x1000: (0xef, 0xff),
+            0x8000: (None, memory.read(0x8000, 1)),
+            0x8001: (None, memory.read(0x8001, 1)),
+        })
+
+        memory.rollback(checkpoint_2)
+
+        self.assertEqual(memory.read(0x1000, 4), 0x5678beef)
+        self.assertEqual(memory.try_read(0x8000, 1), (False, None))
+        self.assertEqual(memory.diff(checkpoint_1), {
+            0x1002: (0xad, 0x78),
+            0x1003: (0xde, 0x56),
+            0x1004: (None, 0x34),
+            0x1005: (None, 0x12),
+        })
+
+        memory.rollback(checkpoint_1)
+
+        self.assertEqual(memory.read(0x1000, 4), 0xdeadbeef)
+        self.assertEqual(memory.try_read(0x1004, 1), (False, None))
+        self.assertEqual(memory.try_read_prev(0x1002, 2), (False, None))
+        self.assertEqual(memory.get_write_count(), 1)
+
+        # Checkpoints are dropped when memory is reset.
+        memory.reset()
+
+        self.assertRaises(ValueError, memory.rollback, checkpoint_1)
+
+    def test_value_index(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size, value_index=True)
+        memory_ref = ReilMemoryEx(address_size)
+
+        memory.map(0x3000, b"\xef\xbe\xad\xde")
+        memory_ref.map(0x3000, b"\xef\xbe\xad\xde")
+
+        checkpoint = memory.checkpoint()
+
+        for mem in [memory, memory_ref]:
+            # Both memories get the same random bytes.
+            random.seed(0)
+
+            mem.write(0x1000, 4, 0xdeadbeef)
+            mem.write(0x1ffe, 4, 0xdeadbeef)
+            mem.write(0x1001, 2, 0xbeef)
+            mem.write(0x2001, 1, 0xef)
+            mem.read(0x4000, 8)
+
+        for value, size in [(0xdeadbeef, 4), (0xbeef, 2), (0xef, 1), (0x0, 1)]:
+            self.assertEqual(memory.read_inverse(value, size), memory_ref.read_inverse(value, size))
+
+        self.assertEqual(memory.read_inverse(0xdeadbeef, 4), [0x3000])
+
+        memory.rollback(checkpoint)
+
+        self.assertEqual(memory.read_inverse(0xdeadbeef, 4), [0x3000])
+        self.assertEqual(memory.read_inverse(0xef, 1), [0x3000])
+
+    def test_value_index_restore(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size, value_index=True)
+        memory_ref = ReilMemoryEx(address_size)
+
+        for mem in [memory, memory_ref]:
+            mem.write(0x1000, 4, 0xdeadbeef)
+
+        snapshot = memory.snapshot()
+        snapshot_ref = memory_ref.snapshot()
+
+        for mem in [memory, memory_ref]:
+            mem.write(0x1002, 4, 0xdeadbeef)
+            mem.write(0x8000, 4, 0xdeadbeef)
+            mem.map(0x5000, b"\xef\xbe\xad\xde" * 0x800)
+
+        for value, size in [(0xdeadbeef, 4), (0xbeef, 2), (0xef, 1)]:
+            self.assertEqual(memory.read_inverse(value, size), memory_ref.read_inverse(value, size))
+
+        self.assertEqual(len(memory.read_inverse(0xdeadbeef, 4)), 0x802)
+
+        memory.restore(snapshot)
+        memory_ref.restore(snapshot_ref)
+
+        for value, size in [(0xdeadbeef, 4), (0xbeef, 2), (0xef, 1)]:
+            self.assertEqual(memory.read_inverse(value, size), memory_ref.read_inverse(value, size))
+
+        self.assertEqual(memory.read_inverse(0xdeadbeef, 4), [0x1000])
+
+    def test_snapshot_restore(self):
+        address_size = 32
+        memory = ReilMemoryEx(address_size)
+
+        memory.write(0x1000, 4, 0xdeadbeef)
+
+        snapshot = memory.snapshot()
+
+        memory.write(0x1000, 4, 0xcafecafe)
+        memory.write(0x8000, 4, 0x12345678)
+
+        self.assertEqual(memory.get_write_count(), 3)
+
+        memory.restore(snapshot)
+
+        self.assertEqual(memory.read(0x1000, 4), 0xdeadbeef)
+        self.assertEqual(memory.try_read(0x8000, 4), (False, None))
+        self.assertEqual(memory.get_write_count(), 1)
+
+        # A snapshot can be restored more than once.
+        memory.write(0x1000, 4, 0x0)
+        memory.restore(snapshot)
+
+        self.assertEqual(memory.read(0x1000, 4), 0xdeadbeef)
+
+    def test_fork(self):
+        address_size = 32
+        memory = ReilMemory(address_size)
+
+        memory.write(0x1000, 4, 0xdeadbeef)
+
+        fork = memory.fork()
+
+        fork.write(0x1000, 4, 0xcafecafe)
+        memory.write(0x1004, 4, 0x12345678)
+
+        self.assertEqual(memory.read(0x1000, 4), 0xdeadbeef)
+        self.assertEqual(fork.read(0x1000, 4), 0xcafecafe)
+        self.assertEqual(memory.read(0x1004, 4), 0x12345678)
+        self.assertTrue(0x1004 not in fork._memory)
+
 
 def main():
     unittest.main()
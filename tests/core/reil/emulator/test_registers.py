@@ -0,0 +1,162 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import copy
+import unittest
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch import ARCH_X86_MODE_64
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.core.reil import ReilRegisterOperand
+from barf.core.reil.emulator import ReilCpu
+from barf.core.reil.emulator import ReilMemoryEx
+from barf.core.reil.emulator import ReilRegisterFile
+
+
+class ReilRegisterFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+    def test_dictionary_interface(self):
+        regs = ReilRegisterFile(self._arch_info)
+
+        regs["eax"] = 0x1
+        regs["t1"] = 0x2
+        regs["foo"] = 0x3
+
+        self.assertEqual(dict(regs), {"eax": 0x1, "t1": 0x2, "foo": 0x3})
+        self.assertEqual(len(regs), 3)
+        self.assertTrue("eax" in regs)
+        self.assertFalse("ebx" in regs)
+        self.assertRaises(KeyError, lambda: regs["ebx"])
+
+        del regs["eax"]
+
+        self.assertFalse("eax" in regs)
+        self.assertEqual(regs, {"t1": 0x2, "foo": 0x3})
+
+    def test_slots(self):
+        regs = ReilRegisterFile(self._arch_info)
+
+        regs["eax"] = 0x1
+
+        # Base registers have a slot, aliases and temporaries do not.
+        self.assertTrue("eax" in regs.slots)
+        self.assertFalse("al" in regs.slots)
+        self.assertFalse("t1" in regs.slots)
+
+        self.assertEqual(regs.values[regs.slots["eax"]], 0x1)
+
+    def test_reset_temporaries(self):
+        regs = ReilRegisterFile(self._arch_info)
+
+        regs["eax"] = 0x1
+        regs["t1"] = 0x2
+        regs["t2"] = 0x3
+
+        regs.reset_temporaries()
+
+        self.assertEqual(dict(regs), {"eax": 0x1})
+
+    def test_copy(self):
+        regs = ReilRegisterFile(self._arch_info)
+
+        regs["eax"] = 0x1
+        regs["t1"] = 0x2
+
+        regs_copy = copy.deepcopy(regs)
+
+        regs["eax"] = 0x3
+        regs["t1"] = 0x4
+
+        self.assertEqual(dict(regs_copy), {"eax": 0x1, "t1": 0x2})
+
+    def test_cpu_alias(self):
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_64)
+
+        cpu = ReilCpu(ReilMemoryEx(64), arch=arch_info)
+
+        cpu.registers = {"rax": 0x1122334455667788}
+
+        ah = ReilRegisterOperand("ah", 8)
+        eax = ReilRegisterOperand("eax", 32)
+
+        self.assertEqual(cpu.read_operand(ah), 0x77)
+
+        cpu.write_operand(ah, 0xff)
+
+        self.assertEqual(cpu.registers["rax"], 0x112233445566ff88)
+
+        cpu.write_operand(eax, 0xaabbccdd)
+
+        self.assertEqual(cpu.registers["rax"], 0x11223344aabbccdd)
+
+        self.assertEqual(cpu.read_registers, set(["ah"]))
+        self.assertEqual(cpu.written_registers, set(["ah", "eax"]))
+
+    def test_cpu_registers_setter(self):
+        cpu = ReilCpu(ReilMemoryEx(32), arch=self._arch_info)
+
+        regs = cpu.registers
+
+        cpu.registers = {"eax": 0x1, "t1": 0x2}
+
+        # The register file is updated in place.
+        self.assertTrue(cpu.registers is regs)
+        self.assertEqual(dict(cpu.registers), {"eax": 0x1, "t1": 0x2})
+
+    def test_snapshot_restore(self):
+        cpu = ReilCpu(ReilMemoryEx(32), arch=self._arch_info)
+
+        values = cpu.registers.values
+
+        cpu.write_operand(ReilRegisterOperand("eax", 32), 0x11223344)
+        cpu.registers["t0"] = 0x1
+
+        snapshot = cpu.snapshot()
+
+        cpu.write_operand(ReilRegisterOperand("ax", 16), 0xffff)
+        cpu.write_operand(ReilRegisterOperand("ebx", 32), 0x1)
+        cpu.registers["t0"] = 0x2
+
+        cpu.restore(snapshot)
+
+        self.assertEqual(cpu.registers["eax"], 0x11223344)
+        self.assertEqual(cpu.registers["t0"], 0x1)
+        self.assertTrue("ebx" not in cpu.registers)
+        self.assertEqual(cpu.written_registers, set(["eax"]))
+
+        # The register file is restored in place.
+        self.assertTrue(cpu.registers.values is values)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
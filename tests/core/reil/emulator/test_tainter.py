@@ -30,6 +30,7 @@ from barf.arch import ARCH_X86_MODE_32
 from barf.arch.x86 import X86ArchitectureInformation
 from barf.arch.x86.parser import X86Parser
 from barf.arch.x86.translator import X86Translator
+from barf.core.reil.container import ReilSequence
 from barf.core.reil.emulator import ReilEmulator
 
 
@@ -127,6 +128,65 @@ class ReilEmulatorTaintTests(unittest.TestCase):
 
         self.assertEqual(self._emulator.get_memory_taint(regs_initial['eax'], 4), False)
 
+    def test_store_mem_3(self):
+        asm_instrs  = self._asm_parser.parse("mov [eax], ebx")
+
+        self.__set_address(0xdeadbeef, [asm_instrs])
+
+        reil_instrs = self._translator.translate(asm_instrs)
+
+        regs_initial = {
+            "eax" : 0x10080,
+            "ebx" : 0x2,
+        }
+
+        # Taint a large buffer and overwrite part of it.
+        self._emulator.set_memory_taint(0x10000, 0x100000, True)
+
+        regs_final, _ = self._emulator.execute_lite(
+            reil_instrs,
+            context=regs_initial
+        )
+
+        self.assertEqual(self._emulator.get_memory_taint(0x10080, 4), False)
+        self.assertEqual(self._emulator.get_memory_taint(0x10080, 5), True)
+        self.assertEqual(self._emulator.get_memory_taint(0x10000, 0x80), True)
+        self.assertEqual(self._emulator.get_memory_taint(0x110000, 4), False)
+
+    def test_labels(self):
+        asm_instrs  = [self._asm_parser.parse("add eax, ebx")]
+        asm_instrs += [self._asm_parser.parse("mov [ecx], eax")]
+        asm_instrs += [self._asm_parser.parse("mov edx, [ecx + 2]")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        reil_instrs = []
+
+        for asm_instr in asm_instrs:
+            reil_instrs += self._translator.translate(asm_instr)
+
+        regs_initial = {
+            "eax" : 0x1,
+            "ebx" : 0x2,
+            "ecx" : 0x1000,
+        }
+
+        label_a = self._emulator.taint_label("a")
+        label_b = self._emulator.taint_label("b")
+        label_c = self._emulator.taint_label("c")
+
+        self._emulator.set_register_taint("eax", label_a)
+        self._emulator.set_register_taint("ebx", label_b)
+        self._emulator.set_memory_taint(0x1004, 2, label_c)
+
+        self._emulator.execute_lite(reil_instrs, context=regs_initial)
+
+        self.assertEqual(self._emulator.get_register_taint_mask("eax"), label_a | label_b)
+        self.assertEqual(self._emulator.get_memory_taint_mask(0x1000, 4), label_a | label_b)
+        self.assertEqual(self._emulator.taint_labels(self._emulator.get_register_taint_mask("edx")),
+                         frozenset(["a", "b", "c"]))
+        self.assertEqual(self._emulator.get_register_taint("edx"), True)
+
     def test_load_mem_1(self):
         asm_instrs  = self._asm_parser.parse("mov eax, [ebx]")
 
@@ -148,6 +208,61 @@ class ReilEmulatorTaintTests(unittest.TestCase):
 
         self.assertEqual(self._emulator.get_register_taint("eax"), True)
 
+    def test_summary(self):
+        asm_instrs  = [self._asm_parser.parse("add eax, ebx")]
+        asm_instrs += [self._asm_parser.parse("mov [ecx], eax")]
+        asm_instrs += [self._asm_parser.parse("push edx")]
+        asm_instrs += [self._asm_parser.parse("pop esi")]
+        asm_instrs += [self._asm_parser.parse("mov edi, [ecx + 2]")]
+        asm_instrs += [self._asm_parser.parse("xor ebx, ebx")]
+
+        self.__set_address(0xdeadbeef, asm_instrs)
+
+        sequences = []
+
+        for asm_instr in asm_instrs:
+            sequence = ReilSequence()
+
+            for reil_instr in self._translator.translate(asm_instr):
+                sequence.append(reil_instr)
+
+            sequences.append(sequence)
+
+        regs_initial = {
+            "eax" : 0x1,
+            "ebx" : 0x2,
+            "ecx" : 0x1000,
+            "edx" : 0x3,
+            "esp" : 0x2000,
+        }
+
+        results = []
+
+        for summaries in [False, True]:
+            emulator = ReilEmulator(self._arch_info)
+            emulator.taint_summaries = summaries
+            emulator.registers = dict(regs_initial)
+
+            emulator.set_register_taint("eax", emulator.taint_label("a"))
+            emulator.set_register_taint("ebx", emulator.taint_label("b"))
+            emulator.set_register_taint("edx", emulator.taint_label("c"))
+            emulator.set_memory_taint(0x1004, 2, emulator.taint_label("d"))
+
+            for sequence in sequences:
+                emulator.execute_sequence(sequence)
+
+            registers = ["eax", "ebx", "ecx", "edx", "esi", "edi", "esp", "cf", "zf"]
+
+            results.append(([emulator.get_register_taint_mask(reg) for reg in registers],
+                            [emulator.get_memory_taint_mask(addr, 1) for addr in range(0x0ff0, 0x2010)]))
+
+        self.assertEqual(results[0], results[1])
+
+        # Summaries are cached on the sequences, pop cannot be summarized
+        # (its address register is written after the load).
+        self.assertNotEqual(sequences[0].taint_summary, None)
+        self.assertEqual(sequences[3].taint_summary[1], None)
+
     def __set_address(self, address, asm_instrs):
         addr = address
 
@@ -0,0 +1,179 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import random
+import unittest
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch import ARCH_X86_MODE_64
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.arch.x86.parser import X86Parser
+from barf.arch.x86.translator import X86Translator
+from barf.core.reil.emulator import ReilCpuZeroDivisionError
+from barf.core.reil.emulator import ReilEmulator
+from barf.core.reil.emulator.vector import ReilVectorEmulator
+from barf.core.reil.emulator.vector import vector_emulator_available
+from barf.core.reil.parser import ReilParser
+
+
+@unittest.skipUnless(vector_emulator_available(), 'NumPy is not available')
+class ReilVectorEmulatorTests(unittest.TestCase):
+
+    def setUp(self):
+        self._reil_parser = ReilParser()
+
+    def test_add(self):
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        emulator = ReilVectorEmulator(arch_info)
+
+        instrs = self.__translate(ARCH_X86_MODE_32, ["add eax, ebx"])
+
+        results = emulator.execute_lite(instrs, [
+            {"eax": 0x1, "ebx": 0x2},
+            {"eax": 0xffffffff, "ebx": 0x1},
+        ])
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0][0]["eax"], 0x3)
+        self.assertEqual(results[1][0]["eax"], 0x0)
+        self.assertEqual(results[1][0]["ebx"], 0x1)
+
+        self.assertEqual(emulator.read_registers, set(["eax", "ebx"]))
+        self.assertEqual(emulator.written_registers, set(["eax"]))
+
+    def test_memory(self):
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        emulator = ReilVectorEmulator(arch_info)
+
+        instrs = self.__translate(ARCH_X86_MODE_32, ["mov dword ptr [ebx], eax"])
+
+        results = emulator.execute_lite(instrs, [
+            {"eax": 0x11223344, "ebx": 0x1000},
+            {"eax": 0x55667788, "ebx": 0x2000},
+        ])
+
+        # Each lane has its own memory.
+        self.assertEqual(results[0][1].read(0x1000, 4), 0x11223344)
+        self.assertEqual(results[1][1].read(0x2000, 4), 0x55667788)
+        self.assertEqual(results[0][1].try_read(0x2000, 4), (False, None))
+        self.assertEqual(results[1][1].get_write_count(), 1)
+
+    def test_zero_division(self):
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        emulator = ReilVectorEmulator(arch_info)
+
+        instrs = self._reil_parser.parse([
+            "div [DWORD eax, DWORD ebx, DWORD ecx]",
+        ])
+
+        results = emulator.execute_lite(instrs, [
+            {"eax": 0x10, "ebx": 0x0},
+            {"eax": 0x10, "ebx": 0x4},
+        ])
+
+        self.assertEqual(results[0], None)
+        self.assertTrue(isinstance(emulator.errors[0], ReilCpuZeroDivisionError))
+        self.assertEqual(results[1][0]["ecx"], 0x4)
+
+    def test_execute_lite_x86(self):
+        instrs = [
+            "add eax, ebx", "sbb ecx, edx", "imul ecx, ebx", "shl eax, cl",
+            "sar edx, cl", "movsx eax, bl", "mov al, bh", "neg ebx", "rol eax, 3",
+            "bswap eax", "cdq", "idiv ecx",
+        ]
+
+        self.__check_execute_lite(ARCH_X86_MODE_32, instrs)
+
+    def test_execute_lite_x86_64(self):
+        # Some of these instructions use operands wider than 64 bits.
+        instrs = [
+            "add rax, rbx", "mul rbx", "imul rbx", "shl rax, cl", "sar rdx, cl",
+            "shld rax, rbx, 4", "movsxd rax, ebx", "adc rax, rbx", "sbb rax, rbx",
+            "bswap rax", "div rcx", "pxor xmm0, xmm1",
+        ]
+
+        self.__check_execute_lite(ARCH_X86_MODE_64, instrs)
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __translate(self, arch_mode, instrs):
+        parser = X86Parser(arch_mode)
+        translator = X86Translator(arch_mode)
+
+        reil_instrs = []
+
+        for address, instr in enumerate(instrs):
+            asm_instr = parser.parse(instr)
+            asm_instr.address = 0x1000 + address
+            asm_instr.size = 1
+
+            reil_instrs += translator.translate(asm_instr)
+
+        return reil_instrs
+
+    def __check_execute_lite(self, arch_mode, instrs):
+        """Compare the results of the vector emulator and the REIL
+        emulator, one instruction at a time.
+        """
+        arch_info = X86ArchitectureInformation(arch_mode)
+
+        registers = [reg for reg in arch_info.registers_size if reg not in arch_info.alias_mapper]
+
+        for instr in instrs:
+            reil_instrs = self.__translate(arch_mode, [instr])
+
+            contexts = []
+
+            for _ in range(8):
+                contexts.append(dict((reg, random.getrandbits(arch_info.registers_size[reg])) for reg in registers))
+
+            contexts[0]["rcx" if arch_mode == ARCH_X86_MODE_64 else "ecx"] = 0x0
+
+            vector_emulator = ReilVectorEmulator(arch_info)
+
+            results = vector_emulator.execute_lite(reil_instrs, contexts)
+
+            for context, result in zip(contexts, results):
+                emulator = ReilEmulator(arch_info)
+
+                try:
+                    regs, _ = emulator.execute_lite(reil_instrs, context)
+                except Exception:
+                    self.assertEqual(result, None)
+                    continue
+
+                self.assertEqual(result[0], dict(regs), instr)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
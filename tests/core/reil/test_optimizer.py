@@ -0,0 +1,227 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import random
+import unittest
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.arch.x86.parser import X86Parser
+from barf.arch.x86.translator import X86Translator
+from barf.core.reil import ReilMnemonic
+from barf.core.reil.container import ReilContainer
+from barf.core.reil.container import ReilSequence
+from barf.core.reil.emulator import ReilEmulator
+from barf.core.reil.helpers import to_reil_address
+from barf.core.reil.optimizer import ReilConstantFolding
+from barf.core.reil.optimizer import ReilOptimizer
+from barf.core.reil.parser import ReilParser
+
+
+class ReilOptimizerTests(unittest.TestCase):
+
+    def setUp(self):
+        self._arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        self._optimizer = ReilOptimizer(self._arch_info)
+
+        self._reil_parser = ReilParser()
+        self._asm_parser = X86Parser(ARCH_X86_MODE_32)
+        self._translator = X86Translator(ARCH_X86_MODE_32)
+
+    def test_constant_folding(self):
+        instrs = self.__parse([
+            "str [DWORD 0x2, EMPTY, DWORD t0]",
+            "add [DWORD t0, DWORD 0x3, DWORD t1]",
+            "str [DWORD t1, EMPTY, DWORD eax]",
+        ])
+
+        instrs_opt = self._optimizer.optimize(instrs)
+
+        self.assertEqual([str(instr) for instr in instrs_opt], [
+            "str   [DWORD 0x5, EMPTY, DWORD eax]",
+        ])
+
+    def test_copy_propagation(self):
+        instrs = self.__parse([
+            "str [DWORD eax, EMPTY, DWORD t0]",
+            "str [DWORD ebx, EMPTY, DWORD t1]",
+            "add [DWORD t0, DWORD t1, DWORD t2]",
+            "str [DWORD t2, EMPTY, DWORD ecx]",
+        ])
+
+        instrs_opt = self._optimizer.optimize(instrs)
+
+        self.assertEqual([str(instr) for instr in instrs_opt], [
+            "add   [DWORD eax, DWORD ebx, DWORD ecx]",
+        ])
+
+    def test_copy_propagation_alias(self):
+        # The copy of eax is invalidated when al is written.
+        instrs = self.__parse([
+            "str [DWORD eax, EMPTY, DWORD t0]",
+            "str [BYTE 0x1, EMPTY, BYTE al]",
+            "str [DWORD t0, EMPTY, DWORD ecx]",
+        ])
+
+        instrs_opt = self._optimizer.optimize(instrs)
+
+        self.assertEqual(len(instrs_opt), 3)
+
+    def test_dead_temporaries(self):
+        instrs = self.__parse([
+            "and [DWORD eax, DWORD 0x1, DWORD t0]",
+            "div [DWORD eax, DWORD ecx, DWORD t1]",
+            "str [DWORD ebx, EMPTY, DWORD ecx]",
+        ])
+
+        instrs_opt = self._optimizer.optimize(instrs)
+
+        # The division is kept as it might raise an exception.
+        self.assertEqual([str(instr) for instr in instrs_opt], [
+            "div   [DWORD eax, DWORD ecx, DWORD t1]",
+            "str   [DWORD ebx, EMPTY, DWORD ecx]",
+        ])
+
+    def test_passes(self):
+        optimizer = ReilOptimizer(self._arch_info, passes=[ReilConstantFolding()])
+
+        instrs = self.__parse([
+            "str [DWORD 0x2, EMPTY, DWORD t0]",
+            "add [DWORD t0, DWORD 0x3, DWORD t1]",
+            "str [DWORD t1, EMPTY, DWORD eax]",
+        ])
+
+        instrs_opt = optimizer.optimize(instrs)
+
+        self.assertEqual([str(instr) for instr in instrs_opt], [
+            "str   [DWORD 0x2, EMPTY, DWORD t0]",
+            "str   [DWORD 0x5, EMPTY, DWORD t1]",
+            "str   [DWORD 0x5, EMPTY, DWORD eax]",
+        ])
+
+    def test_jcc_targets(self):
+        # Shifts by a register translate to intra-instruction branches.
+        instrs = self.__translate("shl eax, cl", 0x1000)
+        instrs_opt = self._optimizer.optimize(instrs)
+
+        self.assertTrue(len(instrs_opt) < len(instrs))
+
+        addresses = [instr.address for instr in instrs_opt]
+
+        self.assertEqual(addresses, [to_reil_address(0x1000, i) for i in range(len(instrs_opt))])
+
+        for instr in instrs_opt:
+            if instr.mnemonic == ReilMnemonic.JCC:
+                target = instr.operands[2].immediate
+
+                self.assertTrue(target in addresses or target == to_reil_address(0x1001))
+
+    def test_equivalence(self):
+        asm = [
+            "add eax, ebx",
+            "sub ecx, eax",
+            "imul ecx, ebx",
+            "shl eax, cl",
+            "sar edx, 2",
+            "cmovz eax, ebx",
+            "push eax",
+            "pop edi",
+            "xor ah, al",
+            "movsx edx, byte ptr [esi]",
+        ]
+
+        for text in asm:
+            instrs = self.__translate(text, 0x1000)
+            instrs_opt = self._optimizer.optimize(instrs)
+
+            for _ in range(10):
+                regs = {reg: random.getrandbits(32) for reg in self._arch_info.registers_gp_base}
+                regs["eflags"] = random.getrandbits(32)
+                regs["ecx"] = random.randint(0, 3)
+                regs["esi"] = 0x2000
+                regs["esp"] = 0x3000
+
+                seed = random.random()
+
+                self.assertEqual(self.__execute(instrs, regs, seed), self.__execute(instrs_opt, regs, seed))
+
+    def test_optimize_sequence(self):
+        sequence = ReilSequence()
+
+        for instr in self.__translate("add eax, ebx", 0x1000):
+            sequence.append(instr)
+
+        sequence.next_sequence_address = to_reil_address(0x1001)
+
+        sequence_opt = self._optimizer.optimize_sequence(sequence)
+
+        self.assertTrue(len(sequence_opt) < len(sequence))
+        self.assertEqual(sequence_opt.address, sequence.address)
+        self.assertEqual(sequence_opt.next_sequence_address, to_reil_address(0x1001))
+
+    # Auxiliary methods
+    # ======================================================================== #
+    def __parse(self, instrs):
+        return self._reil_parser.parse(instrs)
+
+    def __translate(self, text, address):
+        asm_instr = self._asm_parser.parse(text)
+        asm_instr.address = address
+        asm_instr.size = 1
+
+        return self._translator.translate(asm_instr)
+
+    def __execute(self, instrs, regs, seed):
+        emulator = ReilEmulator(self._arch_info)
+
+        for addr in range(0x1ff0, 0x2010):
+            emulator.write_memory(addr, 1, addr & 0xff)
+
+        container = ReilContainer()
+        sequence = ReilSequence()
+
+        for instr in instrs:
+            sequence.append(instr)
+
+        container.add(sequence)
+
+        # Undefined flags are set to random values.
+        random.seed(seed)
+
+        regs_final, memory = emulator.execute(container, start=instrs[0].address, registers=regs)
+
+        regs_final = {name: value for name, value in regs_final.items() if not name.startswith("t")}
+
+        return regs_final, memory.read(0x2ffc, 4)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
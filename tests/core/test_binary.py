@@ -0,0 +1,154 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from barf.arch import ARCH_X86
+from barf.arch import ARCH_X86_MODE_32
+from barf.core.binary import BinaryFile
+from barf.core.binary import InvalidAddressError
+from barf.core.binary import Memory
+from barf.core.binary import load_image
+from barf.core.symbols import load_symbols
+
+
+def get_full_path(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+class MemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = Memory()
+
+        # VMAs are not added in order.
+        self.memory.add_vma(0x2000, b"\x02\x03\x04\x05")
+        self.memory.add_vma(0x1000, bytearray(b"\x00\x01"))
+        self.memory.add_vma(0x2004, b"\x06\x07")
+
+    def test_read_byte(self):
+        self.assertEqual(self.memory[0x1001], 0x01)
+        self.assertEqual(self.memory[0x2000], 0x02)
+        self.assertEqual(self.memory[0x2005], 0x07)
+
+        with self.assertRaises(IndexError):
+            self.memory[0x1002]
+
+        with self.assertRaises(IndexError):
+            self.memory[0x0fff]
+
+    def test_read_slice(self):
+        # Within one VMA.
+        self.assertEqual(self.memory[0x2001:0x2003], b"\x03\x04")
+
+        # Across consecutive VMAs.
+        self.assertEqual(self.memory[0x2002:0x2006], b"\x04\x05\x06\x07")
+
+        self.assertEqual(self.memory[0x2000:0x2006:2], b"\x02\x04\x06")
+
+        # Across a gap.
+        with self.assertRaises(InvalidAddressError):
+            self.memory[0x1001:0x1003]
+
+        with self.assertRaises(InvalidAddressError):
+            self.memory[0x2004:0x2007]
+
+    def test_addresses(self):
+        self.assertEqual(self.memory.start, 0x1000)
+        self.assertEqual(self.memory.end, 0x2006)
+        self.assertEqual(list(self.memory), [0x1000, 0x1001] + list(range(0x2000, 0x2006)))
+
+
+class BinaryImageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = get_full_path("../arch/samples/bin/loop-simple.x86")
+
+    def test_load_image(self):
+        image = load_image(self.filename)
+
+        self.assertEqual(image.file_format, "elf")
+        self.assertEqual(image.architecture, ARCH_X86)
+        self.assertEqual(image.architecture_mode, ARCH_X86_MODE_32)
+        self.assertEqual(image.entry_point, 0x80482e0)
+
+        text = image.section(".text")
+
+        self.assertEqual((text.address, text.size, len(text.data)), (0x80482e0, 402, 402))
+
+        # Sections without content in the file.
+        bss = image.section(".bss")
+
+        self.assertEqual((bss.size, len(bss.data)), (4, 0))
+
+        self.assertEqual(image.section(".foo"), None)
+
+        # Only PT_LOAD segments.
+        segments = [(segment.address, segment.size, len(segment.data)) for segment in image.segments]
+
+        self.assertEqual(segments, [(0x8048000, 1404, 1404), (0x8049f08, 276, 272)])
+
+        self.assertEqual(image.symbols[0x80483db], ("main", 45, True))
+
+    def test_shared_image(self):
+        image = load_image(self.filename)
+
+        binary = BinaryFile(self.filename)
+
+        self.assertTrue(binary.image is image)
+        self.assertTrue(load_image(os.path.relpath(self.filename)) is image)
+        self.assertEqual(load_symbols(self.filename), image.symbols)
+
+        self.assertEqual(binary.text_section[0x80483db:0x80483df], image.data[0x3db:0x3df].tobytes())
+
+    def test_modified_file(self):
+        tmp_dir = tempfile.mkdtemp()
+
+        try:
+            filename = os.path.join(tmp_dir, "loop-simple.x86")
+
+            shutil.copy(self.filename, filename)
+
+            image = load_image(filename)
+
+            # Append data to the file, so the size changes.
+            with open(filename, "ab") as f:
+                f.write(b"\x00" * 16)
+
+            self.assertFalse(load_image(filename) is image)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.barf import BARF
+
+
+def get_full_path(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+class BARFTests(unittest.TestCase):
+
+    def setUp(self):
+        self.barf = BARF(get_full_path("./arch/samples/bin/loop-simple.x86"))
+
+    def test_lazy_modules(self):
+        # 80483db:  push ebp
+        # 80483dc:  mov  ebp, esp
+        # 80483de:  sub  esp, 0x10
+        asm = [str(instr) for _, instr, _ in self.barf.disassemble(0x080483db, 0x80483e1)]
+
+        self.assertEqual(asm, ["push ebp", "mov ebp, esp", "sub esp, 0x10"])
+
+        # Disassembling does not create the emulator nor the SMT solver.
+        components = self.barf._BARF__components
+
+        self.assertFalse("emulator" in components)
+        self.assertFalse("smt_solver" in components)
+
+        # The binary is loaded when the emulator is created.
+        self.assertEqual(self.barf.ir_emulator.read_memory(0x080483db, 1), 0x55)
+        self.assertTrue(self.barf.emulator.ir_emulator is self.barf.ir_emulator)
+        self.assertFalse("smt_solver" in components)
+
+    def test_shared_arch_info(self):
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+
+        self.assertTrue(arch_info.alias_mapper is self.barf.arch_info.alias_mapper)
+        self.assertTrue(arch_info.registers_size is self.barf.arch_info.registers_size)
+
+    def test_emulate_many(self):
+        # 80483f9:  mov  eax, DWORD PTR [ebp-0xc]
+        # 80483fc:  cmp  eax, DWORD PTR [ebp-0x4]
+        # 80483ff:  jb   80483f1 <main+0x16>
+        # 8048401:  mov  eax, 0x0
+        def context(count):
+            return {
+                'registers': {
+                    'ebp': 0x2000,
+                },
+                'memory': {
+                    0x2000 - 0x4: count,
+                    0x2000 - 0x8: 0,
+                    0x2000 - 0xc: 0,
+                },
+            }
+
+        contexts = [context(i) for i in range(1, 20)]
+
+        # Invalid memory value.
+        contexts[5]['memory'][0x3000] = "invalid"
+
+        for processes in [1, 2]:
+            results = list(self.barf.emulate_many(contexts, start=0x080483f9, end=0x8048401, processes=processes))
+
+            self.assertEqual(len(results), len(contexts))
+
+            for i, (context_out, error) in enumerate(results):
+                if i == 5:
+                    self.assertEqual(context_out, None)
+                    self.assertTrue("TypeError" in error)
+                else:
+                    self.assertEqual(error, None)
+                    self.assertEqual(context_out['registers']['eax'], i + 1)
+
+        # The emulator state is not modified.
+        self.assertFalse('ebp' in self.barf.ir_emulator.registers)
+
+    @unittest.skipIf(sys.version_info < (3, 7) or not hasattr(os, "fork"), "Process pool not available")
+    def test_emulate_many_dead_worker(self):
+        def context(count):
+            return {
+                'registers': {
+                    'ebp': 0x2000,
+                },
+                'memory': {
+                    0x2000 - 0x4: count,
+                    0x2000 - 0x8: 0,
+                    0x2000 - 0xc: 0,
+                },
+            }
+
+        # Kill the worker process that emulates the fourth context.
+        def hook(emulator, param):
+            if emulator.read_memory(0x2000 - 0x4, 4) == 4:
+                os._exit(1)
+
+        hooks = {0x080483f9: (hook, None, False, 0)}
+
+        contexts = [context(i) for i in range(1, 10)]
+
+        results = list(self.barf.emulate_many(contexts, start=0x080483f9, end=0x8048401, hooks=hooks, processes=2,
+                                              chunksize=2))
+
+        self.assertEqual(len(results), len(contexts))
+
+        for i, (context_out, error) in enumerate(results):
+            if i == 3:
+                self.assertEqual(context_out, None)
+                self.assertTrue("BrokenProcessPool" in error)
+            else:
+                self.assertEqual(error, None)
+                self.assertEqual(context_out['registers']['eax'], i + 1)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
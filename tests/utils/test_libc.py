@@ -0,0 +1,157 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import unittest
+
+from barf.arch import ARCH_ARM_MODE_ARM
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch import ARCH_X86_MODE_64
+from barf.arch.arm import ArmArchitectureInformation
+from barf.arch.arm.disassembler import ArmDisassembler
+from barf.arch.arm.translator import ArmTranslator
+from barf.arch.emulator import Emulator
+from barf.arch.x86 import X86ArchitectureInformation
+from barf.arch.x86.disassembler import X86Disassembler
+from barf.arch.x86.translator import X86Translator
+from barf.core.reil.emulator.emulator import ReilEmulator
+from barf.utils.libc import LIBC_HEAP_ADDRESS
+from barf.utils.libc import LibcModels
+from barf.utils.utils import write_c_string
+
+
+SYMBOLS = {
+    0x2000: ("memcpy", 0, True),
+    0x2100: ("memset", 0, True),
+    0x2200: ("strlen", 0, True),
+    0x2300: ("strcmp", 0, True),
+    0x2400: ("malloc", 0, True),
+    0x2500: ("__strlen_sse2", 0, True),
+    0x2600: ("puts", 0, True),
+}
+
+
+class LibcModelsTests(unittest.TestCase):
+
+    def test_x86(self):
+        # 0x1000: push 0x20
+        # 0x1002: push 0x3000
+        # 0x1007: push 0x4000
+        # 0x100c: call 0x2000      ; memcpy(0x4000, 0x3000, 0x20)
+        # 0x1011: add esp, 0xc
+        # 0x1014: push 0x3000
+        # 0x1019: call 0x2200      ; strlen(0x3000)
+        # 0x101e: add esp, 0x4
+        code = bytearray(b"\x6a\x20\x68\x00\x30\x00\x00\x68\x00\x40\x00\x00\xe8\xef\x0f\x00\x00"
+                         b"\x83\xc4\x0c\x68\x00\x30\x00\x00\xe8\xe2\x11\x00\x00\x83\xc4\x04")
+
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_32)
+        ir_emulator = ReilEmulator(arch_info)
+        emu = Emulator(arch_info, ir_emulator, X86Translator(ARCH_X86_MODE_32), X86Disassembler(ARCH_X86_MODE_32))
+
+        for i, b in enumerate(code):
+            emu.write_memory(0x1000 + i, 1, b)
+
+        write_c_string(ir_emulator, 0x3000, "Hello, world!")
+
+        ir_emulator.registers["esp"] = 0x8000
+        ir_emulator.set_memory_taint(0x3004, 1, True)
+
+        hooks = LibcModels(emu).hooks(SYMBOLS)
+
+        self.assertEqual(sorted(hooks), [0x2000, 0x2100, 0x2200, 0x2300, 0x2400])
+
+        emu.emulate(0x1000, 0x1000 + len(code), hooks, None, False)
+
+        self.assertEqual(ir_emulator.memory.read_bytes(0x4000, 14), b"Hello, world!\x00")
+        self.assertEqual(ir_emulator.registers["eax"], 13)
+        self.assertEqual(ir_emulator.registers["esp"], 0x8000)
+
+        # Taint is propagated.
+        self.assertEqual(ir_emulator.get_memory_taint(0x4004, 1), True)
+        self.assertEqual(ir_emulator.get_memory_taint(0x4005, 1), False)
+        self.assertEqual(ir_emulator.get_register_taint("eax"), True)
+
+    def test_x86_64(self):
+        arch_info = X86ArchitectureInformation(ARCH_X86_MODE_64)
+        ir_emulator = ReilEmulator(arch_info)
+        emu = Emulator(arch_info, ir_emulator, X86Translator(ARCH_X86_MODE_64), X86Disassembler(ARCH_X86_MODE_64))
+
+        libc = LibcModels(emu)
+        hooks = libc.hooks(SYMBOLS, names={"__strlen_sse2": "strlen"})
+
+        def call(address, *args):
+            # Call a function as if from 0x1000 (and stop there).
+            for reg, value in zip(["rdi", "rsi", "rdx"], args):
+                ir_emulator.registers[reg] = value
+
+            ir_emulator.registers["rsp"] = 0x8000
+            ir_emulator.write_memory(0x8000, 8, 0x1000)
+
+            emu.emulate(address, 0x1000, hooks, None, False)
+
+            self.assertEqual(ir_emulator.registers["rsp"], 0x8008)
+
+            return ir_emulator.registers["rax"]
+
+        buffer = call(0x2400, 0x40)
+
+        self.assertEqual(buffer, LIBC_HEAP_ADDRESS)
+        self.assertEqual(call(0x2400, 0x10), LIBC_HEAP_ADDRESS + 0x40)
+
+        self.assertEqual(call(0x2100, buffer, 0x41, 0x3f), buffer)
+        ir_emulator.write_memory(buffer + 0x3f, 1, 0)
+
+        self.assertEqual(call(0x2500, buffer + 1), 0x3e)
+
+        write_c_string(ir_emulator, 0x3000, "AAAB")
+
+        self.assertEqual(call(0x2300, buffer + 0x3b, 0x3000), 0xffffffffffffffff)
+        self.assertEqual(call(0x2300, 0x3000, buffer + 0x3b), 1)
+        self.assertEqual(call(0x2300, buffer + 0x3c, buffer + 0x3c), 0)
+
+    def test_arm(self):
+        arch_info = ArmArchitectureInformation(ARCH_ARM_MODE_ARM)
+        ir_emulator = ReilEmulator(arch_info)
+        emu = Emulator(arch_info, ir_emulator, ArmTranslator(ARCH_ARM_MODE_ARM), ArmDisassembler(ARCH_ARM_MODE_ARM))
+
+        hooks = LibcModels(emu).hooks(SYMBOLS)
+
+        write_c_string(ir_emulator, 0x3000, "Hello")
+
+        ir_emulator.registers["r0"] = 0x3002
+        ir_emulator.registers["r14"] = 0x1000
+
+        emu.emulate(0x2200, 0x1000, hooks, None, False)
+
+        self.assertEqual(ir_emulator.registers["r0"], 3)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
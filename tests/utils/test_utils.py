@@ -0,0 +1,92 @@
+# Copyright (c) 2014, Fundacion Dr. Manuel Sadosky
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import absolute_import
+
+import unittest
+
+from barf.arch import ARCH_X86_MODE_32
+from barf.arch.x86.disassembler import X86Disassembler
+from barf.utils.utils import ExecutionCache
+from barf.utils.utils import InvalidAddressError
+
+
+class ExecutionCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self._disassembler = X86Disassembler(ARCH_X86_MODE_32)
+
+    def __add(self, cache, address):
+        # nop
+        instruction = self._disassembler.disassemble(b"\x90", address)
+
+        return cache.add(address, instruction, [])
+
+    def test_invalidate(self):
+        cache = ExecutionCache()
+
+        entries = [self.__add(cache, 0x1000 + i) for i in range(3)]
+
+        cache.link(entries[0], 0x1001, entries[1])
+        cache.link(entries[1], 0x1002, entries[2])
+
+        cache.invalidate(0x1002, 0x1003)
+
+        # Only the links to the dropped entries are dropped.
+        self.assertEqual(cache.get(0x1002), None)
+        self.assertEqual(entries[0].successors, {0x1001: entries[1]})
+        self.assertEqual(entries[1].successors, {})
+
+    def test_invalidate_blocks(self):
+        cache = ExecutionCache()
+
+        blocks = [(None, 1, 0x1001 + i, ([0x1000 + i], None), {}) for i in range(3)]
+
+        for i, block in enumerate(blocks):
+            cache.add_block(0x1000 + i, block, 0x1001 + i)
+
+        cache.link_block(blocks[0], 0x1001, blocks[1])
+        cache.link_block(blocks[1], 0x1002, blocks[2])
+
+        # No block could be compiled at 0x2000.
+        cache.add_block(0x2000, None)
+
+        self.assertEqual(cache.retrieve_block(0x2000), None)
+
+        cache.invalidate(0x1002, 0x1003)
+
+        self.assertEqual(blocks[0][-1], {0x1001: blocks[1]})
+        self.assertEqual(blocks[1][-1], {})
+
+        # Failed blocks are not indexed by the bytes they were built from,
+        # they are retried once code changes.
+        self.assertRaises(InvalidAddressError, cache.retrieve_block, 0x2000)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()